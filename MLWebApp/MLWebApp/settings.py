@@ -188,6 +188,88 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 '''
 
 
+# Recommendation engine
+# 'numpy' runs the trained network with recommendations/numpy_engine.py and keeps TensorFlow
+# out of the web workers, 'keras' loads the full Keras model
+RECOMMENDER_BACKEND = os.getenv('RECOMMENDER_BACKEND', 'numpy')
+
+# Directory of the memory mapped catalog feature snapshot shared by all workers on a box,
+# `python manage.py build_catalog_snapshot` writes it. None reads the catalog from the ORM.
+RECOMMENDER_CATALOG_SNAPSHOT_DIR = os.getenv('RECOMMENDER_CATALOG_SNAPSHOT_DIR')
+
+# Don't keep the catalog in the web workers: each request loads its candidate movies
+# with one indexed query on Movie.genre_mask and scores them with the full network.
+# Uses far less memory per worker, costs a query and more model work per request.
+RECOMMENDER_LOW_MEMORY_CATALOG = False
+
+# How often (seconds) workers check the CatalogChange log for edited movies and patch
+# them in, None never checks. More changed movies than the patch limit reload everything.
+RECOMMENDER_CATALOG_REFRESH_SECONDS = 5
+RECOMMENDER_CATALOG_PATCH_LIMIT = 1000
+# Changes are read again for this long, a transaction that commits later than changes
+# with higher ids (PostgreSQL) is still picked up if it took less than this
+RECOMMENDER_CATALOG_CHANGE_OVERLAP_SECONDS = 60
+
+# Precompute the movie side of the network for the whole catalog when the model loads,
+# requests then only run the preference net and the joint heads
+RECOMMENDER_PRECOMPUTE_MOVIE_FEATURES = True
+
+# Filtered candidates and model scores are cached per preference signature (LRU, entries).
+# Set a path to keep the cache on disk, `python manage.py warm_score_cache` fills it.
+RECOMMENDER_SCORE_CACHE_SIZE = 128
+RECOMMENDER_SCORE_CACHE_PATH = None
+
+# Collect scoring requests from concurrent threads for up to RECOMMENDER_BATCH_MAX_WAIT_MS
+# and run them as one model call of at most RECOMMENDER_BATCH_MAX_ROWS candidates.
+# Worth it on threaded workers under load, adds up to the wait time to a lone request.
+RECOMMENDER_MICRO_BATCHING = False
+RECOMMENDER_BATCH_MAX_WAIT_MS = 5
+RECOMMENDER_BATCH_MAX_ROWS = 100_000
+
+# Save the preference and a pending recommendation in the engine POST and let
+# `python manage.py run_recommendation_worker` generate it, the detail page waits for it
+RECOMMENDER_BACKGROUND_JOBS = False
+
+# Threads the async engine view (engine/async) scores on, per process. Requests beyond
+# that wait in the executor's queue instead of blocking the event loop.
+RECOMMENDER_SCORING_THREADS = 4
+
+# Path of the Unix socket of `python manage.py run_inference_server`. When set, web workers
+# send requests to that one process instead of each loading the model and catalog, and
+# fall back to scoring in process if it is down.
+RECOMMENDER_INFERENCE_SOCKET = os.getenv('RECOMMENDER_INFERENCE_SOCKET')
+RECOMMENDER_INFERENCE_POOL_SIZE = 4
+RECOMMENDER_INFERENCE_TIMEOUT = 2.0
+
+# Rendered movie lists of saved recommendations, for the detail and list pages (seconds).
+# They are removed when a recommendation is deleted or gets feedback, any movie change moves
+# them all to new keys.
+RECOMMENDER_FRAGMENT_CACHE_SECONDS = 24 * 3600
+
+# Local memory is per process. Movie edits still reach every worker through the catalog
+# version in the fragment keys, but feedback and deletes only drop the fragments of the
+# worker that handled them. Set DJANGO_CACHE_DIR to share a file based cache between
+# the workers of a box.
+if os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mlwebapp',
+        }
+    }
+
+
+# `import_movies <MovieLens zip>` keeps the rating stats of each archive here, so importing
+# the same archive again (e.g. into a fresh test database) skips the ratings scan
+MOVIELENS_CACHE_DIR = BASE_DIR / 'movielens_cache'
+
 LOGIN_URL = '/user/login/'
 
 LOGIN_REDIRECT_URL = '/user/'
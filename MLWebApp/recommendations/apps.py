@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecommendationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommendations'
+
+    def ready(self):
+        # Log Movie changes for the running recommenders
+        from recommendations import signals  # noqa: F401
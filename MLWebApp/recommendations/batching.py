@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import deque
+
+
+class ScoringRequest:
+    """One caller waiting for the model scores of its candidate rows"""
+
+    def __init__(self, genre_preferences, rows):
+        self.genre_preferences = genre_preferences
+        self.rows = rows
+        self.enqueued_at = time.perf_counter()
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Collects scoring requests from concurrent threads for up to max_wait_ms and runs
+    them as one model call.
+
+    score_batch takes a list of ScoringRequest and returns one score array per request,
+    in order. A batch is sent as soon as it holds max_batch_rows candidate rows or the
+    oldest request has waited max_wait_ms. A single request larger than max_batch_rows
+    still goes through, on its own.
+    """
+
+    def __init__(self, score_batch, max_wait_ms=5, max_batch_rows=100_000):
+        self.score_batch = score_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_rows = max_batch_rows
+
+        self._queue = deque()
+        self._queued_rows = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+        # Stats
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.max_batch_requests = 0
+        self.max_queue_depth = 0
+
+    def score(self, genre_preferences, rows, timeout=None):
+        request = ScoringRequest(genre_preferences, rows)
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._start()
+                self._queue.append(request)
+                self._queued_rows += len(rows)
+                self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+                self._condition.notify()
+
+        if closed:
+            # The handle was replaced while this request was using it, score it on its own
+            return self.score_batch([request])[0]
+
+        if not request.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a scoring batch")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self.max_queue_depth,
+                'batches': self.batches,
+                'requests': self.requests,
+                'rows': self.rows,
+                'mean_batch_requests': self.requests / self.batches if self.batches else 0,
+                'mean_batch_rows': self.rows / self.batches if self.batches else 0,
+                'max_batch_requests': self.max_batch_requests,
+                'max_wait_ms': self.max_wait * 1000,
+                'max_batch_rows': self.max_batch_rows,
+            }
+
+    def _start(self):
+        # Called with the condition held, the worker thread starts with the first request
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='recommendation-batcher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if not self._queue:
+                return None
+
+            # Give other requests a chance to join until the oldest one has waited long enough
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while self._queued_rows < self.max_batch_rows and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = [self._queue.popleft()]
+            batch_rows = len(batch[0].rows)
+            while self._queue and batch_rows + len(self._queue[0].rows) <= self.max_batch_rows:
+                request = self._queue.popleft()
+                batch.append(request)
+                batch_rows += len(request.rows)
+            self._queued_rows -= batch_rows
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.rows += batch_rows
+            self.max_batch_requests = max(self.max_batch_requests, len(batch))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                results = self.score_batch(batch)
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
@@ -0,0 +1,129 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Characters used for the -1, 0 and 1 entries of a preference vector in its signature
+SIGNATURE_CHARS = {-1: '-', 0: '.', 1: '+'}
+
+
+def preference_signature(genre_preferences):
+    """
+    Canonical key for a preference vector.
+
+    prepare_genre_preferences() only produces -1/0/1 per genre, so one character per
+    genre describes the input completely, e.g. '+..............+...' for Action + Sci-Fi
+    with other genres included.
+    """
+    return ''.join(SIGNATURE_CHARS[int(value)] for value in genre_preferences)
+
+
+def signature_preferences(signature):
+    """Inverse of preference_signature()"""
+    values = {char: value for value, char in SIGNATURE_CHARS.items()}
+    return np.array([values[char] for char in signature], dtype=np.float32)
+
+
+# Deterministic part of a recommendation: which catalog rows passed the genre filters
+# and the raw model score of each of them
+class ScoredCandidates:
+    def __init__(self, rows, scores):
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+# ScoredCandidates plus everything else the sampling stage needs that doesn't change
+# between requests, so a cached pool can be re-sampled without touching the catalog
+class CandidatePool(ScoredCandidates):
+    def __init__(self, rows, scores, normalized_scores, weighted_rating):
+        super().__init__(rows, scores)
+        # Model scores scaled to 0..1 within the pool
+        self.normalized_scores = normalized_scores
+        # Rating weighted by rating count, relative to the most rated candidate
+        self.weighted_rating = weighted_rating
+
+
+class ScoreCache:
+    """
+    Bounded LRU cache of ScoredCandidates (usually CandidatePool) keyed on preference signature.
+
+    Entries are only valid for one model and catalog, the owner passes that as
+    version. When path is set the cache can be written to and read back from
+    an .npz file so workers start warm.
+    """
+
+    def __init__(self, max_entries=128, path=None, version=''):
+        self.max_entries = max_entries
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return False
+
+        with self._lock:
+            arrays = {'__version__': np.array(self.version)}
+            # Oldest first so loading restores the LRU order
+            for key, entry in self._entries.items():
+                arrays[f"{key}__rows"] = entry.rows
+                arrays[f"{key}__scores"] = entry.scores
+
+        # Write next to the target and swap it in so readers never see half a file
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return True
+
+    def load(self, path=None):
+        """Read entries saved by save(), ignored if they were made for another version"""
+        path = path or self.path
+        if not path or not os.path.exists(path):
+            return 0
+
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['__version__']) != self.version:
+                print(f"Score cache at {path} is for another model or catalog, ignoring it")
+                return 0
+            keys = [name[:-len('__rows')] for name in data.files if name.endswith('__rows')]
+            for key in keys:
+                self.put(key, ScoredCandidates(data[f"{key}__rows"], data[f"{key}__scores"]))
+        return len(keys)
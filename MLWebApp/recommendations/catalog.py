@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from recommendations.models import CatalogChange, Movie
+from recommendations.utils import CATALOG_FIELDS, GENRE_CHOICES, add_catalog_features, genre_one_hots
+
+# Model inputs of the movie towers, a row whose values change has to be run again
+TOWER_INPUTS = GENRE_CHOICES + ['year_normalized', 'popularity']
+
+
+class CatalogChangeLog:
+    """
+    Reads the CatalogChange log and the current values of changed movies.
+
+    Ids are handed out when a change is inserted, not when its transaction commits, so on
+    PostgreSQL a slow transaction can commit a change below ids that were already read.
+    Changes of the last RECOMMENDER_CATALOG_CHANGE_OVERLAP_SECONDS are read again and
+    returned if they weren't seen before.
+    """
+
+    def latest(self):
+        return CatalogChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+    def overlap_start(self):
+        return timezone.now() - timedelta(seconds=getattr(settings, 'RECOMMENDER_CATALOG_CHANGE_OVERLAP_SECONDS', 60))
+
+    def recent(self):
+        """Ids of the changes inside the overlap window"""
+        return set(CatalogChange.objects.filter(changed_at__gte=self.overlap_start()).values_list('id', flat=True))
+
+    def since(self, version, seen=frozenset()):
+        """
+        (id, movie_id) of every change after version and of the recent ones that aren't in
+        seen, oldest first
+        """
+        changes = CatalogChange.objects.filter(
+            Q(id__gt=version) | Q(changed_at__gte=self.overlap_start())
+        ).order_by('id').values_list('id', 'movie_id')
+        return [(change_id, movie_id) for change_id, movie_id in changes if change_id not in seen]
+
+    def movies(self, movie_ids):
+        return pd.DataFrame(
+            list(Movie.objects.filter(movie_id__in=movie_ids).values(*CATALOG_FIELDS)),
+            columns=CATALOG_FIELDS
+        )
+
+
+class CatalogPatch:
+    def __init__(self, movies_df, source_rows, changed_rows, dirty_rows):
+        self.movies_df = movies_df
+        # Old row of every row of movies_df, -1 for added movies
+        self.source_rows = source_rows
+        # Rows that were edited or added
+        self.changed_rows = changed_rows
+        # Rows whose tower inputs differ from before, a superset of changed_rows. Every row
+        # when the year range or the highest rating count moved.
+        self.dirty_rows = dirty_rows
+
+
+def patch_catalog(movies_df, updated, deleted_ids):
+    """
+    Apply changed movies to a catalog frame without rebuilding it from the database.
+
+    updated has the Movie fields of edited and added movies, deleted_ids lists removed
+    ones. Edited movies keep their row, added ones are appended. Only the changed rows
+    are one-hot encoded again, the features that depend on the whole catalog are
+    recomputed for every row so they stay consistent with a full reload.
+    """
+    old_rows = pd.Index(movies_df['movie_id'])
+    kept_rows = np.flatnonzero(~old_rows.isin(list(deleted_ids)))
+    positions = old_rows.get_indexer(updated['movie_id'])
+    edited = updated[positions >= 0]
+    added = updated[positions < 0]
+
+    patched = movies_df.take(kept_rows).reset_index(drop=True)
+    new_positions = np.full(len(movies_df), -1)
+    new_positions[kept_rows] = np.arange(len(kept_rows))
+
+    edited_rows = new_positions[positions[positions >= 0]]
+    if len(edited):
+        for field in CATALOG_FIELDS:
+            patched.loc[edited_rows, field] = edited[field].to_numpy()
+        patched.loc[edited_rows, GENRE_CHOICES] = genre_one_hots(edited['genres']).to_numpy()
+
+    if len(added):
+        added = pd.concat([
+            added.reset_index(drop=True),
+            genre_one_hots(added['genres']).reset_index(drop=True)
+        ], axis=1)
+        patched = pd.concat([patched, added], ignore_index=True)
+
+    add_catalog_features(patched)
+
+    source_rows = np.concatenate([kept_rows, np.full(len(added), -1)])
+    changed_rows = np.concatenate([edited_rows, np.arange(len(kept_rows), len(patched))]).astype(np.int64)
+
+    # Kept rows whose genres, year_normalized or popularity moved
+    before = movies_df[TOWER_INPUTS].to_numpy(dtype=np.float32)[kept_rows]
+    after = patched[TOWER_INPUTS].to_numpy(dtype=np.float32)[:len(kept_rows)]
+    moved = np.flatnonzero((after != before).any(axis=1))
+    dirty_rows = np.union1d(changed_rows, moved).astype(np.int64)
+
+    return CatalogPatch(patched, source_rows, changed_rows, dirty_rows)
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+
+
+def scoring_executor():
+    """
+    Thread pool the async views score on, created on first use. Its size bounds how many
+    recommendations are computed at once per process, further requests queue up.
+    NumPy (and TensorFlow) release the GIL while they compute, so threads share a
+    single copy of the model and still run in parallel.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'RECOMMENDER_SCORING_THREADS', 4),
+                    thread_name_prefix='recommendation-scoring',
+                )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Model loads and catalog refreshes query the database from these threads,
+        # close their connections like Django does at the end of a request
+        close_old_connections()
+
+
+async def run_scoring(func, *args, **kwargs):
+    """Run a blocking scoring call on the scoring executor without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(scoring_executor(), functools.partial(_run, func, args, kwargs))
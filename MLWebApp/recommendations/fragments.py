@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+from django.template.loader import render_to_string
+
+from recommendations.catalog import CatalogChangeLog
+from recommendations.models import Recommendation, RecommendedMovie
+
+# Rendered movie lists of recommendations. A saved recommendation's movies never change,
+# so a fragment only goes stale when the recommendation is deleted, gets feedback or one
+# of its movies is edited. Keys include the catalog version (latest CatalogChange id), so
+# after a movie edit by any process, e.g. import_movies or the admin on another worker,
+# every fragment is rendered again under new keys and the old ones expire unread.
+# Deleted recommendations and feedback remove their fragment here.
+GENERATION_KEY = 'recommendation_fragments:generation'
+FRAGMENT_TEMPLATE = 'recommendations/movie_list.html'
+
+
+def fragment_generation():
+    # If the cache evicted the generation a new one starts, older fragments are never read again
+    cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+    return cache.get(GENERATION_KEY) or 0
+
+
+def fragment_prefix():
+    return f'recommendation_fragment:{fragment_generation()}:{CatalogChangeLog().latest()}'
+
+
+def fragment_key(prefix, recommendation_id, date_created):
+    # date_created tells apart recommendations that reuse the id of a deleted one
+    return f'{prefix}:{recommendation_id}:{date_created.timestamp()}'
+
+
+def movie_list_fragments(recommendations):
+    """
+    Rendered movie list of each recommendation by id. After one query for the catalog
+    version, cached ones are read with one cache call, the ranked movies of the rest are
+    loaded with one query, rendered and cached. Recommendations that aren't finished are
+    rendered every time.
+    """
+    prefix = fragment_prefix()
+    keys = {recommendation.id: fragment_key(prefix, recommendation.id, recommendation.date_created)
+            for recommendation in recommendations}
+    cached = cache.get_many(keys.values())
+    fragments = {recommendation_id: cached[key] for recommendation_id, key in keys.items() if key in cached}
+
+    missing = [recommendation for recommendation in recommendations if recommendation.id not in fragments]
+    prefetch_related_objects(
+        missing, Prefetch('ranked_movies', queryset=RecommendedMovie.objects.select_related('movie'))
+    )
+    finished = {}
+    for recommendation in missing:
+        fragments[recommendation.id] = render_to_string(
+            FRAGMENT_TEMPLATE, {'ranked_movies': recommendation.ranked_movies.all()}
+        )
+        if recommendation.status == Recommendation.DONE:
+            finished[keys[recommendation.id]] = fragments[recommendation.id]
+    if finished:
+        cache.set_many(finished, timeout=getattr(settings, 'RECOMMENDER_FRAGMENT_CACHE_SECONDS', 24 * 3600))
+    return fragments
+
+
+def invalidate_recommendations(recommendations):
+    prefix = fragment_prefix()
+    cache.delete_many([
+        fragment_key(prefix, recommendation.id, recommendation.date_created)
+        for recommendation in recommendations
+    ])
+
+
+def invalidate_all():
+    cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
@@ -0,0 +1,75 @@
+import numpy as np
+
+from recommendations.constants import GENRES
+
+# Bit i of a genre mask is set when the movie has GENRES[i]
+GENRE_BITS = np.left_shift(np.uint32(1), np.arange(len(GENRES), dtype=np.uint32))
+
+MIN_RATING_COUNT = 5
+
+
+def genre_bitmask(genres):
+    """Pack a list of genre names into a mask, names outside GENRES are ignored"""
+    mask = 0
+    for genre in genres:
+        if genre in GENRES:
+            mask |= 1 << GENRES.index(genre)
+    return mask
+
+
+def genre_masks(genres):
+    """One mask per row of a (movies, genres) one-hot array"""
+    return ((np.asarray(genres) > 0).astype(np.uint32) * GENRE_BITS).sum(axis=1, dtype=np.uint32)
+
+
+def preference_bitmasks(genre_preferences):
+    """Required (1) and excluded (-1) genre masks of a preference vector"""
+    genre_preferences = np.asarray(genre_preferences)
+    required = int(np.bitwise_or.reduce(GENRE_BITS[genre_preferences == 1], initial=np.uint32(0)))
+    excluded = int(np.bitwise_or.reduce(GENRE_BITS[genre_preferences == -1], initial=np.uint32(0)))
+    return required, excluded
+
+
+class GenreIndex:
+    """
+    Array form of the catalog's genres, built once when the catalog loads.
+
+    masks holds one uint32 per movie so the include/exclude rules of a request are two
+    vectorized bitwise ops instead of boolean reductions over a DataFrame copy.
+    Rows line up with the catalog DataFrame.
+    """
+
+    def __init__(self, genres, counts, masks=None):
+        self.genres = np.ascontiguousarray(genres, dtype=np.float32)
+        self.counts = np.asarray(counts)
+        self.masks = genre_masks(self.genres) if masks is None else masks
+
+    @classmethod
+    def from_movies_df(cls, movies_df):
+        return cls(movies_df[GENRES].to_numpy(dtype=np.float32), movies_df['count'].to_numpy())
+
+    def __len__(self):
+        return len(self.masks)
+
+    def patched(self, source_rows, changed_rows, changed_genres, counts):
+        """
+        Index of a patched catalog. source_rows gives the old row of every new row (-1 for
+        added movies), changed_rows, which must include the added ones, take their genres
+        from changed_genres. counts is the whole count column of the new catalog.
+        """
+        taken = np.maximum(source_rows, 0)
+        genres = self.genres[taken]
+        masks = self.masks[taken]
+        genres[changed_rows] = changed_genres
+        masks[changed_rows] = genre_masks(changed_genres)
+        return GenreIndex(genres, counts, masks)
+
+    def candidates(self, genre_preferences, min_count=MIN_RATING_COUNT):
+        """Rows that have every selected genre, none of the excluded ones and enough ratings"""
+        required, excluded = preference_bitmasks(genre_preferences)
+        keep = self.counts >= min_count
+        if excluded:
+            keep &= (self.masks & np.uint32(excluded)) == 0
+        if required:
+            keep &= (self.masks & np.uint32(required)) == required
+        return np.flatnonzero(keep).astype(np.int32)
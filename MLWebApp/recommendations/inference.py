@@ -0,0 +1,140 @@
+import tensorflow as tf
+from keras.saving import register_keras_serializable
+
+from recommendations.constants import GENRES as GENRE_CHOICES
+
+# Only imported when RECOMMENDER_BACKEND is 'keras' (see utils.load_recommender) or by
+# code that trains/inspects the model. Keep it out of modules Django imports on startup.
+
+#------------------------#
+#                        #
+#      ML MODEL          #
+#                        # 
+#------------------------#
+
+# Multi Layered Neural Network which takes user genre preferences and matches movies primarily based on genres and ratings
+
+@register_keras_serializable()
+class EnhancedRecommender(tf.keras.Model):
+    def __init__(self, trainable=True, dtype=None, **kwargs):
+        super().__init__(trainable=trainable, dtype=dtype, **kwargs)
+        
+        self.dropout1 = tf.keras.layers.Dropout(0.2)
+        self.dropout2 = tf.keras.layers.Dropout(0.1)
+        self.dropout3 = tf.keras.layers.Dropout(0.15)
+        
+        self.genre_matching = tf.keras.Sequential([
+            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES) * 2,)),
+            tf.keras.layers.Dense(128, activation='relu'),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Dense(64, activation='relu'),
+            tf.keras.layers.Dense(1)
+        ])
+        
+        self.preference_net = tf.keras.Sequential([
+            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES),)),
+            tf.keras.layers.Dense(256, activation='relu'),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Dropout(0.3),
+            tf.keras.layers.Dense(128, activation='relu'),
+            tf.keras.layers.Dense(64, activation='relu')
+        ])
+        
+        self.movie_net = tf.keras.Sequential([
+            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES),)),
+            tf.keras.layers.Dense(256, activation='relu'),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Dropout(0.3),
+            tf.keras.layers.Dense(128, activation='relu'),
+            tf.keras.layers.Dense(64, activation='relu')
+        ])
+        
+        # Changed input shape to 2 to match trained model
+        self.metadata_net = tf.keras.Sequential([
+            tf.keras.layers.InputLayer(input_shape=(2,)),  # year and popularity only
+            tf.keras.layers.Dense(64, activation='relu'),
+            tf.keras.layers.BatchNormalization(),
+            tf.keras.layers.Dense(32, activation='relu'),
+            tf.keras.layers.Dense(16, activation='relu')
+        ])
+        
+        self.match_net = tf.keras.Sequential([
+            tf.keras.layers.Dense(256, activation='relu'),
+            tf.keras.layers.Dropout(0.2),
+            tf.keras.layers.Dense(128, activation='relu'),
+            tf.keras.layers.Dense(64, activation='relu'),
+            tf.keras.layers.Dense(1)
+        ])
+
+    def call(self, inputs, training=True):
+        genre_concat = tf.concat([inputs['user_preferences'], inputs['movie_genres']], axis=1)
+        genre_match_score = self.genre_matching(genre_concat)
+        
+        pref_features = self.preference_net(inputs['user_preferences'])
+        pref_features = self.dropout1(pref_features, training=training)
+        
+        movie_features = self.movie_net(inputs['movie_genres'])
+        movie_features = self.dropout2(movie_features, training=training)
+        
+        # Changed to match trained model (removed rating)
+        metadata = tf.concat([inputs['year'], inputs['popularity']], axis=1)
+        metadata_features = self.metadata_net(metadata)
+        metadata_features = self.dropout3(metadata_features, training=training)
+        
+        combined = tf.concat([
+            pref_features,
+            movie_features,
+            metadata_features,
+            genre_match_score  # Removed the * 0.1 scaling factor to match trained model
+        ], axis=1)
+        
+        return self.match_net(combined)
+
+    # Inference helpers that split call() into its movie side and user side.
+    # movie_net and metadata_net only see the movie, so their outputs can be computed
+    # once for the whole catalog and reused by every request.
+
+    def _as_model_input(self, x):
+        # Calling the model casts inputs to its compute dtype (the saved model is
+        # mixed_float16), do the same so the towers match call() exactly
+        return tf.cast(x, self.compute_dtype)
+
+    def movie_tower(self, movie_genres, year, popularity):
+        movie_features = self.movie_net(self._as_model_input(movie_genres), training=False)
+        metadata = tf.concat([self._as_model_input(year), self._as_model_input(popularity)], axis=1)
+        metadata_features = self.metadata_net(metadata, training=False)
+        return movie_features, metadata_features
+
+    def preference_tower(self, user_preferences):
+        return self.preference_net(self._as_model_input(user_preferences), training=False)
+
+    def joint_score(self, user_preferences, pref_features, movie_genres, movie_features, metadata_features):
+        # user_preferences and pref_features are either one row per candidate or a single
+        # row shared by all candidates, repeat the single row for every candidate
+        user_preferences = self._as_model_input(user_preferences)
+        movie_genres = self._as_model_input(movie_genres)
+        count = tf.shape(movie_genres)[0]
+        if user_preferences.shape[0] == 1:
+            user_preferences = tf.repeat(user_preferences, count, axis=0)
+            pref_features = tf.repeat(pref_features, count, axis=0)
+        genre_match_score = self.genre_matching(tf.concat([user_preferences, movie_genres], axis=1), training=False)
+
+        combined = tf.concat([
+            pref_features,
+            movie_features,
+            metadata_features,
+            genre_match_score
+        ], axis=1)
+
+        return self.match_net(combined, training=False)
+
+    def get_config(self):
+        config = super().get_config()
+        return config
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+
+    
@@ -0,0 +1,324 @@
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from recommendations.constants import GENRES
+from recommendations.sql_catalog import SqlCatalogEngine
+from recommendations.utils import RankedMovies
+
+# Wire format, all little endian. A connection carries any number of request/response pairs.
+#
+# request:  magic, top_k, seed (-1 for none), one int8 per genre (-1/0/1)
+# response: magic, status, count, then count RESULT records on success or a count byte
+#           utf-8 error message on failure
+MAGIC = b'RCM1'
+REQUEST = struct.Struct(f'<4sHq{len(GENRES)}b')
+RESPONSE = struct.Struct('<4sBI')
+RESULT = np.dtype([('row', '<i4'), ('movie_id', '<i8'), ('match_score', '<f4'), ('matched_mask', '<u4')])
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# The server answered but could not score the request
+class RemoteScoringError(Exception):
+    pass
+
+
+def encode_request(genre_preferences, top_k=10, seed=None):
+    return REQUEST.pack(MAGIC, top_k, -1 if seed is None else seed, *(int(value) for value in genre_preferences))
+
+
+def decode_request(data):
+    magic, top_k, seed, *genre_preferences = REQUEST.unpack(data)
+    if magic != MAGIC:
+        raise ProtocolError("Bad request header")
+    return np.array(genre_preferences, dtype=np.float32), top_k, None if seed < 0 else seed
+
+
+def encode_response(recommendations):
+    if recommendations is None:
+        return RESPONSE.pack(MAGIC, STATUS_OK, 0)
+
+    results = np.empty(len(recommendations), dtype=RESULT)
+    results['row'] = recommendations.rows
+    results['movie_id'] = recommendations.movie_ids
+    results['match_score'] = recommendations.match_scores
+    results['matched_mask'] = recommendations.matched_masks
+    return RESPONSE.pack(MAGIC, STATUS_OK, len(results)) + results.tobytes()
+
+
+def encode_error(message):
+    message = message.encode('utf-8')
+    return RESPONSE.pack(MAGIC, STATUS_ERROR, len(message)) + message
+
+
+def recv_exactly(sock, size):
+    """Read size bytes, returns b'' if the peer closed the connection before sending any"""
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            if buffer:
+                raise ProtocolError("Connection closed mid message")
+            return b''
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def read_response(sock):
+    header = recv_exactly(sock, RESPONSE.size)
+    if not header:
+        raise ProtocolError("Connection closed by inference server")
+    magic, status, count = RESPONSE.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError("Bad response header")
+
+    if status != STATUS_OK:
+        raise RemoteScoringError(recv_exactly(sock, count).decode('utf-8'))
+    if count == 0:
+        return None
+
+    results = np.frombuffer(recv_exactly(sock, count * RESULT.itemsize), dtype=RESULT)
+    return RankedMovies(
+        rows=results['row'],
+        movie_ids=results['movie_id'],
+        match_scores=results['match_score'],
+        matched_masks=results['matched_mask'],
+    )
+
+
+class InferenceRequestHandler(socketserver.BaseRequestHandler):
+    # One thread per client connection, serving requests until the client hangs up
+
+    def setup(self):
+        with self.server.clients_lock:
+            self.server.clients.add(self.request)
+
+    def handle(self):
+        while True:
+            data = recv_exactly(self.request, REQUEST.size)
+            if not data:
+                return
+            try:
+                genre_preferences, top_k, seed = decode_request(data)
+            except ProtocolError as e:
+                self.request.sendall(encode_error(str(e)))
+                return
+
+            # Refreshing the catalog queries the database from this thread. Like a web request,
+            # drop connections that are broken or past CONN_MAX_AGE on both sides of it.
+            close_old_connections()
+            try:
+                response = encode_response(self.server.registry.get().recommend(genre_preferences, top_k, seed))
+            except Exception as e:
+                print(f"Error scoring request: {e}")
+                response = encode_error(str(e))
+            finally:
+                close_old_connections()
+            self.request.sendall(response)
+
+    def finish(self):
+        with self.server.clients_lock:
+            self.server.clients.discard(self.request)
+        # The thread ends with the client's connection, so does its database connection
+        connections.close_all()
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves recommendations from one ModelRegistry over a Unix domain socket, so web
+    workers on the same box can share a single copy of the model and catalog.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, registry):
+        self.registry = registry
+        # Open client connections, closed with the server so clients reconnect to the next one
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        # A socket file left behind by a server that didn't shut down cleanly
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, InferenceRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        with self.clients_lock:
+            for client in self.clients:
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class InferenceClient:
+    """
+    Talks to an InferenceServer. Connections are kept open and reused, up to pool_size
+    of them are kept idle.
+    """
+
+    def __init__(self, path, pool_size=4, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self.connections_opened = 0
+
+    def recommend(self, genre_preferences, top_k=10, seed=None):
+        request = encode_request(genre_preferences, top_k, seed)
+        sock, reused = self._acquire()
+        try:
+            return self._send(sock, request)
+        except TimeoutError:
+            raise
+        except (OSError, ProtocolError) as e:
+            if not reused:
+                raise
+            # Pooled connections go stale when the server restarts, drop them all and try
+            # once more on a new one. Requests have no side effects, sending again is safe.
+            print(f"Pooled connection to {self.path} failed ({e}), reconnecting")
+            self.close()
+            sock, _ = self._acquire()
+            return self._send(sock, request)
+
+    def _send(self, sock, request):
+        try:
+            sock.sendall(request)
+            recommendations = read_response(sock)
+        except RemoteScoringError:
+            # The connection itself is still fine
+            self._release(sock)
+            raise
+        except Exception:
+            sock.close()
+            raise
+        self._release(sock)
+        return recommendations
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _acquire(self):
+        """A connection and whether it came from the pool"""
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.connections_opened += 1
+        return sock, False
+
+    def _release(self, sock):
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+
+class RemoteEngine:
+    """
+    Drop in for ModelRegistry in the views that scores through the inference server.
+
+    If the server can't be reached the request is scored in process with fallback,
+    and the server is not tried again for retry_seconds.
+    """
+
+    def __init__(self, client, fallback, retry_seconds=30):
+        self.client = client
+        self.fallback = fallback
+        self.retry_seconds = retry_seconds
+        self._retry_at = 0
+        self.remote_requests = 0
+        self.fallback_requests = 0
+
+    def get(self):
+        return self
+
+    def is_loaded(self):
+        return True
+
+    def reset(self):
+        self.client.close()
+        self.fallback.reset()
+        self._retry_at = 0
+
+    def recommend(self, genre_preferences, top_k=10, seed=None):
+        if time.monotonic() >= self._retry_at:
+            try:
+                recommendations = self.client.recommend(genre_preferences, top_k, seed)
+                self.remote_requests += 1
+                return recommendations
+            except (OSError, ProtocolError) as e:
+                print(f"Inference server at {self.client.path} unavailable ({e}), scoring in process")
+                self._retry_at = time.monotonic() + self.retry_seconds
+
+        self.fallback_requests += 1
+        return self.fallback.get().recommend(genre_preferences, top_k, seed)
+
+    def recommend_batch(self, preference_list, top_k=10, seed=None):
+        """
+        One request per preference over a pooled connection, the server's batcher combines
+        them with everyone else's. The wire format takes one integer seed per request.
+        """
+        return [
+            self.recommend(
+                genre_preferences, top_k,
+                None if seed is None else int(np.random.SeedSequence([seed, i]).generate_state(1)[0])
+            )
+            for i, genre_preferences in enumerate(preference_list)
+        ]
+
+    def stats(self):
+        stats = {
+            'inference_socket': self.client.path,
+            'remote_requests': self.remote_requests,
+            'fallback_requests': self.fallback_requests,
+            'connections_opened': self.client.connections_opened,
+        }
+        if self.fallback.is_loaded():
+            stats['fallback'] = self.fallback.get().stats()
+        return stats
+
+
+def engine_from_settings(registry):
+    """
+    The in process registry, a RemoteEngine in front of it when RECOMMENDER_INFERENCE_SOCKET
+    is set, or a SqlCatalogEngine that never loads the catalog with RECOMMENDER_LOW_MEMORY_CATALOG
+    """
+    if getattr(settings, 'RECOMMENDER_LOW_MEMORY_CATALOG', False):
+        return SqlCatalogEngine()
+
+    path = getattr(settings, 'RECOMMENDER_INFERENCE_SOCKET', None)
+    if not path:
+        return registry
+    client = InferenceClient(
+        path,
+        pool_size=getattr(settings, 'RECOMMENDER_INFERENCE_POOL_SIZE', 4),
+        timeout=getattr(settings, 'RECOMMENDER_INFERENCE_TIMEOUT', 2.0),
+    )
+    return RemoteEngine(client, registry)
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from recommendations.models import Recommendation, RecommendedMovie
+from recommendations.utils import prepare_genre_preferences
+
+NO_MATCH_ERROR = "No movies found matching your criteria. Try different preferences."
+
+
+def queue_recommendation(user, preference):
+    """Save the preference and a pending recommendation for it together, for run_recommendation_worker"""
+    with transaction.atomic():
+        preference.save()
+        return Recommendation.objects.create(user=user, preference=preference, status=Recommendation.PENDING)
+
+
+def claim_jobs(batch_size):
+    """
+    Mark up to batch_size pending recommendations as running and return them, oldest first.
+
+    Each one is claimed with its own conditional update, so several workers can poll the
+    same table without scoring a job twice.
+    """
+    pending = list(
+        Recommendation.objects.filter(status=Recommendation.PENDING)
+        .order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    now = timezone.now()
+    claimed = [
+        recommendation_id for recommendation_id in pending
+        if Recommendation.objects.filter(id=recommendation_id, status=Recommendation.PENDING)
+        .update(status=Recommendation.RUNNING, started_at=now)
+    ]
+    return list(Recommendation.objects.filter(id__in=claimed).select_related('preference').order_by('id'))
+
+
+def requeue_stale_jobs(stale_after):
+    """Put jobs back in the queue whose worker has been running them for longer than stale_after seconds"""
+    return Recommendation.objects.filter(
+        status=Recommendation.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=stale_after)
+    ).update(status=Recommendation.PENDING, started_at=None)
+
+
+def finish_job(recommendation, status, error=''):
+    """
+    Set the status of a claimed job, only if it is still running under this worker's claim.
+    False when it was requeued (and maybe claimed again by another worker) in the meantime.
+    """
+    return bool(Recommendation.objects.filter(
+        id=recommendation.id, status=Recommendation.RUNNING, started_at=recommendation.started_at
+    ).update(status=status, error=error))
+
+
+def run_jobs(handle, recommendations, top_k=10):
+    """
+    Fill in the movies of claimed recommendations with the model in handle.
+
+    Preferences that aren't cached yet are scored together first, after that every job
+    only runs its own ranking. Jobs that were requeued while they ran are left to whoever
+    has them now. Returns the number of jobs that finished successfully.
+    """
+    preferences = [prepare_genre_preferences(recommendation.preference) for recommendation in recommendations]
+    try:
+        handle.warm(preferences)
+    except Exception as e:
+        # Each job scores on its own below and reports its own error
+        print(f"Error batch scoring recommendation jobs: {e}")
+
+    done = 0
+    for recommendation, genre_preferences in zip(recommendations, preferences):
+        try:
+            ranked = handle.recommend(genre_preferences, top_k)
+            if ranked is None or len(ranked) == 0:
+                finish_job(recommendation, Recommendation.FAILED, NO_MATCH_ERROR)
+                continue
+            # The movies and the finished status become visible together
+            with transaction.atomic():
+                if not finish_job(recommendation, Recommendation.DONE):
+                    print(f"Recommendation {recommendation.id} was requeued, dropping its results")
+                    continue
+                RecommendedMovie.save_ranked([recommendation], [ranked])
+            done += 1
+        except Exception as e:
+            print(f"Error generating recommendation {recommendation.id}: {e}")
+            finish_job(recommendation, Recommendation.FAILED, f"Error generating recommendations: {e}")
+    return done
@@ -0,0 +1,79 @@
+import contextlib
+import io
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from recommendations.constants import GENRES
+from recommendations.genre_index import GenreIndex
+from recommendations.synthetic import synthetic_movies_df
+from recommendations.utils import filter_candidates
+
+
+# Typical requests: a couple of genres, with and without other genres allowed
+PREFERENCES = [
+    ('Action', True),
+    ('Action + Sci-Fi', True),
+    ('Comedy', False),
+    ('Drama + Romance', False),
+]
+
+
+def preference_vector(genres, include_other_genres, index):
+    genre_preferences = np.zeros(19, dtype=np.float32)
+    for genre in genres.split(' + '):
+        genre_preferences[index[genre]] = 1
+    if not include_other_genres:
+        genre_preferences[genre_preferences == 0] = -1
+    return genre_preferences
+
+
+def best_time(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Compare the DataFrame genre filters with the GenreIndex bitmask filters on synthetic catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[87_585, 1_000_000],
+                            help='Synthetic catalog sizes to benchmark')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs per measurement, the best is reported')
+
+    def handle(self, *args, **kwargs):
+        genre_positions = {genre: i for i, genre in enumerate(GENRES)}
+
+        for size in kwargs['sizes']:
+            movies_df = synthetic_movies_df(size)
+
+            started = time.perf_counter()
+            index = GenreIndex.from_movies_df(movies_df)
+            build_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"\n{size:,} movies (index built in {build_ms:.1f} ms)")
+
+            for genres, include_other_genres in PREFERENCES:
+                genre_preferences = preference_vector(genres, include_other_genres, genre_positions)
+
+                # The DataFrame path prints its progress, keep that out of the output
+                def pandas_filter():
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        return filter_candidates(movies_df, genre_preferences).index.to_numpy()
+
+                expected = pandas_filter()
+                actual = index.candidates(genre_preferences)
+                if not np.array_equal(expected, actual):
+                    self.stdout.write(self.style.ERROR(f"{genres}: results differ!"))
+                    continue
+
+                pandas_ms = best_time(pandas_filter, kwargs['repeat'])
+                index_ms = best_time(lambda: index.candidates(genre_preferences), kwargs['repeat'])
+                label = genres if include_other_genres else f"{genres} only"
+                self.stdout.write(
+                    f"  {label:<24} {len(actual):>9,} rows  pandas {pandas_ms:8.2f} ms  "
+                    f"bitmask {index_ms:7.2f} ms  ({pandas_ms / index_ms:5.1f}x)"
+                )
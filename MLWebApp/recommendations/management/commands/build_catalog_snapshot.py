@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recommendations.snapshot import catalog_fingerprint, catalog_hash, read_manifest, write_snapshot
+from recommendations.utils import load_catalog
+
+
+class Command(BaseCommand):
+    help = 'Write the catalog features the recommender uses to a memory mappable snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=None,
+                            help='Snapshot directory (default: RECOMMENDER_CATALOG_SNAPSHOT_DIR)')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild even if the snapshot matches the Movie table')
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare the contents of the Movie table with the snapshot instead of only '
+                                 'its change log, catches edits made with .update()')
+
+    def handle(self, *args, **kwargs):
+        directory = kwargs['dir'] or getattr(settings, 'RECOMMENDER_CATALOG_SNAPSHOT_DIR', None)
+        if not directory:
+            raise CommandError("Pass --dir or set RECOMMENDER_CATALOG_SNAPSHOT_DIR")
+
+        fingerprint = catalog_fingerprint()
+        content_hash = catalog_hash() if kwargs['verify'] else None
+        manifest = read_manifest(directory)
+        up_to_date = manifest is not None and manifest['fingerprint'] == fingerprint
+        if up_to_date and content_hash is not None and manifest['content_hash'] != content_hash:
+            self.stdout.write(self.style.WARNING(
+                f"Snapshot {fingerprint} in {directory} doesn't match the Movie table, rebuilding it"
+            ))
+            up_to_date = False
+        if up_to_date and not kwargs['force']:
+            self.stdout.write(f"Snapshot {fingerprint} in {directory} is up to date")
+            return
+
+        manifest = write_snapshot(load_catalog(), directory, fingerprint, content_hash)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote snapshot {fingerprint} of {manifest['rows']:,} movies to {directory}"
+        ))
@@ -0,0 +1,140 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recommendations.cache import ScoreCache, preference_signature, signature_preferences
+from recommendations.models import Preference, Recommendation, RecommendedMovie
+from recommendations.registry import model_registry
+from recommendations.utils import candidate_pool, prepare_genre_preferences, rank_scored, score_preferences_batch
+
+
+class Command(BaseCommand):
+    help = 'Generate new recommendations for stored preferences in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all-preferences', action='store_true',
+                            help="Every stored (user, preference) pair instead of each user's latest preference")
+        parser.add_argument('--users', type=int, nargs='+', default=None,
+                            help='Only these user ids')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Recommendations scored and written per transaction')
+        parser.add_argument('--top-k', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Make the sampling reproducible, each user gets its own stream')
+        parser.add_argument('--checkpoint', type=str, default=None,
+                            help='File that records progress after every batch')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip everything the checkpoint says is already written')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['resume'] and not kwargs['checkpoint']:
+            raise CommandError("--resume needs --checkpoint")
+        if kwargs['top_k'] < 1:
+            raise CommandError("--top-k must be at least 1")
+
+        units = self.collect_units(kwargs['all_preferences'], kwargs['users'])
+        mode = 'all' if kwargs['all_preferences'] else 'latest'
+        written_before = 0
+
+        if kwargs['resume'] and os.path.exists(kwargs['checkpoint']):
+            with open(kwargs['checkpoint']) as f:
+                checkpoint = json.load(f)
+            if checkpoint['mode'] != mode:
+                raise CommandError(f"Checkpoint is for --{checkpoint['mode']} mode")
+            last = tuple(checkpoint['last'])
+            written_before = checkpoint['written']
+            skipped = len(units)
+            units = [unit for unit in units if unit > last]
+            self.stdout.write(f"Resuming after {checkpoint['written']:,} written, skipping {skipped - len(units):,}")
+
+        total = len(units)
+        signatures = len({unit[0] for unit in units})
+        self.stdout.write(f"Generating {total:,} recommendations for {signatures:,} distinct preference signatures")
+        if not total:
+            return
+
+        handle = model_registry.get()
+        # Units are sorted by signature, so a signature is only needed again by the next batch
+        scored_cache = ScoreCache(max_entries=kwargs['batch_size'] + 1)
+        started = time.perf_counter()
+        written = 0
+        for i in range(0, total, kwargs['batch_size']):
+            batch = units[i:i + kwargs['batch_size']]
+            written += self.generate_batch(handle, batch, scored_cache, kwargs['top_k'], kwargs['seed'])
+
+            if kwargs['checkpoint']:
+                self.save_checkpoint(kwargs['checkpoint'], mode, batch[-1], written_before + written)
+
+            done = i + len(batch)
+            elapsed = time.perf_counter() - started
+            remaining = elapsed / done * (total - done)
+            self.stdout.write(f"{done:,}/{total:,} ({done / elapsed:,.0f}/s, {remaining:,.0f}s left)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written:,} recommendations in {time.perf_counter() - started:.1f}s, "
+            f"{total - written:,} preferences matched no movies"
+        ))
+
+    def collect_units(self, all_preferences, user_ids):
+        """
+        (signature, user_id, preference_id) to generate, sorted so equal signatures are
+        next to each other and the order is the same on every run
+        """
+        recommendations = Recommendation.objects.all()
+        if user_ids:
+            recommendations = recommendations.filter(user_id__in=user_ids)
+
+        if all_preferences:
+            pairs = set(recommendations.values_list('user_id', 'preference_id'))
+        else:
+            # Newest first per user, keep the first one seen
+            pairs = {}
+            for user_id, preference_id in recommendations.order_by('user_id', '-date_created', '-id') \
+                    .values_list('user_id', 'preference_id').iterator():
+                pairs.setdefault(user_id, preference_id)
+            pairs = set(pairs.items())
+
+        preferences = Preference.objects.in_bulk({preference_id for _, preference_id in pairs})
+        return sorted(
+            (preference_signature(prepare_genre_preferences(preferences[preference_id])), user_id, preference_id)
+            for user_id, preference_id in pairs
+        )
+
+    def generate_batch(self, handle, batch, scored_cache, top_k, seed):
+        preferences = {}
+        for signature, _, _ in batch:
+            if signature not in scored_cache and signature not in preferences:
+                preferences[signature] = signature_preferences(signature)
+
+        # Every signature of the batch not scored yet, in one model call
+        scored = score_preferences_batch(
+            handle.model, handle.movies_df, list(preferences.values()), handle.towers, handle.genre_index
+        )
+        for signature, entry in zip(preferences, scored):
+            scored_cache.put(signature, candidate_pool(handle.movies_df, handle.genre_index, entry))
+
+        picks = []
+        for signature, user_id, preference_id in batch:
+            entry = scored_cache.get(signature)
+            if len(entry) == 0:
+                continue
+            ranked = rank_scored(
+                handle.movies_df, handle.genre_index, entry, signature_preferences(signature), top_k,
+                None if seed is None else [seed, user_id]
+            )
+            picks.append((user_id, preference_id, ranked))
+
+        with transaction.atomic():
+            recommendations = Recommendation.objects.bulk_create([
+                Recommendation(user_id=user_id, preference_id=preference_id) for user_id, preference_id, _ in picks
+            ])
+            RecommendedMovie.save_ranked(recommendations, [ranked for _, _, ranked in picks])
+        return len(recommendations)
+
+    def save_checkpoint(self, path, mode, last, written):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'mode': mode, 'last': list(last), 'written': written}, f)
+        os.replace(tmp_path, path)
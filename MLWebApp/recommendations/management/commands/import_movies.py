@@ -1,25 +1,127 @@
+import math
+import os
+import zipfile
+
 import pandas as pd
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recommendations.models import Movie
+from recommendations.genre_index import genre_bitmask
+from recommendations.movielens import (
+    PhaseTimer, RatingStats, archive_members, rating_stats_cache_path, read_movies, read_rating_stats
+)
+from recommendations.registry import file_version
+from recommendations.signals import record_catalog_change
+
+# Movie fields the import sets, compared by --upsert to find changed movies
+IMPORT_FIELDS = ['title', 'genres', 'mean', 'count', 'year', 'genre_mask']
+
 
 class Command(BaseCommand):
-    help = 'Import movies from movies.csv and ratings.csv files'
+    help = 'Import movies from movies.csv and ratings.csv files, or straight from a MovieLens zip'
 
     def add_arguments(self, parser):
-        parser.add_argument('movies_csv_path', type=str, help='The path to the movies CSV file')
-        parser.add_argument('ratings_csv_path', type=str, help='The path to the ratings CSV file')
+        parser.add_argument('movies_csv_path', type=str,
+                            help='The path to the movies CSV file, or to a MovieLens zip archive')
+        parser.add_argument('ratings_csv_path', type=str, nargs='?', default=None,
+                            help='The path to the ratings CSV file, not needed for a zip archive')
+        parser.add_argument('--cache-dir', type=str, default=None,
+                            help='Where rating stats of imported archives are kept, defaults to MOVIELENS_CACHE_DIR')
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Always scan the archive's ratings, don't read or write the cache")
+        parser.add_argument('--chunk-size', type=int, default=1_000_000,
+                            help='Ratings read per chunk, memory use depends on this instead of the file size')
+        parser.add_argument('--upsert', action='store_true',
+                            help='Update an existing catalog in place, only writing new and changed movies')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Movies written per transaction with --upsert')
+        parser.add_argument('--engine', choices=['c', 'pyarrow'], default='c',
+                            help='CSV parser, pyarrow parses on several threads (pip install pyarrow)')
+        parser.add_argument('--profile', action='store_true',
+                            help='Print the wall time and peak memory of every phase')
 
     def handle(self, *args, **kwargs):
         movies_csv_path = kwargs['movies_csv_path']
         ratings_csv_path = kwargs['ratings_csv_path']
-        self.import_movies_from_csvs(movies_csv_path, ratings_csv_path)
+        if kwargs['engine'] == 'pyarrow':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError("--engine pyarrow needs the pyarrow package")
+
+        if zipfile.is_zipfile(movies_csv_path):
+            if ratings_csv_path is not None:
+                raise CommandError("Pass either a zip archive or the two CSV files")
+            cache_dir = None
+            if not kwargs['no_cache']:
+                cache_dir = kwargs['cache_dir'] or getattr(settings, 'MOVIELENS_CACHE_DIR', None)
+            self.import_movies_from_archive(
+                movies_csv_path, cache_dir, kwargs['chunk_size'], kwargs['upsert'], kwargs['batch_size'],
+                kwargs['engine'], kwargs['profile']
+            )
+            return
+
+        if ratings_csv_path is None:
+            raise CommandError("ratings_csv_path is required unless movies_csv_path is a zip archive")
+        self.import_movies_from_csvs(
+            movies_csv_path, ratings_csv_path, kwargs['chunk_size'], kwargs['upsert'], kwargs['batch_size'],
+            kwargs['engine'], kwargs['profile']
+        )
 
-    def import_movies_from_csvs(self, movies_csv_path, ratings_csv_path):
+    def import_movies_from_csvs(self, movies_csv_path, ratings_csv_path, chunk_size=1_000_000,
+                                upsert=False, batch_size=2000, engine='c', profile=False):
+        timer = PhaseTimer(self.stdout if profile else None)
         self.stdout.write('Reading CSV files...')
         
-        # Read both CSV files
-        movies_df = pd.read_csv(movies_csv_path)
-        ratings_df = pd.read_csv(ratings_csv_path)
+        # The ratings are only needed as per movie sums and counts, they are streamed
+        # through in chunks instead of loaded whole
+        movies_df = read_movies(movies_csv_path, engine)
+        timer.mark('Read movies')
+        ratings = read_rating_stats(ratings_csv_path, chunk_size, engine)
+        timer.mark('Aggregate ratings')
+        self.save_movies(movies_df, ratings, upsert, batch_size, timer)
+
+    def import_movies_from_archive(self, archive_path, cache_dir=None, chunk_size=1_000_000,
+                                   upsert=False, batch_size=2000, engine='c', profile=False):
+        """
+        Read movies.csv and ratings.csv straight out of a MovieLens zip. The rating stats
+        are cached in cache_dir under the archive's hash, later imports of the same
+        archive skip the ratings scan.
+        """
+        timer = PhaseTimer(self.stdout if profile else None)
+        self.stdout.write(f'Reading {archive_path}...')
+
+        cache_path = None
+        if cache_dir:
+            cache_path = rating_stats_cache_path(cache_dir, file_version(archive_path))
+            timer.mark('Hash archive')
+
+        with zipfile.ZipFile(archive_path) as archive:
+            try:
+                movies_name, ratings_name = archive_members(archive)
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+
+            with archive.open(movies_name) as movies_csv:
+                movies_df = read_movies(movies_csv, engine)
+            timer.mark('Read movies')
+
+            if cache_path and os.path.exists(cache_path):
+                self.stdout.write(f'Using cached rating stats {cache_path}')
+                ratings = RatingStats.load(cache_path)
+            else:
+                with archive.open(ratings_name) as ratings_csv:
+                    ratings = read_rating_stats(ratings_csv, chunk_size, engine)
+                if cache_path:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    ratings.save(cache_path)
+            timer.mark('Aggregate ratings')
+
+        self.save_movies(movies_df, ratings, upsert, batch_size, timer)
+
+    def save_movies(self, movies_df, ratings, upsert, batch_size, timer):
+        """Add the rating stats to the movies of movies.csv and write them to the database"""
         
         # Extract year from title
         self.stdout.write('Extracting years from titles...')
@@ -37,31 +139,25 @@ class Command(BaseCommand):
         
         # Print ratings information
         self.stdout.write('\nRatings Dataset Information:')
-        self.stdout.write(f"Total number of ratings: {len(ratings_df):,}")
-        self.stdout.write(f"Number of unique users: {ratings_df['userId'].nunique():,}")
-        self.stdout.write(f"Number of unique movies rated: {ratings_df['movieId'].nunique():,}")
+        self.stdout.write(f"Total number of ratings: {ratings.total:,}")
+        self.stdout.write(f"Number of unique users: {ratings.unique_users:,}")
+        self.stdout.write(f"Number of unique movies rated: {ratings.unique_movies:,}")
         
         # Verify ratings distribution
         self.stdout.write('\nRatings Distribution:')
-        ratings_dist = ratings_df['rating'].value_counts().sort_index()
-        for rating, count in ratings_dist.items():
-            self.stdout.write(f"Rating {rating}: {count:,} ratings ({(count/len(ratings_df)*100):.2f}%)")
+        for rating, count in sorted(ratings.histogram.items()):
+            self.stdout.write(f"Rating {rating}: {count:,} ratings ({(count/ratings.total*100):.2f}%)")
         
         # Calculate mean rating and count for each movie
         self.stdout.write('\nCalculating rating statistics...')
-        rating_stats = ratings_df.groupby('movieId').agg({
-            'rating': ['mean', 'count']
-        }).reset_index()
-        
-        # Flatten multi-level columns
-        rating_stats.columns = ['movieId', 'mean_rating', 'rating_count']
+        rating_stats = ratings.to_frame()
         
         # Verify total ratings matches
         total_ratings_check = rating_stats['rating_count'].sum()
         self.stdout.write(f"\nVerification - Total ratings from aggregation: {total_ratings_check:,}")
-        if total_ratings_check != len(ratings_df):
+        if total_ratings_check != ratings.total:
             self.stdout.write(self.style.WARNING(
-                f"Warning: Rating count mismatch! Original: {len(ratings_df):,}, "
+                f"Warning: Rating count mismatch! Original: {ratings.total:,}, "
                 f"Aggregated: {total_ratings_check:,}"
             ))
         
@@ -74,7 +170,7 @@ class Command(BaseCommand):
         )
         
         # Check for any movies that had ratings but weren't in movies_df
-        rated_movies_not_in_db = set(ratings_df['movieId']) - set(movies_df['movieId'])
+        rated_movies_not_in_db = set(ratings.rated_movie_ids().tolist()) - set(movies_df['movieId'])
         if rated_movies_not_in_db:
             self.stdout.write(self.style.WARNING(
                 f"\nWarning: Found {len(rated_movies_not_in_db)} movies with ratings "
@@ -85,23 +181,38 @@ class Command(BaseCommand):
         movies_df['mean_rating'] = movies_df['mean_rating'].fillna(0.0)
         movies_df['rating_count'] = movies_df['rating_count'].fillna(0)
         
+        movies_df['rating_count'] = movies_df['rating_count'].astype(int)
+        timer.mark('Merge stats')
+        
         self.stdout.write(f'\nProcessing {len(movies_df):,} movies...')
         
-        # Convert DataFrame to list of Movie instances
+        # Convert DataFrame to list of Movie instances, reading whole columns instead of
+        # row Series. bulk_create skips Movie.save(), so genre_mask is set here.
+        genres_list = movies_df['genres'].tolist()
+        masks = [genre_bitmask(genres.split('|')) for genres in genres_list]
         movies_list = [
-            Movie(
-                movie_id=row['movieId'],
-                title=row['title'],
-                genres=row['genres'],
-                mean=float(row['mean_rating']),
-                count=int(row['rating_count']),
-                year=int(row['year'])  # Add year to the Movie creation
+            Movie(movie_id=movie_id, title=title, genres=genres, mean=mean, count=count, year=year, genre_mask=mask)
+            for movie_id, title, genres, mean, count, year, mask in zip(
+                movies_df['movieId'].tolist(),
+                movies_df['title'].tolist(),
+                genres_list,
+                movies_df['mean_rating'].tolist(),
+                movies_df['rating_count'].tolist(),
+                movies_df['year'].tolist(),
+                masks,
             )
-            for index, row in movies_df.iterrows()
         ]
+        timer.mark('Build movies')
         
-        # Bulk insert all Movie instances
-        Movie.objects.bulk_create(movies_list)
+        if upsert:
+            self.upsert_movies(movies_list, batch_size)
+        else:
+            # One transaction, split by Django into the largest INSERTs the database takes
+            # (999 variables on SQLite)
+            Movie.objects.bulk_create(movies_list)
+            # bulk_create skips the Movie signals, tell running workers to reload the catalog
+            record_catalog_change()
+        timer.mark('Write movies')
         
         # Print detailed statistics
         self.stdout.write('\nFinal Dataset Statistics:')
@@ -117,10 +228,10 @@ class Command(BaseCommand):
         # Get top 5 most rated movies
         top_rated = movies_df.nlargest(5, 'rating_count')
         self.stdout.write('\nTop 5 Most Rated Movies:')
-        for _, movie in top_rated.iterrows():
+        for movie in top_rated.itertuples():
             self.stdout.write(
-                f"{movie['title']} ({movie['year']}): {int(movie['rating_count']):,} ratings "
-                f"(avg rating: {movie['mean_rating']:.2f})"
+                f"{movie.title} ({movie.year}): {movie.rating_count:,} ratings "
+                f"(avg rating: {movie.mean_rating:.2f})"
             )
             
         # Get distribution of ratings
@@ -129,5 +240,60 @@ class Command(BaseCommand):
         for p in percentiles:
             count = movies_df['rating_count'].quantile(p/100)
             self.stdout.write(f"{p}th percentile: {int(count):,} ratings")
+        timer.mark('Statistics')
+
+        self.stdout.write(self.style.SUCCESS('\nImport completed successfully'))
+
+    def upsert_movies(self, movies_list, batch_size):
+        """
+        Write only the movies that are new or differ from the database, batch_size per
+        transaction. Movies missing from the files are kept, their recommendations too.
+        """
+        existing = {
+            movie_id: values
+            for movie_id, *values in Movie.objects.values_list('movie_id', *IMPORT_FIELDS).iterator(chunk_size=10_000)
+        }
+
+        inserted = updated = 0
+        changed = []
+        for movie in movies_list:
+            old = existing.get(movie.movie_id)
+            if old is None:
+                inserted += 1
+            elif not self.movie_changed(movie, old):
+                continue
+            else:
+                updated += 1
+            changed.append(movie)
+        unchanged = len(movies_list) - len(changed)
+
+        for i in range(0, len(changed), batch_size):
+            with transaction.atomic():
+                Movie.objects.bulk_create(
+                    changed[i:i + batch_size],
+                    update_conflicts=True,
+                    unique_fields=['movie_id'],
+                    update_fields=IMPORT_FIELDS,
+                )
+
+        # Running workers patch in a few changed movies, many reload the whole catalog
+        if len(changed) > getattr(settings, 'RECOMMENDER_CATALOG_PATCH_LIMIT', 1000):
+            record_catalog_change()
+        elif changed:
+            record_catalog_change([movie.movie_id for movie in changed])
+
+        self.stdout.write(
+            f"\nUpsert: {inserted:,} inserted, {updated:,} updated, {unchanged:,} unchanged, "
+            f"{len(existing.keys() - {movie.movie_id for movie in movies_list}):,} in the database but not in the files"
+        )
 
-        self.stdout.write(self.style.SUCCESS('\nImport completed successfully'))
\ No newline at end of file
+    def movie_changed(self, movie, old):
+        for field, old_value in zip(IMPORT_FIELDS, old):
+            value = getattr(movie, field)
+            if field == 'mean':
+                # Means are recomputed from the ratings every time, ignore float noise
+                if not math.isclose(value, old_value, rel_tol=1e-9, abs_tol=1e-9):
+                    return True
+            elif value != old_value:
+                return True
+        return False
@@ -0,0 +1,36 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recommendations.inference_server import InferenceServer
+from recommendations.registry import model_registry
+
+
+class Command(BaseCommand):
+    help = 'Load the recommender once and serve it to the web workers over a Unix domain socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', type=str, default=None,
+                            help='Socket path (default: RECOMMENDER_INFERENCE_SOCKET)')
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['socket'] or getattr(settings, 'RECOMMENDER_INFERENCE_SOCKET', None)
+        if not path:
+            raise CommandError("Pass --socket or set RECOMMENDER_INFERENCE_SOCKET")
+
+        # Load before accepting connections so the first requests don't wait on it
+        handle = model_registry.get()
+        self.stdout.write(f"Loaded {handle}")
+
+        server = InferenceServer(path, model_registry)
+        # Only processes running as the same user or group may connect
+        os.chmod(path, 0o660)
+        self.stdout.write(self.style.SUCCESS(f"Serving recommendations on {path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            model_registry.reset()
+            self.stdout.write("Inference server stopped")
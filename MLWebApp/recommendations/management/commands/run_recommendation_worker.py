@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recommendations.jobs import claim_jobs, requeue_stale_jobs, run_jobs
+from recommendations.registry import model_registry
+
+
+class Command(BaseCommand):
+    help = 'Generate pending recommendations saved by the engine in background job mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Pending recommendations claimed and scored together')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs another worker has been running for this many seconds')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the jobs pending now and exit')
+
+    def handle(self, *args, **kwargs):
+        # Load up front so the first batch doesn't pay for it
+        self.stdout.write(f"Loaded {model_registry.get()}")
+
+        while True:
+            requeued = requeue_stale_jobs(kwargs['stale_after'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs"))
+
+            jobs = claim_jobs(kwargs['batch_size'])
+            if jobs:
+                started = time.perf_counter()
+                done = run_jobs(model_registry.get(), jobs)
+                self.stdout.write(
+                    f"Generated {done}/{len(jobs)} recommendations in {time.perf_counter() - started:.2f}s"
+                )
+                continue
+
+            if kwargs['once']:
+                return
+            time.sleep(kwargs['poll_interval'])
@@ -0,0 +1,65 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recommendations.cache import preference_signature, signature_preferences
+from recommendations.models import Preference
+from recommendations.registry import model_registry
+from recommendations.utils import GENRE_CHOICES, prepare_genre_preferences
+
+
+class Command(BaseCommand):
+    help = 'Pre-compute cached recommendation scores for the most common preference signatures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None,
+                            help='Number of most common stored preferences to warm (default: cache size)')
+        parser.add_argument('--single-genres', action='store_true',
+                            help='Also warm every single genre preference, with and without other genres')
+        parser.add_argument('--path', type=str, default=None,
+                            help='Where to save the cache (default: RECOMMENDER_SCORE_CACHE_PATH)')
+
+    def handle(self, *args, **kwargs):
+        handle = model_registry.get()
+        cache = handle.score_cache
+        top = kwargs['top'] or cache.max_entries
+
+        # Count stored preferences by signature, the most requested ones are warmed first
+        counts = Counter(
+            preference_signature(prepare_genre_preferences(preference))
+            for preference in Preference.objects.all().iterator()
+        )
+        signatures = [signature for signature, _ in counts.most_common(top)]
+
+        if kwargs['single_genres']:
+            for i in range(len(GENRE_CHOICES)):
+                for other in (0, -1):
+                    genre_preferences = [other] * len(GENRE_CHOICES)
+                    genre_preferences[i] = 1
+                    signatures.append(preference_signature(genre_preferences))
+
+        signatures = list(dict.fromkeys(signatures))
+        if len(signatures) > cache.max_entries:
+            self.stdout.write(self.style.WARNING(
+                f"Warming {len(signatures)} signatures but the cache only holds {cache.max_entries}, "
+                f"raise RECOMMENDER_SCORE_CACHE_SIZE to keep them all"
+            ))
+
+        # Scored together in batched model calls, most common first when they don't all fit
+        started = time.perf_counter()
+        warmed, skipped = handle.warm([signature_preferences(signature) for signature in signatures])
+        self.stdout.write(
+            f"Scored {warmed} signatures in {time.perf_counter() - started:.2f}s, "
+            f"{len(signatures) - warmed - skipped} were already cached"
+        )
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} less common signatures that didn't fit in the cache"))
+
+        path = kwargs['path'] or getattr(settings, 'RECOMMENDER_SCORE_CACHE_PATH', None)
+        if cache.save(path):
+            self.stdout.write(self.style.SUCCESS(f"Saved {len(cache)} cached signatures to {path}"))
+        else:
+            self.stdout.write(self.style.WARNING(
+                "No cache path configured, set RECOMMENDER_SCORE_CACHE_PATH or pass --path to keep the results"
+            ))
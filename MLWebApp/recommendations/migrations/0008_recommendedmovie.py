@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0007_recommendation_status'),
+    ]
+
+    operations = [
+        # The through model takes over the existing table of Recommendation.movies,
+        # so saved recommendations keep their movies
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='RecommendedMovie',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recommendations.movie')),
+                        ('recommendation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranked_movies', to='recommendations.recommendation')),
+                    ],
+                    options={
+                        'db_table': 'recommendations_recommendation_movies',
+                        'ordering': ['rank', 'id'],
+                        'unique_together': {('recommendation', 'movie')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='recommendation',
+                    name='movies',
+                    field=models.ManyToManyField(related_name='recommendations', through='recommendations.RecommendedMovie', to='recommendations.movie'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recommendedmovie',
+            name='rank',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recommendedmovie',
+            name='match_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
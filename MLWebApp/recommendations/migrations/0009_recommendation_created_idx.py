@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0008_recommendedmovie'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['date_created', 'id'], name='recommendation_created_idx'),
+        ),
+    ]
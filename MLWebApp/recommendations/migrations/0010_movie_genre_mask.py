@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 01:11
+
+from django.db import migrations, models
+
+from recommendations.constants import GENRES
+
+
+def fill_genre_masks(apps, schema_editor):
+    Movie = apps.get_model('recommendations', 'Movie')
+    movies = []
+    for movie in Movie.objects.only('movie_id', 'genres').iterator(chunk_size=2000):
+        movie.genre_mask = sum(1 << GENRES.index(genre) for genre in set(movie.genres.split('|')) if genre in GENRES)
+        movies.append(movie)
+        if len(movies) == 2000:
+            Movie.objects.bulk_update(movies, ['genre_mask'])
+            movies = []
+    Movie.objects.bulk_update(movies, ['genre_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0009_recommendation_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='genre_mask',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='count',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='year',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(fill_genre_masks, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,12 @@
 from django.db import models
-import tensorflow as tf
-from keras.saving import register_keras_serializable
-import numpy as np
+
+from recommendations.genre_index import genre_bitmask
 
 
 # Create your models here.
 
-from django.db import models
+# The Keras model class lives in recommendations/inference.py so that loading the ORM
+# models (migrate, shell, tests...) doesn't import TensorFlow
 
 GENRE_CHOICES = [
     'Action', 'Adventure', 'Animation', 'Children', 'Comedy',
@@ -20,16 +20,37 @@ class Movie(models.Model):
     title = models.CharField(max_length=255)
     genres = models.CharField(max_length=255)
     mean = models.FloatField(default=0)  # Average rating
-    count = models.IntegerField(default=0)  # Number of ratings
-    year = models.IntegerField(default=0)
+    count = models.IntegerField(default=0, db_index=True)  # Number of ratings
+    year = models.IntegerField(default=0, db_index=True)
+    # genres as a bitmask (bit i for constants.GENRES[i]) so the database can filter by genre.
+    # Set by save() and import_movies, update genres with .update() and it goes stale.
+    genre_mask = models.IntegerField(default=0, db_index=True)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.genre_mask = genre_bitmask(self.genres.split('|'))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'genres' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'genre_mask'}
+        super().save(*args, **kwargs)
+
     # Use this for user view, shows rounded mean 
     def rounded_mean(self, decimals=2):
         """Return the average rating rounded to the specified number of decimal places."""
         return round(self.mean, decimals)
+
+
+# Log of Movie changes, its latest id is the catalog version. Running workers read the
+# entries newer than the catalog they loaded and patch those movies in memory.
+# movie_id is empty when the whole catalog changed, e.g. after import_movies.
+class CatalogChange(models.Model):
+    movie_id = models.IntegerField(null=True, blank=True)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Catalog change {self.id}: {self.movie_id or 'all movies'}"
     
 
     
@@ -37,15 +58,83 @@ class Movie(models.Model):
 
 # Model to save recommendations into
 class Recommendation(models.Model):
+    # With RECOMMENDER_BACKGROUND_JOBS the engine saves a pending recommendation and
+    # run_recommendation_worker fills in its movies
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey('user.Myuser', on_delete=models.DO_NOTHING, related_name="recommendations")
     preference = models.ForeignKey('recommendations.Preference', on_delete=models.CASCADE, related_name="recommendation")
-    movies = models.ManyToManyField(Movie, related_name="recommendations")
+    movies = models.ManyToManyField(Movie, related_name="recommendations", through='RecommendedMovie')
     date_created = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=DONE, db_index=True)
+    error = models.TextField(blank=True, default='')
+    # When a worker claimed the job, to requeue jobs of workers that died
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # Keyset pagination of the recommendations list, newest first
+        indexes = [models.Index(fields=['date_created', 'id'], name='recommendation_created_idx')]
+
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
 
 
     def __str__(self): 
         return f"Recommendation for {self.user.username}"
 
+
+# A movie of a recommendation with the rank and match score the engine gave it, so the
+# detail page shows the results in order without scoring again. Keeps the table of the
+# plain many to many field it replaced.
+class RecommendedMovie(models.Model):
+    recommendation = models.ForeignKey(Recommendation, on_delete=models.CASCADE, related_name='ranked_movies')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    # 1 is the best match. Empty for movies saved before ranks were stored.
+    rank = models.PositiveSmallIntegerField(null=True, blank=True)
+    match_score = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'recommendations_recommendation_movies'
+        unique_together = [('recommendation', 'movie')]
+        ordering = ['rank', 'id']
+
+    @classmethod
+    def ranked(cls, recommendation, movie_ids, match_scores):
+        """Unsaved rows for movie_ids in the order the engine ranked them, for bulk_create"""
+        return [
+            cls(recommendation=recommendation, movie_id=int(movie_id), rank=rank, match_score=float(match_score))
+            for rank, (movie_id, match_score) in enumerate(zip(movie_ids, match_scores), 1)
+        ]
+
+    @classmethod
+    def save_ranked(cls, recommendations, ranked_list):
+        """
+        Insert the RankedMovies of each saved recommendation with one bulk_create. The
+        engine's catalog can be a few seconds behind the Movie table, movies deleted since
+        are left out instead of failing the whole insert.
+        """
+        existing = set(Movie.objects.filter(
+            movie_id__in={int(movie_id) for ranked in ranked_list for movie_id in ranked.movie_ids}
+        ).values_list('movie_id', flat=True))
+        return cls.objects.bulk_create([
+            row
+            for recommendation, ranked in zip(recommendations, ranked_list)
+            for row in cls.ranked(recommendation, ranked.movie_ids, ranked.match_scores)
+            if row.movie_id in existing
+        ])
+
+    def __str__(self):
+        return f"#{self.rank} {self.movie_id} of recommendation {self.recommendation_id}"
+
 # Model to save user preference into
 class Preference(models.Model):
     genre1 = models.CharField(max_length=255, blank=True, null=True)
@@ -68,99 +157,3 @@ class Preference(models.Model):
 class Feedback(models.Model):
     feedback = models.BooleanField()
     recommendation = models.ForeignKey('recommendations.Recommendation', on_delete=models.CASCADE, related_name='feedback')
-        
-
-#------------------------#
-#                        #
-#      ML MODEL          #
-#                        # 
-#------------------------#
-
-# Multi Layered Neural Network which takes user genre preferences and matches movies primarily based on genres and ratings
-
-@register_keras_serializable()
-class EnhancedRecommender(tf.keras.Model):
-    def __init__(self, trainable=True, dtype=None, **kwargs):
-        super().__init__(trainable=trainable, dtype=dtype, **kwargs)
-        
-        self.dropout1 = tf.keras.layers.Dropout(0.2)
-        self.dropout2 = tf.keras.layers.Dropout(0.1)
-        self.dropout3 = tf.keras.layers.Dropout(0.15)
-        
-        self.genre_matching = tf.keras.Sequential([
-            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES) * 2,)),
-            tf.keras.layers.Dense(128, activation='relu'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Dense(64, activation='relu'),
-            tf.keras.layers.Dense(1)
-        ])
-        
-        self.preference_net = tf.keras.Sequential([
-            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES),)),
-            tf.keras.layers.Dense(256, activation='relu'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(128, activation='relu'),
-            tf.keras.layers.Dense(64, activation='relu')
-        ])
-        
-        self.movie_net = tf.keras.Sequential([
-            tf.keras.layers.InputLayer(input_shape=(len(GENRE_CHOICES),)),
-            tf.keras.layers.Dense(256, activation='relu'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(128, activation='relu'),
-            tf.keras.layers.Dense(64, activation='relu')
-        ])
-        
-        # Changed input shape to 2 to match trained model
-        self.metadata_net = tf.keras.Sequential([
-            tf.keras.layers.InputLayer(input_shape=(2,)),  # year and popularity only
-            tf.keras.layers.Dense(64, activation='relu'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Dense(32, activation='relu'),
-            tf.keras.layers.Dense(16, activation='relu')
-        ])
-        
-        self.match_net = tf.keras.Sequential([
-            tf.keras.layers.Dense(256, activation='relu'),
-            tf.keras.layers.Dropout(0.2),
-            tf.keras.layers.Dense(128, activation='relu'),
-            tf.keras.layers.Dense(64, activation='relu'),
-            tf.keras.layers.Dense(1)
-        ])
-
-    def call(self, inputs, training=True):
-        genre_concat = tf.concat([inputs['user_preferences'], inputs['movie_genres']], axis=1)
-        genre_match_score = self.genre_matching(genre_concat)
-        
-        pref_features = self.preference_net(inputs['user_preferences'])
-        pref_features = self.dropout1(pref_features, training=training)
-        
-        movie_features = self.movie_net(inputs['movie_genres'])
-        movie_features = self.dropout2(movie_features, training=training)
-        
-        # Changed to match trained model (removed rating)
-        metadata = tf.concat([inputs['year'], inputs['popularity']], axis=1)
-        metadata_features = self.metadata_net(metadata)
-        metadata_features = self.dropout3(metadata_features, training=training)
-        
-        combined = tf.concat([
-            pref_features,
-            movie_features,
-            metadata_features,
-            genre_match_score  # Removed the * 0.1 scaling factor to match trained model
-        ], axis=1)
-        
-        return self.match_net(combined)
-
-    def get_config(self):
-        config = super().get_config()
-        return config
-
-    @classmethod
-    def from_config(cls, config):
-        return cls(**config)
-
-
-    
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Columns of ratings.csv the import needs, in the narrowest types that hold MovieLens values
+RATING_DTYPES = {'userId': np.int32, 'movieId': np.int32, 'rating': np.float32}
+
+
+class RatingStats:
+    """
+    Per movie rating sums and counts, the rating histogram and the users seen, built up one
+    chunk of ratings.csv at a time. Memory depends on the highest user and movie ids, not
+    on the number of ratings.
+    """
+
+    def __init__(self):
+        self.sums = np.zeros(0, dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # One flag per user id instead of a set of ids
+        self.users = np.zeros(0, dtype=bool)
+        self.histogram = Counter()
+        self.total = 0
+
+    def add(self, user_ids, movie_ids, ratings):
+        if len(movie_ids) == 0:
+            return
+        size = max(len(self.sums), int(movie_ids.max()) + 1)
+        if size > len(self.sums):
+            self.sums = np.concatenate([self.sums, np.zeros(size - len(self.sums))])
+            self.counts = np.concatenate([self.counts, np.zeros(size - len(self.counts), dtype=np.int64)])
+        self.sums += np.bincount(movie_ids, weights=ratings, minlength=size)
+        self.counts += np.bincount(movie_ids, minlength=size)
+
+        size = max(len(self.users), int(user_ids.max()) + 1)
+        if size > len(self.users):
+            self.users = np.concatenate([self.users, np.zeros(size - len(self.users), dtype=bool)])
+        self.users[user_ids] = True
+
+        values, counts = np.unique(ratings, return_counts=True)
+        self.histogram.update(dict(zip(values.tolist(), counts.tolist())))
+        self.total += len(ratings)
+
+    @property
+    def unique_users(self):
+        return int(self.users.sum())
+
+    @property
+    def unique_movies(self):
+        return int(np.count_nonzero(self.counts))
+
+    def rated_movie_ids(self):
+        return np.flatnonzero(self.counts)
+
+    def save(self, path):
+        """Write the stats to an .npz file, atomically so readers never see half a file"""
+        values, counts = zip(*sorted(self.histogram.items())) if self.histogram else ((), ())
+        tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(
+            tmp_path, sums=self.sums, counts=self.counts, users=self.users, total=self.total,
+            histogram_values=np.array(values, dtype=np.float64), histogram_counts=np.array(counts, dtype=np.int64)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        stats = cls()
+        with np.load(path) as data:
+            stats.sums = data['sums']
+            stats.counts = data['counts']
+            stats.users = data['users']
+            stats.total = int(data['total'])
+            stats.histogram = Counter(dict(zip(data['histogram_values'].tolist(), data['histogram_counts'].tolist())))
+        return stats
+
+    def to_frame(self):
+        """movieId, mean_rating and rating_count of every rated movie"""
+        movie_ids = self.rated_movie_ids()
+        return pd.DataFrame({
+            'movieId': movie_ids,
+            'mean_rating': self.sums[movie_ids] / self.counts[movie_ids],
+            'rating_count': self.counts[movie_ids],
+        })
+
+
+def read_movies(movies_csv, engine='c'):
+    """movies.csv as a DataFrame, engine='pyarrow' parses with pyarrow's multithreaded reader"""
+    return pd.read_csv(movies_csv, engine=engine)
+
+
+def read_rating_stats(ratings_csv, chunk_size=1_000_000, engine='c'):
+    """
+    RatingStats of a ratings.csv path or file object, reading chunk_size rows at a time.
+    With engine='pyarrow' blocks of about the same size are parsed on pyarrow's threads.
+    """
+    stats = RatingStats()
+    if engine == 'pyarrow':
+        for user_ids, movie_ids, ratings in _pyarrow_rating_batches(ratings_csv, chunk_size):
+            stats.add(user_ids, movie_ids, ratings)
+        return stats
+
+    chunks = pd.read_csv(ratings_csv, usecols=list(RATING_DTYPES), dtype=RATING_DTYPES, chunksize=chunk_size)
+    for chunk in chunks:
+        stats.add(chunk['userId'].to_numpy(), chunk['movieId'].to_numpy(), chunk['rating'].to_numpy())
+    return stats
+
+
+def _pyarrow_rating_batches(ratings_csv, chunk_size):
+    # pandas can't stream with the pyarrow engine, use pyarrow's own streaming reader
+    import pyarrow as pa
+    from pyarrow import csv
+
+    reader = csv.open_csv(
+        ratings_csv,
+        # ratings.csv lines are about 30 bytes
+        read_options=csv.ReadOptions(block_size=max(chunk_size * 32, 1 << 20), use_threads=True),
+        convert_options=csv.ConvertOptions(
+            include_columns=list(RATING_DTYPES),
+            column_types={column: pa.from_numpy_dtype(dtype) for column, dtype in RATING_DTYPES.items()},
+        ),
+    )
+    for batch in reader:
+        yield tuple(batch.column(column).to_numpy() for column in RATING_DTYPES)
+
+
+def archive_members(archive):
+    """Names of movies.csv and ratings.csv in a MovieLens zip, which keeps them in a folder like ml-latest/"""
+    names = {os.path.basename(name): name for name in archive.namelist()}
+    missing = [name for name in ('movies.csv', 'ratings.csv') if name not in names]
+    if missing:
+        raise FileNotFoundError(f"{archive.filename} has no {' or '.join(missing)}")
+    return names['movies.csv'], names['ratings.csv']
+
+
+def rating_stats_cache_path(cache_dir, archive_version):
+    return os.path.join(cache_dir, f"rating-stats-{archive_version}.npz")
+
+
+def peak_rss_mb():
+    """Highest resident memory of this process so far in MB, None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class PhaseTimer:
+    """Writes the wall time since the previous mark and the peak memory to out, or nothing when out is None"""
+
+    def __init__(self, out=None):
+        self.out = out
+        self.started = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        if self.out is not None:
+            peak = peak_rss_mb()
+            memory = f", peak RSS {peak:,.0f} MB" if peak is not None else ""
+            self.out.write(f"[profile] {phase}: {now - self.last:.2f}s (total {now - self.started:.2f}s){memory}")
+        self.last = now
@@ -0,0 +1,175 @@
+import io
+import zipfile
+
+import numpy as np
+
+from recommendations.constants import GENRES
+
+# Where each sub network of EnhancedRecommender keeps its weights inside model.weights.h5
+# of the saved .keras file, and the order its layers run in. Dropout layers are identity
+# at inference and left out. The names are the ones Keras gave the layers when the
+# model was trained and saved.
+ARCHITECTURE = {
+    'genre_matching': ('genre_matching', [
+        ('dense', 'relu'), ('batch_normalization', None), ('dense_1', 'relu'), ('dense_2', None),
+    ]),
+    'preference_net': ('layers/sequential_1', [
+        ('dense', 'relu'), ('batch_normalization', None), ('dense_1', 'relu'), ('dense_2', 'relu'),
+    ]),
+    'movie_net': ('layers/sequential_2', [
+        ('dense', 'relu'), ('batch_normalization', None), ('dense_1', 'relu'), ('dense_2', 'relu'),
+    ]),
+    'metadata_net': ('layers/sequential_3', [
+        ('dense', 'relu'), ('batch_normalization', None), ('dense_1', 'relu'), ('dense_2', 'relu'),
+    ]),
+    'match_net': ('layers/sequential_4', [
+        ('dense', 'relu'), ('dense_1', 'relu'), ('dense_2', 'relu'), ('dense_3', None),
+    ]),
+}
+
+# Keras BatchNormalization default
+BATCH_NORM_EPSILON = 1e-3
+
+
+class DenseStack:
+    """A chain of Dense layers, each (kernel, bias, relu)"""
+
+    def __init__(self, layers):
+        self.layers = layers
+
+    def __call__(self, x, skip_first_matmul=False):
+        for i, (kernel, bias, relu) in enumerate(self.layers):
+            # The caller may have already applied the first kernel itself
+            x = x + bias if (i == 0 and skip_first_matmul) else x @ kernel + bias
+            if relu:
+                np.maximum(x, 0, out=x)
+        return x
+
+    @property
+    def first_kernel(self):
+        return self.layers[0][0]
+
+
+def fold_layers(weights, steps):
+    """
+    Turn a Dense/BatchNormalization sequence into plain Dense layers.
+
+    BatchNormalization sits after a relu in every sub network, so it can't be merged
+    into the Dense before it. At inference it is an affine map x * scale + shift though,
+    which merges exactly into the Dense that follows it.
+    """
+    layers = []
+    scale, shift = None, None
+    for name, activation in steps:
+        if name.startswith('batch_normalization'):
+            gamma, beta, moving_mean, moving_variance = (weights[f"{name}/vars/{i}"] for i in range(4))
+            scale = gamma / np.sqrt(moving_variance + BATCH_NORM_EPSILON)
+            shift = beta - moving_mean * scale
+            continue
+
+        kernel = weights[f"{name}/vars/0"].astype(np.float32)
+        bias = weights[f"{name}/vars/1"].astype(np.float32)
+        if scale is not None:
+            bias = shift @ kernel + bias
+            kernel = scale[:, None] * kernel
+            scale, shift = None, None
+        layers.append((kernel.astype(np.float32), bias.astype(np.float32), activation == 'relu'))
+    return DenseStack(layers)
+
+
+def as_model_input(x):
+    # The saved model runs under a mixed_float16 policy, so Keras rounds every input to
+    # float16 before the float32 sub networks see it. Do the same to get the same scores.
+    return np.asarray(x, dtype=np.float32).astype(np.float16).astype(np.float32)
+
+
+class NumpyRecommender:
+    """
+    Inference only copy of EnhancedRecommender that runs on NumPy.
+
+    Has the same call() and tower methods as the Keras model so utils.py can use
+    either one, but needs neither TensorFlow nor Keras at runtime.
+    """
+
+    def __init__(self, nets):
+        self.genre_matching = nets['genre_matching']
+        self.preference_net = nets['preference_net']
+        self.movie_net = nets['movie_net']
+        self.metadata_net = nets['metadata_net']
+        self.match_net = nets['match_net']
+
+    @classmethod
+    def from_keras_file(cls, path):
+        import h5py
+
+        with zipfile.ZipFile(path) as archive:
+            weights_file = io.BytesIO(archive.read('model.weights.h5'))
+
+        nets = {}
+        with h5py.File(weights_file, 'r') as weights:
+            for net, (group, steps) in ARCHITECTURE.items():
+                nets[net] = fold_layers(
+                    {name: np.asarray(dataset) for name, dataset in _datasets(weights[group]['layers'])},
+                    steps
+                )
+        return cls(nets)
+
+    def __call__(self, inputs, training=False):
+        return self.call(inputs)
+
+    def call(self, inputs, training=False):
+        user_preferences = as_model_input(inputs['user_preferences'])
+        movie_features, metadata_features = self.movie_tower(
+            inputs['movie_genres'], inputs['year'], inputs['popularity']
+        )
+        return self.joint_score(
+            user_preferences,
+            self.preference_tower(user_preferences),
+            inputs['movie_genres'],
+            movie_features,
+            metadata_features
+        )
+
+    def movie_tower(self, movie_genres, year, popularity):
+        movie_features = self.movie_net(as_model_input(movie_genres))
+        metadata = np.concatenate([as_model_input(year), as_model_input(popularity)], axis=1)
+        return movie_features, self.metadata_net(metadata)
+
+    def preference_tower(self, user_preferences):
+        return self.preference_net(as_model_input(user_preferences))
+
+    def joint_score(self, user_preferences, pref_features, movie_genres, movie_features, metadata_features):
+        """
+        user_preferences and pref_features can be one row for all candidates or one row each.
+        The first layer of both heads is split by input block so the user part is only
+        multiplied once per row given instead of once per candidate.
+        """
+        genre_count = len(GENRES)
+        user_preferences = as_model_input(user_preferences)
+        movie_genres = as_model_input(movie_genres)
+
+        kernel = self.genre_matching.first_kernel
+        hidden = user_preferences @ kernel[:genre_count] + movie_genres @ kernel[genre_count:]
+        genre_match_score = self.genre_matching(hidden, skip_first_matmul=True)
+
+        kernel = self.match_net.first_kernel
+        pref_size = pref_features.shape[1]
+        movie_size = movie_features.shape[1]
+        metadata_size = metadata_features.shape[1]
+        offset = pref_size + movie_size
+        hidden = (
+            pref_features @ kernel[:pref_size]
+            + movie_features @ kernel[pref_size:offset]
+            + metadata_features @ kernel[offset:offset + metadata_size]
+            + genre_match_score @ kernel[offset + metadata_size:]
+        )
+        return self.match_net(hidden, skip_first_matmul=True)
+
+
+def _datasets(group, prefix=''):
+    for name, item in group.items():
+        path = f"{prefix}{name}"
+        if hasattr(item, 'items'):
+            yield from _datasets(item, f"{path}/")
+        else:
+            yield path, item
@@ -0,0 +1,111 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+
+# Pages go from newest to oldest. The cursor holds the (date_created, id) of the row a page
+# starts after, so a page is one index range scan however deep it is, without OFFSET.
+OLDER = 'o'
+NEWER = 'n'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, recommendation):
+    data = json.dumps([direction, recommendation.date_created.isoformat(), recommendation.id])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(direction, date_created, id) of a token from encode_cursor()"""
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, date_created, recommendation_id = json.loads(data)
+        date_created = datetime.fromisoformat(date_created)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid page cursor")
+    if direction not in (OLDER, NEWER) or not isinstance(recommendation_id, int):
+        raise InvalidCursor("Invalid page cursor")
+    return direction, date_created, recommendation_id
+
+
+class KeysetPage:
+    """One page of keyset_page(), with the tokens of the pages around it"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        # Older rows
+        self.next_cursor = next_cursor
+        # Newer rows
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_page(queryset, cursor=None, page_size=10):
+    """
+    Page of queryset, newest first, starting after the cursor token. Fetches one extra
+    row to know whether there is a page after this one, and never counts the table.
+    Raises InvalidCursor for tokens that weren't made by this module.
+    """
+    if cursor is None:
+        direction, rows = OLDER, queryset.order_by('-date_created', '-id')
+    else:
+        direction, date_created, recommendation_id = decode_cursor(cursor)
+        if direction == OLDER:
+            rows = queryset.filter(date_created__lte=date_created).filter(
+                Q(date_created__lt=date_created) | Q(id__lt=recommendation_id)
+            ).order_by('-date_created', '-id')
+        else:
+            rows = queryset.filter(date_created__gte=date_created).filter(
+                Q(date_created__gt=date_created) | Q(id__gt=recommendation_id)
+            ).order_by('date_created', 'id')
+
+    rows = list(rows[:page_size + 1])
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == NEWER:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows)
+
+    # Coming from a cursor means there are rows on the other side of this page
+    has_older = more if direction == OLDER else True
+    has_newer = cursor is not None if direction == OLDER else more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(OLDER, rows[-1]) if has_older else None,
+        previous_cursor=encode_cursor(NEWER, rows[0]) if has_newer else None,
+    )
+
+
+def estimated_count(model):
+    """
+    Rows in model's table. On PostgreSQL this is the planner's estimate, which is free to
+    read, elsewhere an exact COUNT(*).
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been analyzed
+        if row and row[0] >= 0:
+            return row[0]
+    return model.objects.count()
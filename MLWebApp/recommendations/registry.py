@@ -0,0 +1,330 @@
+import hashlib
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from recommendations import utils
+from recommendations.batching import MicroBatcher
+from recommendations.cache import ScoreCache, preference_signature
+from recommendations.catalog import CatalogChangeLog, patch_catalog
+from recommendations.genre_index import GenreIndex
+
+
+def file_version(path):
+    """Short content hash of a model file, used to tell deployed models apart"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def catalog_version(movies_df):
+    """Short hash of the catalog columns that feed the model and the genre filters"""
+    columns = movies_df[['movie_id', 'count', 'mean', 'year'] + utils.GENRE_CHOICES]
+    return hashlib.sha256(columns.to_numpy(dtype='float64').tobytes()).hexdigest()[:12]
+
+
+# Everything a request needs to score movies. Shared read-only between requests.
+class ModelHandle:
+    def __init__(self, model, movies_df, version, generation, loaded_at, load_seconds,
+                 towers=None, score_cache=None, genre_index=None, catalog_change=0, seen_changes=frozenset()):
+        self.model = model
+        self.movies_df = movies_df
+        # Latest CatalogChange id the catalog includes
+        self.catalog_change = catalog_change
+        # Ids of recent changes it includes, later ones can commit with lower ids
+        self.seen_changes = seen_changes
+        # Genre bitmasks used to pick the candidate rows of a request
+        self.genre_index = genre_index
+        # Precomputed movie side activations, None when scoring runs the full network
+        self.towers = towers
+        # Filtered candidates and model scores per preference signature, tied to this model and catalog
+        self.score_cache = score_cache
+        self.version = version
+        self.generation = generation
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        # Shares model calls between concurrent requests when RECOMMENDER_MICRO_BATCHING is on
+        self.batcher = None
+
+    def score_batch(self, requests):
+        """Model scores for a list of batching.ScoringRequest, used by the batcher"""
+        return utils.score_candidates_batch(
+            self.model, self.movies_df, [(request.genre_preferences, request.rows) for request in requests],
+            self.towers, self.genre_index
+        )
+
+    def score_preferences(self, preference_list):
+        """
+        CandidatePool for each preference vector. Cached ones are reused, the rest are
+        scored with one batched model call and added to the cache.
+        """
+        scored = {}
+        missing = {}
+        for genre_preferences in preference_list:
+            signature = preference_signature(genre_preferences)
+            if signature in scored or signature in missing:
+                continue
+            entry = self.score_cache.get(signature)
+            if entry is None:
+                missing[signature] = genre_preferences
+            else:
+                scored[signature] = entry
+
+        if missing:
+            entries = utils.score_preferences_batch(
+                self.model, self.movies_df, list(missing.values()), self.towers, self.genre_index
+            )
+            for signature, entry in zip(missing, entries):
+                pool = utils.candidate_pool(self.movies_df, self.genre_index, entry)
+                self.score_cache.put(signature, pool)
+                scored[signature] = pool
+        return [scored[preference_signature(genre_preferences)] for genre_preferences in preference_list]
+
+    def recommend_batch(self, preference_list, top_k=10, seed=None):
+        """
+        RankedMovies, or None when nothing matches, for each preference vector. All are
+        scored with one batched model call, seed gives each its own reproducible stream.
+        """
+        results = []
+        for i, (genre_preferences, scored) in enumerate(zip(preference_list, self.score_preferences(preference_list))):
+            if len(scored) == 0:
+                results.append(None)
+                continue
+            results.append(utils.rank_scored(
+                self.movies_df, self.genre_index, scored, genre_preferences, top_k,
+                None if seed is None else [seed, i]
+            ))
+        return results
+
+    def warm(self, preference_list):
+        """
+        Score the preference vectors that aren't in the score cache yet with one batched
+        model call, so recommend() finds them cached. preference_list goes from most to
+        least important, when more are missing than the cache has room for only the first
+        ones are scored. Returns how many were scored and how many were skipped.
+        """
+        cached, missing = set(), {}
+        for genre_preferences in preference_list:
+            signature = preference_signature(genre_preferences)
+            if signature in self.score_cache:
+                cached.add(signature)
+            else:
+                missing.setdefault(signature, genre_preferences)
+
+        # Room left without evicting the listed signatures that are already cached
+        room = max(self.score_cache.max_entries - len(cached), 0)
+        warmed = list(missing.values())[:room]
+        if warmed:
+            # Least important first, so the most important end up most recently used
+            self.score_preferences(warmed[::-1])
+        return len(warmed), len(missing) - len(warmed)
+
+    def recommend(self, genre_preferences, top_k=10, seed=None):
+        """RankedMovies for a preference vector, or None when no movie matches"""
+        return utils.recommend(
+            self.model, self.movies_df, genre_preferences, top_k,
+            towers=self.towers, cache=self.score_cache, genre_index=self.genre_index,
+            seed=seed, batcher=self.batcher
+        )
+
+    def stats(self):
+        stats = {
+            'version': self.version,
+            'generation': self.generation,
+            'loaded_at': self.loaded_at.isoformat(),
+            'load_seconds': round(self.load_seconds, 3),
+            'movies': len(self.movies_df),
+            'catalog_change': self.catalog_change,
+            'backend': type(self.model).__name__,
+            'precomputed_towers': self.towers is not None,
+        }
+        if self.score_cache is not None:
+            stats['score_cache'] = {
+                'entries': len(self.score_cache),
+                'max_entries': self.score_cache.max_entries,
+                'hits': self.score_cache.hits,
+                'misses': self.score_cache.misses,
+            }
+        if self.batcher is not None:
+            stats['batcher'] = self.batcher.stats()
+        return stats
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def __repr__(self):
+        return (f"<ModelHandle version={self.version} generation={self.generation} "
+                f"movies={len(self.movies_df)} load_seconds={self.load_seconds:.2f}>")
+
+
+class ModelRegistry:
+    """
+    Process wide holder for the recommender model and movie catalog.
+
+    The first call to get() loads both, every later call returns the same handle.
+    Loading is guarded by a lock so concurrent requests on a threaded WSGI/ASGI
+    worker only load once.
+
+    With the default loader, get() also checks the CatalogChange log at most every
+    RECOMMENDER_CATALOG_REFRESH_SECONDS and patches changed movies into a new handle.
+    """
+
+    def __init__(self, loader=None, model_path=None, change_log=None):
+        self._loader = loader or utils.load_model
+        self._model_path = model_path or utils.MODEL_PATH
+        # Custom loaders bring their own catalog, only the ORM one is tracked unless told otherwise
+        if change_log is None and loader is None:
+            change_log = CatalogChangeLog()
+        self._change_log = change_log
+        self._lock = threading.Lock()
+        self._handle = None
+        self._generation = 0
+        self._checked_at = 0
+
+    def get(self):
+        handle = self._handle
+        if handle is not None:
+            if self._refresh_due():
+                return self.refresh()
+            return handle
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if self._handle is None:
+                self._handle = self._load()
+            return self._handle
+
+    def is_loaded(self):
+        return self._handle is not None
+
+    def reset(self):
+        """Drop the loaded handle, the next get() loads a fresh copy"""
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+            self._handle = None
+
+    def refresh(self):
+        """
+        Bring the loaded catalog up to date with the CatalogChange log and return the
+        current handle. A few changed movies are patched in, a change of the whole
+        catalog or more than RECOMMENDER_CATALOG_PATCH_LIMIT movies reloads everything.
+        """
+        with self._lock:
+            handle = self._handle
+            self._checked_at = time.monotonic()
+            if handle is None or self._change_log is None:
+                return handle
+
+            changes = self._change_log.since(handle.catalog_change, handle.seen_changes)
+            if not changes:
+                return handle
+
+            latest = max(handle.catalog_change, changes[-1][0])
+            movie_ids = {movie_id for _, movie_id in changes}
+            if None in movie_ids or len(movie_ids) > getattr(settings, 'RECOMMENDER_CATALOG_PATCH_LIMIT', 1000):
+                print(f"Catalog changed up to {latest}, reloading the model registry")
+                self._handle = self._load()
+            else:
+                # Only ids still in the overlap window can show up again
+                seen = (handle.seen_changes | {change_id for change_id, _ in changes}) & self._change_log.recent()
+                self._handle = self._patch(handle, movie_ids, latest, frozenset(seen))
+            handle.close()
+            return self._handle
+
+    def _refresh_due(self):
+        if self._change_log is None:
+            return False
+        interval = getattr(settings, 'RECOMMENDER_CATALOG_REFRESH_SECONDS', 5)
+        return interval is not None and time.monotonic() - self._checked_at >= interval
+
+    def _load(self):
+        started = time.perf_counter()
+        # Read before the catalog so changes made while it loads are applied again, not missed
+        catalog_change = self._change_log.latest() if self._change_log is not None else 0
+        seen_changes = frozenset(self._change_log.recent()) if self._change_log is not None else frozenset()
+        self._checked_at = time.monotonic()
+        model, movies_df = self._loader()
+        if model is None or movies_df is None:
+            raise Exception("Model or movies data could not be loaded.")
+
+        towers = None
+        if getattr(settings, 'RECOMMENDER_PRECOMPUTE_MOVIE_FEATURES', True):
+            towers = utils.precompute_movie_towers(model, movies_df)
+
+        handle = self._make_handle(
+            model, movies_df, towers, GenreIndex.from_movies_df(movies_df), catalog_change, started, seen_changes
+        )
+        print(f"Model registry loaded {handle}")
+        return handle
+
+    def _patch(self, handle, movie_ids, catalog_change, seen_changes):
+        """New handle with movie_ids patched into the catalog, towers and genre index of handle"""
+        started = time.perf_counter()
+        updated = self._change_log.movies(movie_ids)
+        deleted = movie_ids - set(updated['movie_id'])
+        patch = patch_catalog(handle.movies_df, updated, deleted)
+
+        towers = None
+        if handle.towers is not None:
+            towers = utils.patch_movie_towers(
+                handle.model, patch.movies_df, handle.towers, patch.source_rows, patch.dirty_rows
+            )
+        genre_index = handle.genre_index.patched(
+            patch.source_rows,
+            patch.changed_rows,
+            patch.movies_df[utils.GENRE_CHOICES].to_numpy(dtype=np.float32)[patch.changed_rows],
+            patch.movies_df['count'].to_numpy(),
+        )
+
+        patched = self._make_handle(
+            handle.model, patch.movies_df, towers, genre_index, catalog_change, started, seen_changes
+        )
+        print(f"Model registry patched {len(movie_ids)} movies ({len(patch.dirty_rows)} rows rescored) into {patched}")
+        return patched
+
+    def _make_handle(self, model, movies_df, towers, genre_index, catalog_change, started, seen_changes=frozenset()):
+        version = file_version(self._model_path)
+        score_cache = ScoreCache(
+            max_entries=getattr(settings, 'RECOMMENDER_SCORE_CACHE_SIZE', 128),
+            path=getattr(settings, 'RECOMMENDER_SCORE_CACHE_PATH', None),
+            version=f"{version}:{catalog_version(movies_df)}",
+        )
+        try:
+            loaded = score_cache.load()
+            if loaded:
+                print(f"Loaded {loaded} cached preference scores from {score_cache.path}")
+        except Exception as e:
+            print(f"Error loading score cache: {e}")
+
+        self._generation += 1
+        handle = ModelHandle(
+            model=model,
+            movies_df=movies_df,
+            towers=towers,
+            score_cache=score_cache,
+            genre_index=genre_index,
+            catalog_change=catalog_change,
+            seen_changes=seen_changes,
+            version=version,
+            generation=self._generation,
+            loaded_at=timezone.now(),
+            load_seconds=time.perf_counter() - started,
+        )
+        if getattr(settings, 'RECOMMENDER_MICRO_BATCHING', False):
+            handle.batcher = MicroBatcher(
+                handle.score_batch,
+                max_wait_ms=getattr(settings, 'RECOMMENDER_BATCH_MAX_WAIT_MS', 5),
+                max_batch_rows=getattr(settings, 'RECOMMENDER_BATCH_MAX_ROWS', 100_000),
+            )
+        return handle
+
+
+# Shared by every view in this worker process
+model_registry = ModelRegistry()
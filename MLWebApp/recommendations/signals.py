@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recommendations.fragments import invalidate_all, invalidate_recommendations
+from recommendations.models import CatalogChange, Feedback, Movie, Recommendation
+
+
+# Saves and deletes through the ORM (admin, shell, views) are logged here. Bulk
+# operations skip signals, commands that use them call record_catalog_change() themselves.
+# A new change also moves every cached movie list to new keys, see fragments.py.
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def log_movie_change(sender, instance, **kwargs):
+    CatalogChange.objects.create(movie_id=instance.movie_id)
+
+
+@receiver(post_save, sender=Feedback)
+def invalidate_feedback_fragment(sender, instance, **kwargs):
+    invalidate_recommendations([instance.recommendation])
+
+
+@receiver(post_delete, sender=Recommendation)
+def invalidate_recommendation_fragment(sender, instance, **kwargs):
+    invalidate_recommendations([instance])
+
+
+def record_catalog_change(movie_ids=None):
+    """Log changed movies, or a change of the whole catalog when movie_ids is None"""
+    if movie_ids is None:
+        # Workers reload everything for it, older entries don't matter anymore
+        change = CatalogChange.objects.create(movie_id=None)
+        CatalogChange.objects.filter(id__lt=change.id).delete()
+        invalidate_all()
+        return
+    CatalogChange.objects.bulk_create([CatalogChange(movie_id=movie_id) for movie_id in movie_ids])
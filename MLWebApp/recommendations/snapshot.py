@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from recommendations.models import CatalogChange, Movie
+from recommendations.utils import CATALOG_FIELDS
+
+SNAPSHOT_FORMAT = 3
+MANIFEST_NAME = 'manifest.json'
+
+
+def catalog_fingerprint():
+    """
+    Cheap version of the Movie table: the latest CatalogChange id, the row count and the
+    highest movie id, in one query on indexed columns.
+
+    Saves through the ORM, import_movies and record_catalog_change() all log a change.
+    Edits that skip the log, like .update() from a shell, are only caught by
+    `build_catalog_snapshot --verify`, which compares catalog_hash() with the snapshot.
+    """
+    stats = Movie.objects.aggregate(rows=Count('movie_id'), max_id=Max('movie_id'))
+    stats['change'] = CatalogChange.objects.aggregate(latest=Max('id'))['latest'] or 0
+    return hashlib.sha256(json.dumps(stats, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def catalog_hash():
+    """Hash of every column the catalog frame is built from, reads the whole Movie table"""
+    digest = hashlib.sha256()
+    rows = Movie.objects.order_by('movie_id').values_list(*CATALOG_FIELDS)
+    for row in rows.iterator(chunk_size=10000):
+        digest.update(repr(row).encode())
+    return digest.hexdigest()[:12]
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def write_snapshot(movies_df, directory, fingerprint, content_hash=None):
+    """
+    Write every column of a catalog frame as its own .npy file under a new directory in
+    directory and point directory/manifest.json at it.
+
+    Every write gets its own folder, named after the fingerprint and the time it was
+    written, and the manifest is swapped in last. Readers only ever see a complete
+    snapshot, and rewriting a version (--force, or a snapshot with missing files)
+    never touches the folder it replaces. Older snapshots are removed, workers that
+    still have them mapped keep reading the unlinked files. The manifest keeps
+    catalog_hash() (computed here unless passed in) for --verify.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snapshot_name = f"{fingerprint}-{time.time_ns()}-{os.getpid()}"
+    tmp_path = os.path.join(directory, f"{snapshot_name}.tmp")
+    os.makedirs(tmp_path)
+
+    columns = {}
+    for i, column in enumerate(movies_df.columns):
+        values = movies_df[column].to_numpy()
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            # Fixed width unicode so the file can be memory mapped without pickling
+            values = values.astype(str)
+        file_name = f"{i:03d}.npy"
+        np.save(os.path.join(tmp_path, file_name), np.ascontiguousarray(values), allow_pickle=False)
+        columns[column] = file_name
+    os.rename(tmp_path, os.path.join(directory, snapshot_name))
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'fingerprint': fingerprint,
+        'content_hash': content_hash or catalog_hash(),
+        'directory': snapshot_name,
+        'rows': len(movies_df),
+        'created_at': timezone.now().isoformat(),
+        'columns': columns,
+    }
+    manifest_tmp = os.path.join(directory, f"{MANIFEST_NAME}.tmp-{os.getpid()}")
+    with open(manifest_tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_tmp, os.path.join(directory, MANIFEST_NAME))
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name != snapshot_name and not name.endswith('.tmp') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return manifest
+
+
+def read_snapshot(directory, manifest=None):
+    """Catalog frame whose numeric columns are read-only memory maps of the snapshot files"""
+    manifest = manifest or read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No catalog snapshot in {directory}")
+
+    path = os.path.join(directory, manifest['directory'])
+    columns = {
+        column: np.load(os.path.join(path, file_name), mmap_mode='r', allow_pickle=False)
+        for column, file_name in manifest['columns'].items()
+    }
+    # copy=False keeps each column backed by its map instead of consolidating into new blocks
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_catalog_snapshot(directory, build_catalog):
+    """
+    Memory map the snapshot in directory if it matches the Movie table, otherwise build
+    the frame with build_catalog(), write a new snapshot and map that.
+    """
+    fingerprint = catalog_fingerprint()
+    manifest = read_manifest(directory)
+    if manifest is not None and manifest['fingerprint'] == fingerprint:
+        try:
+            return read_snapshot(directory, manifest)
+        except FileNotFoundError:
+            # Replaced by another process between reading the manifest and the files
+            pass
+
+    print(f"Catalog snapshot in {directory} is missing or stale, rebuilding it")
+    manifest = write_snapshot(build_catalog(), directory, fingerprint)
+    try:
+        return read_snapshot(directory, manifest)
+    except FileNotFoundError:
+        # Another process wrote a snapshot at the same time and removed this one, use its
+        return read_snapshot(directory)
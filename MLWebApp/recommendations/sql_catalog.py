@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from django.db.models import F, Max, Min
+
+from recommendations import utils
+from recommendations.cache import ScoredCandidates
+from recommendations.genre_index import GENRE_BITS, MIN_RATING_COUNT, GenreIndex, preference_bitmasks
+from recommendations.models import Movie
+
+
+def candidate_movies(genre_preferences, min_count=MIN_RATING_COUNT):
+    """
+    Movies that have every selected genre, none of the excluded ones and enough ratings,
+    filtered by the database on Movie.genre_mask and the count index.
+    GenreIndex.candidates() does the same on a catalog in memory.
+    """
+    required, excluded = preference_bitmasks(genre_preferences)
+    movies = Movie.objects.filter(count__gte=min_count)
+    if required:
+        movies = movies.annotate(required_bits=F('genre_mask').bitand(required)).filter(required_bits=required)
+    if excluded:
+        movies = movies.annotate(excluded_bits=F('genre_mask').bitand(excluded)).filter(excluded_bits=0)
+    return movies
+
+
+def catalog_stats():
+    """Year range and highest rating count of the whole catalog, read from the count and year indexes"""
+    return Movie.objects.aggregate(min_year=Min('year'), max_year=Max('year'), max_count=Max('count'))
+
+
+def load_candidates(genre_preferences):
+    """Catalog frame of only the candidate movies of a preference, with the features the model uses"""
+    rows = list(candidate_movies(genre_preferences).values(*utils.CATALOG_FIELDS, 'genre_mask'))
+    movies_df = pd.DataFrame(rows, columns=utils.CATALOG_FIELDS + ['genre_mask'])
+    masks = movies_df.pop('genre_mask').to_numpy(dtype=np.uint32)
+    # The one-hots come straight from the masks, no need to parse genre strings
+    genres = ((masks[:, None] & GENRE_BITS) > 0).astype(np.float32)
+    movies_df[utils.GENRE_CHOICES] = genres
+    utils.add_catalog_features(movies_df, catalog_stats())
+    return movies_df, GenreIndex(genres, movies_df['count'].to_numpy(), masks)
+
+
+class SqlCatalogEngine:
+    """
+    Drop in for ModelRegistry in the views for RECOMMENDER_LOW_MEMORY_CATALOG. Only the
+    model is kept in memory, every request loads its candidate movies with one indexed
+    query and scores them with the full network. Nothing is cached, so edited movies are
+    picked up by the next request.
+    """
+
+    def __init__(self, loader=None):
+        self._loader = loader or utils.load_recommender
+        self._lock = threading.Lock()
+        self._model = None
+        self.requests = 0
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._loader()
+        return self
+
+    def is_loaded(self):
+        return self._model is not None
+
+    def reset(self):
+        with self._lock:
+            self._model = None
+
+    def recommend(self, genre_preferences, top_k=10, seed=None):
+        """RankedMovies whose rows index only this request's candidates, or None"""
+        self.requests += 1
+        movies_df, genre_index = load_candidates(genre_preferences)
+        if len(movies_df) == 0:
+            return None
+        rows = np.arange(len(movies_df), dtype=np.int32)
+        scores = utils.score_candidates(self._model, movies_df, rows, genre_preferences, genre_index=genre_index)
+        return utils.rank_scored(
+            movies_df, genre_index, ScoredCandidates(rows, scores), genre_preferences, top_k, seed
+        )
+
+    def recommend_batch(self, preference_list, top_k=10, seed=None):
+        # Each preference has its own candidates, there is no shared model call to batch
+        return [
+            self.recommend(genre_preferences, top_k, None if seed is None else [seed, i])
+            for i, genre_preferences in enumerate(preference_list)
+        ]
+
+    def stats(self):
+        return {'catalog': 'sql', 'backend': type(self._model).__name__, 'requests': self.requests}
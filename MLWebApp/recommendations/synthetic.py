@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from recommendations.constants import GENRES
+
+
+def synthetic_movies_df(size, seed=0):
+    """Random catalog frame with the columns load_model() builds, for tests and benchmarks"""
+    rng = np.random.default_rng(seed)
+    genres = (rng.random((size, len(GENRES))) < 0.2).astype(np.float32)
+    movies_df = pd.DataFrame(genres, columns=GENRES)
+    movies_df['movie_id'] = np.arange(1, size + 1)
+    movies_df['title'] = [f"Movie {i}" for i in range(1, size + 1)]
+    movies_df['genres'] = ['|'.join(g for g, on in zip(GENRES, row) if on) for row in genres]
+    movies_df['mean'] = rng.uniform(0.5, 5.0, size)
+    movies_df['count'] = rng.integers(0, 500, size)
+    movies_df['year'] = rng.integers(1920, 2024, size)
+    movies_df['year_normalized'] = (movies_df['year'] - 1920) / (2023 - 1920)
+    movies_df['popularity'] = (0.3 * movies_df['count'] / 500 + 0.7 * movies_df['mean'] / 5.0).astype(np.float32)
+    movies_df['weighted_rating'] = movies_df['mean'] * np.log1p(movies_df['count'])
+    return movies_df
@@ -0,0 +1,99 @@
+import base64
+import json
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from recommendations.models import Movie, Recommendation
+from recommendations.registry import model_registry
+from recommendations.sql_catalog import SqlCatalogEngine
+from recommendations.views import RecommendationEngineView
+from user.models import MyUser
+
+
+@override_settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=None)
+class RecommendApiTest(TestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='testuser', email='test@test.com', password='12345')
+        self.client.login(email='test@test.com', password='12345')
+        for movie_id, genres in enumerate(['Action|Sci-Fi', 'Action|Thriller', 'Comedy|Romance', 'Comedy', 'Drama'], 1):
+            Movie.objects.create(movie_id=movie_id, title=f'Movie {movie_id}', genres=genres, mean=4.0, count=100, year=2000 + movie_id)
+        model_registry.reset()
+
+    def post(self, body):
+        return self.client.post(reverse('recommendations:recommend_api'), data=json.dumps(body), content_type='application/json')
+
+    def test_batch_of_preferences(self):
+        response = self.post({
+            'preferences': [
+                {'genres': ['Action'], 'include_other_genres': True},
+                {'genres': ['Comedy'], 'include_other_genres': False},
+                {'genres': ['Western']},
+            ],
+            'top_k': 2,
+            'seed': 1,
+        })
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual({movie['movie_id'] for movie in results[0]['movies']}, {1, 2})
+        self.assertEqual([movie['movie_id'] for movie in results[1]['movies']], [4])
+        self.assertEqual(results[1]['movies'][0]['title'], 'Movie 4')
+        self.assertEqual(results[1]['movies'][0]['matched_genres'], ['Comedy'])
+        self.assertEqual(results[2]['movies'], [])
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_single_preference_with_persist(self):
+        response = self.post({'genres': ['Action'], 'persist': True})
+        result = response.json()['results'][0]
+        recommendation = Recommendation.objects.get(id=result['recommendation_id'])
+        self.assertEqual(recommendation.user, self.user)
+        self.assertEqual(recommendation.preference.genre1, 'Action')
+        self.assertEqual(set(recommendation.movies.values_list('movie_id', flat=True)), {1, 2})
+
+    def test_seed_is_reproducible(self):
+        body = {'preferences': [{'genres': ['Action']}], 'seed': 5}
+        self.assertEqual(self.post(body).json(), self.post(body).json())
+
+    def test_validation_errors(self):
+        self.assertEqual(self.post({'genres': ['Nope']}).status_code, 400)
+        self.assertEqual(self.post({'genres': []}).status_code, 400)
+        self.assertEqual(self.post({'genres': ['Action'], 'top_k': 0}).status_code, 400)
+        self.assertEqual(self.post({'preferences': []}).status_code, 400)
+        response = self.client.post(reverse('recommendations:recommend_api'), data='nope', content_type='application/json')
+        self.assertEqual(response.json(), {'error': 'Body must be JSON'})
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.post({'genres': ['Action']}).status_code, 401)
+
+    def basic_auth(self, password='12345'):
+        return 'Basic ' + base64.b64encode(f'test@test.com:{password}'.encode()).decode()
+
+    def test_basic_auth_without_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('recommendations:recommend_api')
+        body = json.dumps({'genres': ['Action'], 'persist': True})
+        response = client.post(url, data=body, content_type='application/json', HTTP_AUTHORIZATION=self.basic_auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Recommendation.objects.get().user, self.user)
+
+        response = client.post(url, data=body, content_type='application/json', HTTP_AUTHORIZATION=self.basic_auth('nope'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_session_needs_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(email='test@test.com', password='12345')
+        response = client.post(
+            reverse('recommendations:recommend_api'), data=json.dumps({'genres': ['Action']}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_uses_configured_engine(self):
+        with mock.patch.object(RecommendationEngineView, 'registry', SqlCatalogEngine()):
+            results = self.post({'preferences': [{'genres': ['Action']}, {'genres': ['Western']}], 'seed': 1}).json()['results']
+        self.assertEqual({movie['movie_id'] for movie in results[0]['movies']}, {1, 2})
+        self.assertEqual(results[1]['movies'], [])
+        # The full catalog was never loaded into this process
+        self.assertFalse(model_registry.is_loaded())
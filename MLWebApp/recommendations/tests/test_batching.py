@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+from django.test import SimpleTestCase
+from recommendations.batching import MicroBatcher
+
+
+class FakeScorer:
+    """Scores each row as preference_sum * 1000 + row, and records the batch sizes"""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return [request.genre_preferences.sum() * 1000 + request.rows for request in batch]
+
+
+class MicroBatcherTest(SimpleTestCase):
+
+    def run_concurrently(self, batcher, count):
+        results = {}
+
+        def submit(i):
+            results[i] = batcher.score(np.full(19, i, dtype=np.float32), np.arange(i, i + 3), timeout=5)
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_requests_share_batches(self):
+        scorer = FakeScorer()
+        batcher = MicroBatcher(scorer, max_wait_ms=50)
+        results = self.run_concurrently(batcher, 12)
+        batcher.close()
+
+        for i, scores in results.items():
+            np.testing.assert_array_equal(scores, i * 19 * 1000 + np.arange(i, i + 3))
+        self.assertLess(len(scorer.batch_sizes), 12)
+        stats = batcher.stats()
+        self.assertEqual(stats['requests'], 12)
+        self.assertEqual(stats['rows'], 36)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_max_batch_rows(self):
+        scorer = FakeScorer()
+        batcher = MicroBatcher(scorer, max_wait_ms=50, max_batch_rows=6)
+        self.run_concurrently(batcher, 8)
+        batcher.close()
+        self.assertTrue(all(size <= 2 for size in scorer.batch_sizes))
+
+    def test_errors_reach_every_caller(self):
+        def failing(batch):
+            raise ValueError("model failed")
+
+        batcher = MicroBatcher(failing, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.score(np.zeros(19), np.arange(3), timeout=5)
+        batcher.close()
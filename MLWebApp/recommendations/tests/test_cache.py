@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+from recommendations.cache import ScoreCache, ScoredCandidates, preference_signature, signature_preferences
+
+
+def make_entry(size):
+    return ScoredCandidates(np.arange(size), np.linspace(0, 1, size))
+
+
+class PreferenceSignatureTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        genre_preferences = np.full(19, -1, dtype=np.float32)
+        genre_preferences[[0, 15]] = 1
+        signature = preference_signature(genre_preferences)
+        self.assertEqual(signature, '+--------------+---')
+        np.testing.assert_array_equal(signature_preferences(signature), genre_preferences)
+
+
+class ScoreCacheTest(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = ScoreCache(max_entries=2)
+        cache.put('a', make_entry(1))
+        cache.put('b', make_entry(2))
+        cache.get('a')
+        cache.put('c', make_entry(3))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'scores.npz')
+            cache = ScoreCache(path=path, version='v1')
+            cache.put('a', make_entry(5))
+            self.assertTrue(cache.save())
+
+            restored = ScoreCache(path=path, version='v1')
+            self.assertEqual(restored.load(), 1)
+            np.testing.assert_array_equal(restored.get('a').rows, np.arange(5))
+
+            stale = ScoreCache(path=path, version='v2')
+            self.assertEqual(stale.load(), 0)
+            self.assertEqual(len(stale), 0)
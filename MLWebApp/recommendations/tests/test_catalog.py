@@ -0,0 +1,157 @@
+import numpy as np
+from django.test import TestCase
+from recommendations.catalog import CatalogChangeLog, patch_catalog
+from recommendations.genre_index import GenreIndex
+from recommendations.models import CatalogChange, Movie
+from recommendations.numpy_engine import NumpyRecommender
+from recommendations.registry import ModelRegistry
+from recommendations.signals import record_catalog_change
+from recommendations.utils import GENRE_CHOICES, MODEL_PATH, load_catalog, precompute_movie_towers
+
+MOVIES = [
+    (1, 'Heat (1995)', 'Action|Crime|Thriller', 4.1, 50, 1995),
+    (2, 'Toy Story (1995)', 'Animation|Children|Comedy', 3.9, 80, 1995),
+    (3, 'Alien (1979)', 'Horror|Sci-Fi', 4.0, 60, 1979),
+    (4, 'Casablanca (1942)', 'Drama|Romance|War', 4.3, 70, 1942),
+    (5, 'Up (2009)', 'Adventure|Animation|Children', 3.8, 40, 2009),
+]
+
+
+def sorted_frame(movies_df):
+    return movies_df.sort_values('movie_id').reset_index(drop=True)
+
+
+class CatalogPatchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for movie_id, title, genres, mean, count, year in MOVIES:
+            Movie.objects.create(movie_id=movie_id, title=title, genres=genres, mean=mean, count=count, year=year)
+
+    def assert_matches_reload(self, patched):
+        expected = sorted_frame(load_catalog())
+        patched = sorted_frame(patched)
+        for column in expected.columns:
+            np.testing.assert_allclose(
+                patched[column].to_numpy(), expected[column].to_numpy()
+            ) if expected[column].dtype.kind in 'fi' else self.assertEqual(
+                patched[column].tolist(), expected[column].tolist()
+            )
+
+    def test_signals_log_changes(self):
+        latest = CatalogChangeLog().latest()
+        movie = Movie.objects.get(movie_id=3)
+        movie.count = 61
+        movie.save()
+        Movie.objects.get(movie_id=5).delete()
+        self.assertEqual(CatalogChangeLog().since(latest)[-2:][0][1], 3)
+        self.assertEqual(CatalogChangeLog().since(latest)[-1][1], 5)
+
+    def test_single_edit_only_dirties_its_row(self):
+        movies_df = load_catalog()
+        Movie.objects.filter(movie_id=3).update(genres='Horror|Sci-Fi|Thriller', mean=4.2)
+        patch = patch_catalog(movies_df, CatalogChangeLog().movies({3}), set())
+
+        self.assert_matches_reload(patch.movies_df)
+        row = int(np.flatnonzero(patch.movies_df['movie_id'] == 3)[0])
+        self.assertEqual(patch.changed_rows.tolist(), [row])
+        self.assertEqual(patch.dirty_rows.tolist(), [row])
+
+    def test_add_and_delete_recompute_catalog_features(self):
+        movies_df = load_catalog()
+        Movie.objects.filter(movie_id=4).delete()
+        Movie.objects.create(movie_id=6, title='Arrival (2016)', genres='Sci-Fi', mean=4.0, count=90, year=2016)
+        patch = patch_catalog(movies_df, CatalogChangeLog().movies({4, 6}), {4})
+
+        self.assert_matches_reload(patch.movies_df)
+        self.assertEqual(patch.source_rows[-1], -1)
+        # The year range and the highest count both moved, every row has new tower inputs
+        self.assertEqual(len(patch.dirty_rows), len(patch.movies_df))
+
+    def test_genre_index_patch_matches_rebuild(self):
+        movies_df = load_catalog()
+        index = GenreIndex.from_movies_df(movies_df)
+        Movie.objects.filter(movie_id=1).update(genres='Comedy')
+        patch = patch_catalog(movies_df, CatalogChangeLog().movies({1}), set())
+        patched = index.patched(
+            patch.source_rows, patch.changed_rows,
+            patch.movies_df[GENRE_CHOICES].to_numpy(dtype=np.float32)[patch.changed_rows],
+            patch.movies_df['count'].to_numpy()
+        )
+        rebuilt = GenreIndex.from_movies_df(patch.movies_df)
+        np.testing.assert_array_equal(patched.masks, rebuilt.masks)
+        np.testing.assert_array_equal(patched.genres, rebuilt.genres)
+
+
+class RegistryRefreshTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = NumpyRecommender.from_keras_file(MODEL_PATH)
+
+    def setUp(self):
+        for movie_id, title, genres, mean, count, year in MOVIES:
+            Movie.objects.create(movie_id=movie_id, title=title, genres=genres, mean=mean, count=count, year=year)
+        self.loads = 0
+        self.registry = ModelRegistry(loader=self.load, change_log=CatalogChangeLog())
+
+    def load(self):
+        self.loads += 1
+        return self.model, load_catalog()
+
+    def test_patches_edited_movie(self):
+        with self.settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=0):
+            first = self.registry.get()
+            self.assertIs(self.registry.get(), first)
+
+            movie = Movie.objects.get(movie_id=2)
+            movie.genres = 'Animation|Comedy'
+            movie.mean = 4.0
+            movie.save()
+            handle = self.registry.get()
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(handle.generation, 2)
+        self.assertEqual(handle.catalog_change, CatalogChange.objects.latest('id').id)
+        expected = precompute_movie_towers(self.model, handle.movies_df)
+        np.testing.assert_allclose(handle.towers.movie_features, expected.movie_features, rtol=1e-5)
+        np.testing.assert_allclose(handle.towers.metadata_features, expected.metadata_features, rtol=1e-5)
+        # Toy Story is no longer a Children movie
+        self.assertEqual(handle.recommend(np.array([0, 0, 0, 1] + [0] * 15)).movie_ids.tolist(), [5])
+
+    def test_whole_catalog_change_reloads(self):
+        with self.settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=0):
+            self.registry.get()
+            record_catalog_change()
+            self.registry.get()
+        self.assertEqual(self.loads, 2)
+
+    def test_refresh_is_throttled(self):
+        with self.settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=3600):
+            first = self.registry.get()
+            Movie.objects.filter(movie_id=1).delete()
+            self.assertIs(self.registry.get(), first)
+            self.assertEqual(len(self.registry.refresh().movies_df), 4)
+
+    def test_late_commit_below_latest_id_is_applied(self):
+        # An id handed out to a transaction that hasn't committed yet
+        pending = CatalogChange.objects.create(movie_id=4)
+        CatalogChange.objects.filter(id=pending.id).delete()
+        Movie.objects.get(movie_id=2).save()
+
+        with self.settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=0):
+            first = self.registry.get()
+            self.assertGreater(first.catalog_change, pending.id)
+            self.assertIs(self.registry.get(), first)
+
+            # It commits after the catalog was loaded
+            Movie.objects.filter(movie_id=4).update(mean=2.5)
+            CatalogChange.objects.create(id=pending.id, movie_id=4)
+            handle = self.registry.get()
+            self.assertIsNot(handle, first)
+            self.assertIs(self.registry.get(), handle)
+
+        movies_df = handle.movies_df.set_index('movie_id')
+        self.assertEqual(movies_df.loc[4, 'mean'], 2.5)
+        self.assertEqual(self.loads, 1)
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from recommendations.fragments import fragment_key, fragment_prefix, movie_list_fragments
+from recommendations.models import CatalogChange, Feedback, Movie, Preference, Recommendation, RecommendedMovie
+from recommendations.signals import record_catalog_change
+from user.models import MyUser
+
+
+class MovieListFragmentTest(TestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='testuser', email='test@test.com', password='12345')
+        self.client.login(email='test@test.com', password='12345')
+        self.inception = Movie.objects.create(movie_id=1, title='Inception', genres='Action|Sci-Fi', mean=4.0, count=100)
+        Movie.objects.create(movie_id=2, title='Interstellar', genres='Adventure|Drama', mean=4.0, count=100)
+        self.recommendation = self.create_recommendation([1, 2])
+
+    def create_recommendation(self, movie_ids, status=Recommendation.DONE):
+        recommendation = Recommendation.objects.create(
+            user=self.user, preference=Preference.objects.create(genre1='Action'), status=status
+        )
+        RecommendedMovie.objects.bulk_create(RecommendedMovie.ranked(recommendation, movie_ids, [0.9] * len(movie_ids)))
+        return recommendation
+
+    def assertCached(self, recommendation, cached=True):
+        recommendation = Recommendation.objects.get(id=recommendation.id)
+        # The catalog version, then the ranked movies of a miss
+        with self.assertNumQueries(1 if cached else 2):
+            movie_list_fragments([recommendation])
+
+    def detail(self, recommendation):
+        return self.client.get(reverse('recommendations:recommendation_detail', args=[recommendation.id]))
+
+    def test_cached_after_render(self):
+        self.assertCached(self.recommendation, False)
+        self.assertContains(self.detail(self.recommendation), 'Interstellar')
+        self.assertCached(self.recommendation)
+
+    def test_pending_not_cached(self):
+        pending = self.create_recommendation([], status=Recommendation.PENDING)
+        self.detail(pending)
+        self.assertCached(pending, False)
+
+    def test_movie_update_invalidates(self):
+        other = self.create_recommendation([2])
+        self.detail(self.recommendation)
+        self.detail(other)
+
+        self.inception.title = 'Inception (2010)'
+        self.inception.save()
+        # A new catalog version, every recommendation is rendered again
+        self.assertCached(self.recommendation, False)
+        self.assertCached(other, False)
+        self.assertContains(self.detail(self.recommendation), 'Inception (2010)')
+
+        self.inception.delete()
+        self.assertCached(self.recommendation, False)
+        self.assertNotContains(self.detail(self.recommendation), 'Inception')
+
+    def test_feedback_invalidates(self):
+        self.detail(self.recommendation)
+        Feedback.objects.create(feedback=True, recommendation=self.recommendation)
+        self.assertCached(self.recommendation, False)
+
+    def test_delete_invalidates(self):
+        self.detail(self.recommendation)
+        stale = Recommendation.objects.get(id=self.recommendation.id)
+        self.client.post(reverse('recommendations:delete_recommendation', args=[self.recommendation.id]))
+        self.assertFalse(Recommendation.objects.filter(id=stale.id).exists())
+        with self.assertNumQueries(2):
+            movie_list_fragments([stale])
+
+    def test_catalog_import_invalidates_everything(self):
+        self.detail(self.recommendation)
+        record_catalog_change()
+        self.assertCached(self.recommendation, False)
+
+    def test_list_page_uses_fragments(self):
+        self.client.get(reverse('recommendations:recommendations_list'))
+        self.assertCached(self.recommendation)
+        response = self.client.get(reverse('recommendations:recommendations_list'))
+        self.assertContains(response, 'Interstellar')
+
+    def test_edits_from_other_processes_invalidate(self):
+        self.detail(self.recommendation)
+        # What import_movies --upsert or another worker's admin does, without touching this cache
+        Movie.objects.filter(movie_id=1).update(title='Inception (2010)')
+        CatalogChange.objects.create(movie_id=1)
+        self.assertContains(self.detail(self.recommendation), 'Inception (2010)')
+
+    def test_movie_save_retires_old_key(self):
+        self.detail(self.recommendation)
+        old_key = fragment_key(fragment_prefix(), self.recommendation.id, self.recommendation.date_created)
+        self.assertIn('Inception', cache.get(old_key))
+
+        # The save and its change row, nothing looks up recommendations
+        with self.assertNumQueries(2):
+            self.inception.title = 'Inception (2010)'
+            self.inception.save()
+        new_key = fragment_key(fragment_prefix(), self.recommendation.id, self.recommendation.date_created)
+        self.assertNotEqual(new_key, old_key)
+        self.assertIsNone(cache.get(new_key))
+        self.assertContains(self.detail(self.recommendation), 'Inception (2010)')
+        self.assertIn('Inception (2010)', cache.get(new_key))
@@ -0,0 +1,88 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from recommendations.models import Movie, Preference, Recommendation
+from recommendations.registry import model_registry
+from user.models import MyUser
+
+
+@override_settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=None)
+class GenerateRecommendationsTest(TestCase):
+
+    def setUp(self):
+        for movie_id, genres in enumerate(['Action|Sci-Fi', 'Action|Thriller', 'Comedy|Romance', 'Comedy', 'Drama'], 1):
+            Movie.objects.create(movie_id=movie_id, title=f'Movie {movie_id}', genres=genres, mean=4.0, count=100, year=2000 + movie_id)
+        model_registry.reset()
+
+        self.users = [
+            MyUser.objects.create_user(username=f'user{i}', email=f'user{i}@test.com', password='12345')
+            for i in range(3)
+        ]
+        action = Preference.objects.create(genre1='Action')
+        comedy = Preference.objects.create(genre1='Comedy')
+        western = Preference.objects.create(genre1='Western')
+        # user0 asked for comedy first and action last, user1 action, user2 westerns (no match)
+        for user, preference in [(self.users[0], comedy), (self.users[0], action),
+                                 (self.users[1], action), (self.users[2], western)]:
+            Recommendation.objects.create(user=user, preference=preference)
+        self.action, self.comedy = action, comedy
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('generate_recommendations', *args, stdout=out)
+        return out.getvalue()
+
+    def new_recommendations(self):
+        return Recommendation.objects.filter(id__gt=4).order_by('user_id')
+
+    def test_latest_preference_per_user(self):
+        output = self.run_command('--batch-size', '1')
+        self.assertIn('Wrote 2 recommendations', output)
+
+        created = list(self.new_recommendations())
+        self.assertEqual([(r.user_id, r.preference_id) for r in created],
+                         [(self.users[0].id, self.action.id), (self.users[1].id, self.action.id)])
+        self.assertEqual(set(created[0].movies.values_list('movie_id', flat=True)), {1, 2})
+
+    def test_all_preferences(self):
+        self.run_command('--all-preferences')
+        self.assertEqual(
+            set(self.new_recommendations().values_list('user_id', 'preference_id')),
+            {(self.users[0].id, self.action.id), (self.users[0].id, self.comedy.id), (self.users[1].id, self.action.id)}
+        )
+
+    def test_resume_skips_checkpointed_work(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            checkpoint = os.path.join(tmpdir, 'checkpoint.json')
+            self.run_command('--all-preferences', '--batch-size', '1', '--checkpoint', checkpoint)
+            self.assertEqual(json.load(open(checkpoint))['written'], 3)
+
+            # A run that stopped after its first batch, user0's action preference sorts first
+            Recommendation.objects.filter(id__gt=4).delete()
+            action_signature = '+' + '.' * 18
+            with open(checkpoint, 'w') as f:
+                json.dump({'mode': 'all', 'last': [action_signature, self.users[0].id, self.action.id], 'written': 1}, f)
+
+            output = self.run_command('--all-preferences', '--checkpoint', checkpoint, '--resume')
+            self.assertIn('skipping 1', output)
+            self.assertEqual(
+                set(self.new_recommendations().values_list('user_id', 'preference_id')),
+                {(self.users[0].id, self.comedy.id), (self.users[1].id, self.action.id)}
+            )
+            self.assertEqual(json.load(open(checkpoint))['written'], 3)
+
+    def test_seed_is_reproducible(self):
+        self.run_command('--seed', '3')
+        first = [set(r.movies.values_list('movie_id', flat=True)) for r in self.new_recommendations()]
+        Recommendation.objects.filter(id__gt=4).delete()
+        self.run_command('--seed', '3')
+        second = [set(r.movies.values_list('movie_id', flat=True)) for r in self.new_recommendations()]
+        self.assertEqual(first, second)
+
+    def test_top_k_must_be_positive(self):
+        with self.assertRaisesMessage(CommandError, '--top-k must be at least 1'):
+            self.run_command('--top-k', '0')
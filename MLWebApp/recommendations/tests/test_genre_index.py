@@ -0,0 +1,40 @@
+import contextlib
+import io
+
+import numpy as np
+from django.test import SimpleTestCase
+from recommendations.genre_index import GenreIndex, genre_bitmask, preference_bitmasks
+from recommendations.synthetic import synthetic_movies_df
+from recommendations.utils import filter_candidates
+
+
+class GenreBitmaskTest(SimpleTestCase):
+
+    def test_genre_bitmask(self):
+        self.assertEqual(genre_bitmask(['Action']), 1)
+        self.assertEqual(genre_bitmask(['Adventure', 'Action', '(no genres listed)']), 3)
+
+    def test_preference_bitmasks(self):
+        genre_preferences = np.full(19, -1)
+        genre_preferences[[0, 2]] = 1
+        required, excluded = preference_bitmasks(genre_preferences)
+        self.assertEqual(required, 0b101)
+        self.assertEqual(excluded, (1 << 19) - 1 - 0b101)
+
+
+class GenreIndexTest(SimpleTestCase):
+
+    def test_matches_dataframe_filters(self):
+        movies_df = synthetic_movies_df(3000)
+        index = GenreIndex.from_movies_df(movies_df)
+        rng = np.random.default_rng(1)
+
+        for _ in range(50):
+            genre_preferences = np.zeros(19, dtype=np.float32)
+            genre_preferences[rng.choice(19, size=rng.integers(0, 3), replace=False)] = 1
+            if rng.random() < 0.5:
+                genre_preferences[genre_preferences == 0] = -1
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = filter_candidates(movies_df, genre_preferences).index.to_numpy()
+            np.testing.assert_array_equal(index.candidates(genre_preferences), expected)
@@ -0,0 +1,168 @@
+import importlib.util
+import io
+import os
+import tempfile
+import zipfile
+from unittest import skipUnless
+
+import numpy as np
+import pandas as pd
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from recommendations.genre_index import genre_bitmask
+from recommendations.models import CatalogChange, Movie, Preference, Recommendation, RecommendedMovie
+from recommendations.movielens import RatingStats, read_rating_stats
+from user.models import MyUser
+
+MOVIES_CSV = """movieId,title,genres
+1,Toy Story (1995),Adventure|Animation|Children|Comedy|Fantasy
+2,Jumanji (1995),Adventure|Children|Fantasy
+3,Heat (1995),Action|Crime|Thriller
+5,Untitled,Drama
+"""
+
+
+def random_ratings(rows=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'userId': rng.integers(1, 300, rows),
+        'movieId': rng.choice([1, 2, 3, 7], rows),
+        'rating': rng.integers(1, 11, rows) / 2,
+        'timestamp': rng.integers(0, 2 ** 31, rows),
+    })
+
+
+class RatingStatsTest(SimpleTestCase):
+
+    def test_chunks_match_whole_file(self):
+        ratings_df = random_ratings()
+        stats = read_rating_stats(io.StringIO(ratings_df.to_csv(index=False)), chunk_size=777)
+
+        self.assertEqual(stats.total, len(ratings_df))
+        self.assertEqual(stats.unique_users, ratings_df['userId'].nunique())
+        self.assertEqual(stats.unique_movies, ratings_df['movieId'].nunique())
+        self.assertEqual(stats.histogram, ratings_df['rating'].value_counts().to_dict())
+
+        expected = ratings_df.groupby('movieId')['rating'].agg(['mean', 'count']).reset_index()
+        frame = stats.to_frame()
+        np.testing.assert_array_equal(frame['movieId'], expected['movieId'])
+        np.testing.assert_allclose(frame['mean_rating'], expected['mean'])
+        np.testing.assert_array_equal(frame['rating_count'], expected['count'])
+
+    def test_save_and_load(self):
+        stats = read_rating_stats(io.StringIO(random_ratings().to_csv(index=False)))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stats.npz')
+            stats.save(path)
+            loaded = RatingStats.load(path)
+        self.assertEqual((loaded.total, loaded.unique_users), (stats.total, stats.unique_users))
+        self.assertEqual(loaded.histogram, stats.histogram)
+        np.testing.assert_array_equal(loaded.counts, stats.counts)
+        np.testing.assert_array_equal(loaded.sums, stats.sums)
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_pyarrow_matches_c_engine(self):
+        csv = random_ratings().to_csv(index=False)
+        c = read_rating_stats(io.StringIO(csv), chunk_size=500)
+        arrow = read_rating_stats(io.BytesIO(csv.encode()), chunk_size=500, engine='pyarrow')
+        self.assertEqual(arrow.total, c.total)
+        self.assertEqual(arrow.histogram, c.histogram)
+        np.testing.assert_array_equal(arrow.counts, c.counts)
+        np.testing.assert_allclose(arrow.sums, c.sums)
+
+
+class ImportMoviesCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.movies_csv = os.path.join(self.directory.name, 'movies.csv')
+        self.ratings_csv = os.path.join(self.directory.name, 'ratings.csv')
+        with open(self.movies_csv, 'w') as f:
+            f.write(MOVIES_CSV)
+        self.ratings_df = random_ratings()
+        self.ratings_df.to_csv(self.ratings_csv, index=False)
+
+    def import_movies(self, *args):
+        out = io.StringIO()
+        call_command('import_movies', self.movies_csv, self.ratings_csv, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import(self):
+        output = self.import_movies('--chunk-size', '1000')
+        self.assertIn(f"Total number of ratings: {len(self.ratings_df):,}", output)
+        self.assertIn("Found 1 movies with ratings but no movie data", output)
+
+        expected = self.ratings_df.groupby('movieId')['rating'].agg(['mean', 'count'])
+        heat = Movie.objects.get(movie_id=3)
+        self.assertEqual(heat.count, expected.loc[3, 'count'])
+        self.assertAlmostEqual(heat.mean, expected.loc[3, 'mean'])
+        self.assertEqual(heat.year, 1995)
+        self.assertEqual(heat.genre_mask, genre_bitmask(['Action', 'Crime', 'Thriller']))
+        # No ratings, median year
+        untitled = Movie.objects.get(movie_id=5)
+        self.assertEqual((untitled.count, untitled.mean, untitled.year), (0, 0, 1995))
+
+    def test_profile(self):
+        output = self.import_movies('--profile')
+        for phase in ['Read movies', 'Aggregate ratings', 'Build movies', 'Write movies']:
+            self.assertIn(f"[profile] {phase}: ", output)
+        self.assertNotIn("[profile]", self.import_movies('--upsert'))
+
+    def test_upsert(self):
+        self.import_movies()
+        user = MyUser.objects.create_user(username='testuser', email='test@test.com', password='12345')
+        recommendation = Recommendation.objects.create(user=user, preference=Preference.objects.create(genre1='Action'))
+        RecommendedMovie.objects.bulk_create(RecommendedMovie.ranked(recommendation, [1, 3], [0.9, 0.8]))
+
+        output = self.import_movies('--upsert')
+        self.assertIn("Upsert: 0 inserted, 0 updated, 4 unchanged", output)
+
+        # Re-rate Heat and add a movie
+        self.ratings_df = pd.concat([self.ratings_df, pd.DataFrame({
+            'userId': [1, 2], 'movieId': [3, 3], 'rating': [5.0, 5.0], 'timestamp': [0, 0]
+        })])
+        self.ratings_df.to_csv(self.ratings_csv, index=False)
+        with open(self.movies_csv, 'a') as f:
+            f.write("6,Casino (1995),Crime|Drama\n")
+        latest = CatalogChange.objects.latest('id').id
+
+        output = self.import_movies('--upsert', '--batch-size', '1')
+        self.assertIn("Upsert: 1 inserted, 1 updated, 3 unchanged", output)
+        self.assertEqual(Movie.objects.get(movie_id=3).count, (self.ratings_df['movieId'] == 3).sum())
+        self.assertEqual(Movie.objects.get(movie_id=6).title, 'Casino (1995)')
+        self.assertEqual(sorted(CatalogChange.objects.filter(id__gt=latest).values_list('movie_id', flat=True)), [3, 6])
+        # Nothing was deleted on the way
+        self.assertEqual(recommendation.ranked_movies.count(), 2)
+
+    def test_archive(self):
+        archive = os.path.join(self.directory.name, 'ml-latest.zip')
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as f:
+            f.write(self.movies_csv, 'ml-latest/movies.csv')
+            f.write(self.ratings_csv, 'ml-latest/ratings.csv')
+        cache_dir = os.path.join(self.directory.name, 'cache')
+        self.import_movies()
+        expected = list(Movie.objects.order_by('movie_id').values_list('movie_id', 'count', 'mean', 'year'))
+
+        def import_archive():
+            Movie.objects.all().delete()
+            out = io.StringIO()
+            call_command('import_movies', archive, '--cache-dir', cache_dir, stdout=out)
+            self.assertEqual(
+                list(Movie.objects.order_by('movie_id').values_list('movie_id', 'count', 'mean', 'year')), expected
+            )
+            return out.getvalue()
+
+        self.assertNotIn("Using cached rating stats", import_archive())
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # The second import reads the stats from the cache
+        self.assertIn("Using cached rating stats", import_archive())
+
+    def test_archive_without_ratings(self):
+        archive = os.path.join(self.directory.name, 'movies.zip')
+        with zipfile.ZipFile(archive, 'w') as f:
+            f.write(self.movies_csv, 'movies.csv')
+        with self.assertRaisesMessage(CommandError, 'has no ratings.csv'):
+            call_command('import_movies', archive, '--no-cache', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'ratings_csv_path is required'):
+            call_command('import_movies', self.movies_csv, stdout=io.StringIO())
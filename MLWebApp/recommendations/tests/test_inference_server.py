@@ -0,0 +1,109 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.test import SimpleTestCase
+from recommendations.inference_server import (
+    InferenceClient, InferenceServer, RemoteEngine, decode_request, encode_request, encode_response
+)
+from recommendations.numpy_engine import NumpyRecommender
+from recommendations.registry import ModelRegistry
+from recommendations.synthetic import synthetic_movies_df
+from recommendations.utils import GENRE_CHOICES, MODEL_PATH
+
+
+class ProtocolTest(SimpleTestCase):
+
+    def test_request_round_trip(self):
+        genre_preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        genre_preferences[[0, 3]] = 1
+        genre_preferences[5] = -1
+        decoded, top_k, seed = decode_request(encode_request(genre_preferences, top_k=25, seed=7))
+        np.testing.assert_array_equal(decoded, genre_preferences)
+        self.assertEqual((top_k, seed), (25, 7))
+        self.assertIsNone(decode_request(encode_request(genre_preferences))[2])
+
+    def test_empty_response(self):
+        self.assertEqual(len(encode_response(None)), 9)
+
+
+class InferenceServerTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        model = NumpyRecommender.from_keras_file(MODEL_PATH)
+        cls.registry = ModelRegistry(loader=lambda: (model, synthetic_movies_df(2000, seed=2)))
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, 'inference.sock')
+        cls.server = InferenceServer(cls.path, cls.registry)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+    def preferences(self):
+        genre_preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        genre_preferences[[4, 14]] = 1
+        return genre_preferences
+
+    def test_remote_matches_in_process(self):
+        client = InferenceClient(self.path)
+        remote = client.recommend(self.preferences(), top_k=7, seed=3)
+        local = self.registry.get().recommend(self.preferences(), top_k=7, seed=3)
+        np.testing.assert_array_equal(remote.movie_ids, local.movie_ids)
+        np.testing.assert_allclose(remote.match_scores, local.match_scores)
+        np.testing.assert_array_equal(remote.matched_masks, local.matched_masks)
+        self.assertEqual(remote.matched_genres(0), local.matched_genres(0))
+        client.close()
+
+    def test_no_match_is_none(self):
+        client = InferenceClient(self.path)
+        self.assertIsNone(client.recommend(np.ones(len(GENRE_CHOICES), dtype=np.float32)))
+        client.close()
+
+    def test_connections_are_reused(self):
+        client = InferenceClient(self.path, pool_size=2)
+        for seed in range(5):
+            client.recommend(self.preferences(), seed=seed)
+        self.assertEqual(client.connections_opened, 1)
+        client.close()
+
+    def test_falls_back_when_server_is_down(self):
+        engine = RemoteEngine(InferenceClient(os.path.join(self.tmpdir.name, 'missing.sock')), self.registry)
+        recommendations = engine.get().recommend(self.preferences(), top_k=5, seed=1)
+        self.assertEqual(len(recommendations), 5)
+        self.assertEqual(engine.stats()['fallback_requests'], 1)
+        self.assertEqual(engine.stats()['remote_requests'], 0)
+
+    def test_remote_batch(self):
+        engine = RemoteEngine(InferenceClient(self.path), self.registry)
+        no_match = np.ones(len(GENRE_CHOICES), dtype=np.float32)
+        results = engine.get().recommend_batch([self.preferences(), no_match], top_k=4, seed=2)
+        self.assertEqual(len(results[0]), 4)
+        self.assertIsNone(results[1])
+        self.assertEqual(engine.stats()['remote_requests'], 2)
+        again = engine.get().recommend_batch([self.preferences()], top_k=4, seed=2)
+        np.testing.assert_array_equal(again[0].movie_ids, results[0].movie_ids)
+        engine.client.close()
+
+    def test_reconnects_after_server_restart(self):
+        engine = RemoteEngine(InferenceClient(self.path), self.registry)
+        engine.get().recommend(self.preferences(), top_k=3, seed=1)
+
+        # The pooled connection now points at a server that is gone
+        self.server.shutdown()
+        self.server.server_close()
+        type(self).server = InferenceServer(self.path, self.registry)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.assertEqual(len(engine.get().recommend(self.preferences(), top_k=3, seed=1)), 3)
+        self.assertEqual(engine.stats()['fallback_requests'], 0)
+        self.assertEqual(engine.stats()['remote_requests'], 2)
+        self.assertEqual(engine.client.connections_opened, 2)
+        engine.client.close()
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from recommendations.cache import preference_signature
+from recommendations.jobs import NO_MATCH_ERROR, claim_jobs, queue_recommendation, requeue_stale_jobs, run_jobs
+from recommendations.models import Movie, Preference, Recommendation
+from recommendations.numpy_engine import NumpyRecommender
+from recommendations.registry import ModelRegistry
+from recommendations.utils import MODEL_PATH, load_catalog, prepare_genre_preferences, score_preferences
+from user.models import MyUser
+
+
+class RecommendationJobsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(username='testuser', email='test@test.com', password='12345')
+        for movie_id, genres in enumerate(['Action|Sci-Fi', 'Action|Sci-Fi|Thriller', 'Comedy|Romance', 'Comedy'], 1):
+            Movie.objects.create(movie_id=movie_id, title=f'Movie {movie_id}', genres=genres, mean=4.0, count=100, year=2000 + movie_id)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = NumpyRecommender.from_keras_file(MODEL_PATH)
+
+    def setUp(self):
+        self.registry = ModelRegistry(loader=lambda: (self.model, load_catalog()))
+
+    def pending(self, *genres, include_other_genres=True):
+        preference = Preference.objects.create(
+            **{f'genre{i}': genre for i, genre in enumerate(genres, 1)}, include_other_genres=include_other_genres
+        )
+        return Recommendation.objects.create(user=self.user, preference=preference, status=Recommendation.PENDING)
+
+    def test_claim_marks_jobs_running(self):
+        first, second, third = self.pending('Action'), self.pending('Comedy'), self.pending('Drama')
+        jobs = claim_jobs(2)
+        self.assertEqual([job.id for job in jobs], [first.id, second.id])
+        self.assertTrue(all(job.status == Recommendation.RUNNING for job in jobs))
+        self.assertEqual([job.id for job in claim_jobs(2)], [third.id])
+        self.assertEqual(claim_jobs(2), [])
+
+    def test_run_jobs(self):
+        action, comedy, none = self.pending('Action'), self.pending('Comedy'), self.pending('Western')
+        done = run_jobs(self.registry.get(), claim_jobs(10))
+        self.assertEqual(done, 2)
+
+        action.refresh_from_db()
+        comedy.refresh_from_db()
+        none.refresh_from_db()
+        self.assertEqual(action.status, Recommendation.DONE)
+        self.assertEqual(set(action.movies.values_list('movie_id', flat=True)), {1, 2})
+        self.assertEqual(set(comedy.movies.values_list('movie_id', flat=True)), {3, 4})
+        self.assertEqual(none.status, Recommendation.FAILED)
+        self.assertEqual(none.error, NO_MATCH_ERROR)
+        self.assertEqual(list(action.ranked_movies.values_list('rank', flat=True)), [1, 2])
+
+    def test_warm_matches_single_scoring(self):
+        handle = self.registry.get()
+        preference_list = [
+            prepare_genre_preferences(self.pending('Action').preference),
+            prepare_genre_preferences(self.pending('Comedy', include_other_genres=False).preference),
+            prepare_genre_preferences(self.pending('Western').preference),
+        ]
+        self.assertEqual(handle.warm(preference_list), (3, 0))
+        self.assertEqual(handle.warm(preference_list), (0, 0))
+        for genre_preferences in preference_list:
+            cached = handle.score_cache.get(preference_signature(genre_preferences))
+            expected = score_preferences(self.model, handle.movies_df, genre_preferences, handle.towers, handle.genre_index)
+            np.testing.assert_array_equal(cached.rows, expected.rows)
+            np.testing.assert_allclose(cached.scores, expected.scores, rtol=1e-5, atol=1e-6)
+
+    def test_warm_fills_cache_up_to_capacity(self):
+        handle = self.registry.get()
+        handle.score_cache.max_entries = 2
+        preference_list = [
+            prepare_genre_preferences(self.pending(genre).preference) for genre in ['Action', 'Comedy', 'Western']
+        ]
+        self.assertEqual(handle.warm(preference_list), (2, 1))
+        self.assertIn(preference_signature(preference_list[0]), handle.score_cache)
+        self.assertIn(preference_signature(preference_list[1]), handle.score_cache)
+        # The cached ones aren't evicted to make room
+        self.assertEqual(handle.warm(preference_list), (0, 1))
+
+    def test_requeue_stale_jobs(self):
+        job = self.pending('Action')
+        Recommendation.objects.filter(id=job.id).update(
+            status=Recommendation.RUNNING, started_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(requeue_stale_jobs(600), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Recommendation.PENDING)
+
+    def test_requeued_job_is_left_alone(self):
+        job = self.pending('Action')
+        claimed = claim_jobs(1)
+        # Requeued as stale and claimed by another worker while this one was scoring
+        Recommendation.objects.filter(id=job.id).update(status=Recommendation.PENDING, started_at=None)
+        claim_jobs(1)
+
+        self.assertEqual(run_jobs(self.registry.get(), claimed), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Recommendation.RUNNING)
+        self.assertFalse(job.movies.exists())
+
+        with mock.patch.object(self.registry.get(), 'recommend', side_effect=RuntimeError('boom')):
+            run_jobs(self.registry.get(), claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Recommendation.RUNNING, ''))
+
+    def test_queue_is_atomic(self):
+        preference = Preference(genre1='Action')
+        with mock.patch.object(Recommendation.objects, 'create', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                queue_recommendation(self.user, preference)
+        self.assertFalse(Preference.objects.exists())
+
+    def test_status_endpoint(self):
+        job = self.pending('Action')
+        response = self.client.get(reverse('recommendations:recommendation_status', args=[job.id]))
+        self.assertEqual(response.json(), {'id': job.id, 'status': 'pending', 'finished': False, 'error': ''})
+
+    @override_settings(RECOMMENDER_BACKGROUND_JOBS=True)
+    def test_engine_enqueues_in_job_mode(self):
+        self.client.login(email='test@test.com', password='12345')
+        response = self.client.post(reverse('recommendations:engine'), data={'genre1': 'Action', 'include_other_genres': True})
+        recommendation = Recommendation.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('recommendations:recommendation_detail', args=[recommendation.id]))
+        self.assertEqual(recommendation.status, Recommendation.PENDING)
+
+        response = self.client.get(response['Location'])
+        self.assertContains(response, 'Generating your recommendations')
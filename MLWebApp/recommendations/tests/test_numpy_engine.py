@@ -0,0 +1,81 @@
+import numpy as np
+import tensorflow as tf
+from django.test import SimpleTestCase
+from recommendations.inference import EnhancedRecommender
+from recommendations.numpy_engine import NumpyRecommender
+from recommendations.registry import ModelRegistry
+from recommendations.synthetic import synthetic_movies_df
+from recommendations.utils import (
+    GENRE_CHOICES, MODEL_PATH, load_recommender, precompute_movie_towers, recommend, score_candidates,
+    score_candidates_batch
+)
+
+
+class NumpyRecommenderTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.keras_model = tf.keras.models.load_model(
+            MODEL_PATH, custom_objects={'EnhancedRecommender': EnhancedRecommender}, compile=False
+        )
+        cls.numpy_model = NumpyRecommender.from_keras_file(MODEL_PATH)
+        cls.movies_df = synthetic_movies_df(3000, seed=4)
+        cls.rows = np.flatnonzero(cls.movies_df['count'] >= 5)
+
+    def preferences(self, include_other_genres):
+        genre_preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        genre_preferences[[4, 14]] = 1
+        if not include_other_genres:
+            genre_preferences[genre_preferences == 0] = -1
+        return genre_preferences
+
+    def test_full_forward_pass_matches_keras(self):
+        for include_other_genres in (True, False):
+            genre_preferences = self.preferences(include_other_genres)
+            expected = score_candidates(self.keras_model, self.movies_df, self.rows, genre_preferences)
+            actual = score_candidates(self.numpy_model, self.movies_df, self.rows, genre_preferences)
+            np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+    def test_towers_match_keras(self):
+        keras_towers = precompute_movie_towers(self.keras_model, self.movies_df)
+        numpy_towers = precompute_movie_towers(self.numpy_model, self.movies_df)
+        np.testing.assert_allclose(numpy_towers.movie_features, keras_towers.movie_features, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(numpy_towers.metadata_features, keras_towers.metadata_features, rtol=1e-4, atol=1e-4)
+
+        genre_preferences = self.preferences(True)
+        expected = score_candidates(self.keras_model, self.movies_df, self.rows, genre_preferences)
+        actual = score_candidates(self.numpy_model, self.movies_df, self.rows, genre_preferences, towers=numpy_towers)
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+    def test_backend_setting(self):
+        self.assertIsInstance(load_recommender('numpy'), NumpyRecommender)
+        with self.assertRaises(ValueError):
+            load_recommender('torch')
+
+    def test_batched_scoring_matches_single_requests(self):
+        towers = precompute_movie_towers(self.numpy_model, self.movies_df)
+        requests = [
+            (self.preferences(True), self.rows[:700]),
+            (self.preferences(False), self.rows[300:]),
+            (self.preferences(True), self.rows[:5]),
+        ]
+        for model in (self.numpy_model, self.keras_model):
+            for model_towers in (None, towers):
+                batched = score_candidates_batch(model, self.movies_df, requests, model_towers)
+                for (genre_preferences, rows), scores in zip(requests, batched):
+                    expected = score_candidates(self.numpy_model, self.movies_df, rows, genre_preferences)
+                    np.testing.assert_allclose(scores, expected, rtol=1e-4, atol=1e-4)
+
+    def test_registry_batcher_matches_direct_scoring(self):
+        registry = ModelRegistry(loader=lambda: (self.numpy_model, self.movies_df))
+        with self.settings(RECOMMENDER_MICRO_BATCHING=True, RECOMMENDER_SCORE_CACHE_SIZE=0):
+            handle = registry.get()
+        self.assertIsNotNone(handle.batcher)
+
+        genre_preferences = self.preferences(True)
+        batched = handle.recommend(genre_preferences, top_k=5, seed=1)
+        direct = recommend(self.numpy_model, self.movies_df, genre_preferences, top_k=5, seed=1)
+        np.testing.assert_array_equal(batched.movie_ids, direct.movie_ids)
+        self.assertEqual(handle.stats()['batcher']['requests'], 1)
+        registry.reset()
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from recommendations.models import Movie, Preference, Recommendation, RecommendedMovie
+from recommendations.pagination import InvalidCursor, decode_cursor, estimated_count, keyset_page
+from recommendations.views import recommendation_list_queryset
+from user.models import MyUser
+
+
+class KeysetPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create_user(username='testuser', email='test@test.com', password='12345')
+        Movie.objects.create(movie_id=1, title='Inception', genres='Action|Sci-Fi', mean=4.0, count=100)
+        preference = Preference.objects.create(genre1='Action')
+        Recommendation.objects.bulk_create([
+            Recommendation(user=cls.user, preference=preference) for _ in range(25)
+        ])
+        # Pairs of rows created at the same time, the id has to break the tie
+        start = timezone.now()
+        for i, recommendation in enumerate(Recommendation.objects.order_by('id')):
+            Recommendation.objects.filter(id=recommendation.id).update(date_created=start + timedelta(seconds=i // 2))
+        RecommendedMovie.objects.bulk_create([
+            RecommendedMovie(recommendation=recommendation, movie_id=1, rank=1, match_score=0.5)
+            for recommendation in Recommendation.objects.all()
+        ])
+        cls.newest_first = list(
+            Recommendation.objects.order_by('-date_created', '-id').values_list('id', flat=True)
+        )
+
+    def test_walk_older_and_back(self):
+        queryset = Recommendation.objects.all()
+        pages = [keyset_page(queryset, page_size=10)]
+        while pages[-1].has_next():
+            pages.append(keyset_page(queryset, pages[-1].next_cursor, page_size=10))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([row.id for page in pages for row in page], self.newest_first)
+        self.assertFalse(pages[0].has_previous())
+
+        back = keyset_page(queryset, pages[-1].previous_cursor, page_size=10)
+        self.assertEqual([row.id for row in back], [row.id for row in pages[1]])
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+        first = keyset_page(queryset, back.previous_cursor, page_size=10)
+        self.assertEqual([row.id for row in first], [row.id for row in pages[0]])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor(self):
+        for token in ['', 'nonsense', 'WyJ4IiwgIjIwMjQiLCAxXQ']:
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+        response = self.client.get(reverse('recommendations:recommendations_list'), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('recommendations:recommendations_list_api'), {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_estimated_count(self):
+        self.assertEqual(estimated_count(Recommendation), 25)
+
+    def test_list_page_query_uses_no_offset(self):
+        page = keyset_page(recommendation_list_queryset(), page_size=10)
+        with self.assertNumQueries(1) as context:
+            keyset_page(recommendation_list_queryset(), page.next_cursor, page_size=10)
+        self.assertNotIn('OFFSET', context.captured_queries[0]['sql'])
+        self.assertNotIn('COUNT', context.captured_queries[0]['sql'])
+
+    def test_json_list(self):
+        url = reverse('recommendations:recommendations_list_api')
+        data = self.client.get(url, {'count': '1'}).json()
+        self.assertEqual(data['count'], 25)
+        self.assertIsNone(data['previous'])
+        self.assertEqual([result['id'] for result in data['results']], self.newest_first[:10])
+        self.assertEqual(data['results'][0]['movies'], [
+            {'movie_id': 1, 'title': 'Inception', 'rank': 1, 'match_score': 0.5}
+        ])
+
+        data = self.client.get(url, {'cursor': data['next']}).json()
+        self.assertNotIn('count', data)
+        self.assertEqual([result['id'] for result in data['results']], self.newest_first[10:20])
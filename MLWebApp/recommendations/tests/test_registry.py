@@ -0,0 +1,58 @@
+import threading
+
+from django.test import SimpleTestCase
+from recommendations.registry import ModelRegistry
+from recommendations.synthetic import synthetic_movies_df
+
+
+class FakeLoader:
+    def __init__(self, result=None):
+        self.result = result or ('model', synthetic_movies_df(10))
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+class ModelRegistryTest(SimpleTestCase):
+
+    def test_loads_once(self):
+        loader = FakeLoader()
+        registry = ModelRegistry(loader=loader)
+        first = registry.get()
+        second = registry.get()
+        self.assertIs(first, second)
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(first.model, 'model')
+        self.assertEqual(first.generation, 1)
+        self.assertIsNotNone(first.loaded_at)
+        self.assertTrue(first.version)
+
+    def test_concurrent_get_loads_once(self):
+        loader = FakeLoader()
+        registry = ModelRegistry(loader=loader)
+        handles = []
+        threads = [threading.Thread(target=lambda: handles.append(registry.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(len({id(handle) for handle in handles}), 1)
+
+    def test_reset_reloads(self):
+        loader = FakeLoader()
+        registry = ModelRegistry(loader=loader)
+        registry.get()
+        registry.reset()
+        self.assertFalse(registry.is_loaded())
+        self.assertEqual(registry.get().generation, 2)
+        self.assertEqual(loader.calls, 2)
+
+    def test_failed_load_is_not_cached(self):
+        loader = FakeLoader(result=(None, None))
+        registry = ModelRegistry(loader=loader)
+        with self.assertRaises(Exception):
+            registry.get()
+        self.assertFalse(registry.is_loaded())
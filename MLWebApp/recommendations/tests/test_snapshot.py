@@ -0,0 +1,97 @@
+import io
+import os
+import tempfile
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+from recommendations.models import Movie
+from recommendations.snapshot import catalog_fingerprint, load_catalog_snapshot, read_manifest, read_snapshot
+from recommendations.utils import load_catalog
+
+
+class CatalogSnapshotTest(TestCase):
+
+    def setUp(self):
+        Movie.objects.create(movie_id=1, title='Heat', genres='Action|Crime|Thriller', mean=4.1, count=50, year=1995)
+        Movie.objects.create(movie_id=2, title='Toy Story', genres='Animation|Children|Comedy', mean=3.9, count=80, year=1995)
+        Movie.objects.create(movie_id=3, title='Alien', genres='Horror|Sci-Fi', mean=4.0, count=60, year=1979)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.builds = 0
+
+    def build_catalog(self):
+        self.builds += 1
+        return load_catalog()
+
+    def test_snapshot_matches_orm_frame(self):
+        snapshot = load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        expected = load_catalog()
+        self.assertEqual(list(snapshot.columns), list(expected.columns))
+        for column in expected.columns:
+            np.testing.assert_array_equal(np.asarray(snapshot[column]), np.asarray(expected[column]))
+
+        # Backed by the file instead of a copy in this process
+        values = read_snapshot(self.tmpdir.name)['popularity'].to_numpy()
+        while not isinstance(values, np.memmap) and values.base is not None:
+            values = values.base
+        self.assertIsInstance(values, np.memmap)
+
+    def test_rebuilds_only_when_stale(self):
+        load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        self.assertEqual(self.builds, 1)
+
+        old = catalog_fingerprint()
+        movie = Movie.objects.get(movie_id=3)
+        movie.count = 61
+        movie.save()
+        self.assertNotEqual(catalog_fingerprint(), old)
+        snapshot = load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(snapshot['count'].tolist(), [50, 80, 61])
+        self.assertEqual(read_manifest(self.tmpdir.name)['fingerprint'], catalog_fingerprint())
+
+    def test_verify_catches_unlogged_edits(self):
+        out = io.StringIO()
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, stdout=out)
+        first = read_manifest(self.tmpdir.name)
+        # Same length genres, then swapped means, none of it logged
+        Movie.objects.filter(movie_id=3).update(genres='Horror|Sci-Fo')
+        Movie.objects.filter(movie_id=1).update(mean=3.9)
+        Movie.objects.filter(movie_id=2).update(mean=4.1)
+        self.assertEqual(catalog_fingerprint(), first['fingerprint'])
+
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, stdout=out)
+        self.assertEqual(read_manifest(self.tmpdir.name)['directory'], first['directory'])
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, verify=True, stdout=out)
+        self.assertNotEqual(read_manifest(self.tmpdir.name)['directory'], first['directory'])
+        self.assertEqual(read_snapshot(self.tmpdir.name)['genres'].tolist()[2], 'Horror|Sci-Fo')
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, verify=True, stdout=out)
+        self.assertIn('is up to date', out.getvalue().splitlines()[-1])
+
+    def test_command(self):
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, stdout=open('/dev/null', 'w'))
+        self.assertEqual(read_manifest(self.tmpdir.name)['rows'], 3)
+
+    def test_recovers_from_missing_files(self):
+        load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        manifest = read_manifest(self.tmpdir.name)
+        os.remove(os.path.join(self.tmpdir.name, manifest['directory'], manifest['columns']['popularity']))
+
+        snapshot = load_catalog_snapshot(self.tmpdir.name, self.build_catalog)
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(len(snapshot), 3)
+        # The broken copy was replaced, not kept
+        self.assertNotEqual(read_manifest(self.tmpdir.name)['directory'], manifest['directory'])
+        self.assertEqual(len(read_snapshot(self.tmpdir.name)), 3)
+
+    def test_command_force_replaces_snapshot(self):
+        out = open(os.devnull, 'w')
+        self.addCleanup(out.close)
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, stdout=out)
+        first = read_manifest(self.tmpdir.name)['directory']
+        call_command('build_catalog_snapshot', dir=self.tmpdir.name, force=True, stdout=out)
+        second = read_manifest(self.tmpdir.name)['directory']
+        self.assertNotEqual(second, first)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), sorted([second, 'manifest.json']))
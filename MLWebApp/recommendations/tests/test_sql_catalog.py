@@ -0,0 +1,74 @@
+import numpy as np
+from django.test import TestCase
+from recommendations.genre_index import GenreIndex, genre_bitmask
+from recommendations.models import Movie
+from recommendations.numpy_engine import NumpyRecommender
+from recommendations.sql_catalog import SqlCatalogEngine, candidate_movies, load_candidates
+from recommendations.utils import GENRE_CHOICES, MODEL_PATH, load_catalog
+
+
+def preferences(selected=(), excluded=()):
+    genre_preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+    for genre in selected:
+        genre_preferences[GENRE_CHOICES.index(genre)] = 1
+    for genre in excluded:
+        genre_preferences[GENRE_CHOICES.index(genre)] = -1
+    return genre_preferences
+
+
+class SqlCatalogTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        genres = ['Action|Sci-Fi', 'Action|Sci-Fi|Thriller', 'Comedy|Romance', 'Comedy', 'Action|Comedy', 'Drama']
+        for movie_id, movie_genres in enumerate(genres, 1):
+            Movie.objects.create(
+                movie_id=movie_id, title=f'Movie {movie_id}', genres=movie_genres,
+                mean=3.0 + movie_id / 10, count=2 if movie_id == 6 else 50 * movie_id, year=1990 + movie_id
+            )
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = NumpyRecommender.from_keras_file(MODEL_PATH)
+
+    def test_genre_mask_kept_in_sync(self):
+        movie = Movie.objects.get(movie_id=3)
+        self.assertEqual(movie.genre_mask, genre_bitmask(['Comedy', 'Romance']))
+        movie.genres = 'Horror'
+        movie.save(update_fields=['genres'])
+        self.assertEqual(Movie.objects.get(movie_id=3).genre_mask, genre_bitmask(['Horror']))
+
+    def test_candidates_match_genre_index(self):
+        movies_df = load_catalog()
+        genre_index = GenreIndex.from_movies_df(movies_df)
+        for genre_preferences in [
+            preferences(),
+            preferences(['Action']),
+            preferences(['Action', 'Sci-Fi']),
+            preferences(['Comedy'], ['Romance']),
+            preferences(['Drama']),
+        ]:
+            expected = set(movies_df['movie_id'].to_numpy()[genre_index.candidates(genre_preferences)])
+            with self.assertNumQueries(1):
+                found = set(candidate_movies(genre_preferences).values_list('movie_id', flat=True))
+            self.assertEqual(found, expected)
+
+    def test_features_match_full_catalog(self):
+        movies_df = load_catalog().set_index('movie_id')
+        candidates, genre_index = load_candidates(preferences(['Action']))
+        self.assertEqual(sorted(candidates['movie_id']), [1, 2, 5])
+        expected = movies_df.loc[candidates['movie_id']]
+        for column in GENRE_CHOICES + ['year_normalized', 'popularity', 'weighted_rating']:
+            np.testing.assert_allclose(candidates[column].to_numpy(), expected[column].to_numpy(), rtol=1e-6)
+        np.testing.assert_array_equal(genre_index.genres, expected[GENRE_CHOICES].to_numpy(dtype=np.float32))
+
+    def test_engine_recommend(self):
+        engine = SqlCatalogEngine(loader=lambda: self.model)
+        self.assertFalse(engine.is_loaded())
+        with self.assertNumQueries(2):
+            ranked = engine.get().recommend(preferences(['Comedy']), top_k=10, seed=1)
+        self.assertEqual(set(ranked.movie_ids), {3, 4, 5})
+        self.assertEqual(ranked.matched_genres(0), ['Comedy'])
+        self.assertIsNone(engine.recommend(preferences(['Western'])))
+        self.assertEqual(engine.stats()['requests'], 2)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Runs in a fresh interpreter: set Django up, import everything a web worker or a
+# management command imports, then report which heavy ML modules got pulled in
+STARTUP_SCRIPT = """
+import importlib, pkgutil, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import MLWebApp.urls
+import recommendations.management.commands as commands
+for module in pkgutil.iter_modules(commands.__path__):
+    importlib.import_module(f"{commands.__name__}.{module.name}")
+print('seconds=%.2f' % (time.perf_counter() - started))
+print('modules=' + ','.join(sorted(name for name in ('tensorflow', 'keras') if name in sys.modules)))
+"""
+
+# Generous on purpose, importing TensorFlow alone takes longer than this
+STARTUP_BUDGET_SECONDS = 5
+
+
+class StartupImportTest(SimpleTestCase):
+
+    def test_django_setup_does_not_import_tensorflow(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='MLWebApp.settings', RECOMMENDER_BACKEND='numpy')
+        env.setdefault('SECRET_KEY', 'startup-test')
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+        self.assertEqual(report['modules'], '', f"django.setup() imported {report['modules']}")
+        self.assertLess(float(report['seconds']), STARTUP_BUDGET_SECONDS)
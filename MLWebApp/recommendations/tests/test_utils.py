@@ -0,0 +1,119 @@
+from unittest import mock
+
+import numpy as np
+import tensorflow as tf
+from django.test import SimpleTestCase
+from recommendations import utils
+from recommendations.cache import CandidatePool, ScoreCache, ScoredCandidates, preference_signature
+from recommendations.inference import EnhancedRecommender
+from recommendations.synthetic import synthetic_movies_df
+from recommendations.utils import GENRE_CHOICES, MODEL_PATH, precompute_movie_towers, score_candidates
+
+
+class TwoTowerScoringTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = tf.keras.models.load_model(
+            MODEL_PATH, custom_objects={'EnhancedRecommender': EnhancedRecommender}, compile=False
+        )
+        cls.movies_df = synthetic_movies_df(2500)
+
+    def test_precomputed_scores_match_full_network(self):
+        towers = precompute_movie_towers(self.model, self.movies_df)
+        self.assertEqual(towers.movie_features.shape, (2500, 64))
+        self.assertEqual(towers.metadata_features.shape, (2500, 16))
+
+        preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        preferences[[0, 15]] = 1
+        # A filtered, non contiguous candidate set like get_recommendations produces
+        rows = np.flatnonzero(self.movies_df['count'] >= 100)
+
+        expected = score_candidates(self.model, self.movies_df, rows, preferences)
+        actual = score_candidates(self.model, self.movies_df, rows, preferences, towers=towers)
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+    def test_cached_scores_skip_the_model(self):
+        cache = ScoreCache()
+        preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        preferences[0] = 1
+
+        with mock.patch.object(utils, 'score_candidates', wraps=utils.score_candidates) as scorer:
+            first = utils.get_recommendations(self.model, self.movies_df, preferences, cache=cache)
+            second = utils.get_recommendations(self.model, self.movies_df, preferences, cache=cache)
+
+        self.assertEqual(scorer.call_count, 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 10)
+
+    def test_matched_genres(self):
+        preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        preferences[[0, 15]] = 1
+        ranked = utils.recommend(self.model, self.movies_df, preferences, top_k=5, seed=3)
+        for i, row in enumerate(ranked.rows):
+            self.assertEqual(ranked.matched_genres(i), ['Action', 'Sci-Fi'])
+            self.assertEqual(ranked.movie_ids[i], self.movies_df['movie_id'].iloc[row])
+
+
+    def test_cached_pool_is_only_resampled(self):
+        cache = ScoreCache()
+        preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
+        preferences[4] = 1
+        first = utils.recommend(self.model, self.movies_df, preferences, cache=cache, seed=1)
+
+        pool = cache.get(preference_signature(preferences))
+        self.assertIsInstance(pool, CandidatePool)
+        with mock.patch.object(utils, 'score_candidates') as scorer, \
+                mock.patch.object(utils, 'candidate_pool', wraps=utils.candidate_pool) as build_pool:
+            again = utils.recommend(self.model, self.movies_df, preferences, cache=cache, seed=1)
+            reroll = utils.recommend(self.model, self.movies_df, preferences, cache=cache, seed=2)
+        scorer.assert_not_called()
+        # Called with the cached pool, which it hands back as is
+        self.assertTrue(all(call.args[2] is pool for call in build_pool.call_args_list))
+        np.testing.assert_array_equal(again.movie_ids, first.movie_ids)
+        self.assertFalse(np.array_equal(reroll.movie_ids, first.movie_ids))
+
+
+class RankCandidatesTest(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.scored = ScoredCandidates(np.arange(5000), rng.normal(size=5000))
+        self.weighted_rating = rng.uniform(0, 5, size=5000)
+
+    def test_seed_is_reproducible(self):
+        first = utils.rank_candidates(self.scored, self.weighted_rating, 10, np.random.default_rng(42))
+        second = utils.rank_candidates(self.scored, self.weighted_rating, 10, np.random.default_rng(42))
+        np.testing.assert_array_equal(first[0], second[0])
+        np.testing.assert_array_equal(first[1], second[1])
+
+    def test_picks_from_best_candidates(self):
+        picked, scores = utils.rank_candidates(self.scored, self.weighted_rating, 10, np.random.default_rng(1))
+        self.assertEqual(len(set(picked)), 10)
+
+        # Rebuild the noisy scores with the same generator and check the picks are in the top 30
+        rng = np.random.default_rng(1)
+        normalized = (self.scored.scores - self.scored.scores.min()) / np.ptp(self.scored.scores)
+        final = 0.7 * normalized * rng.uniform(0.9, 1.1, 5000) + 0.3 * self.weighted_rating
+        final = final + rng.normal(0, 0.05, 5000)
+        top_30 = set(np.argsort(final)[-30:])
+        self.assertTrue(set(picked) <= top_30)
+        np.testing.assert_allclose(scores, final[picked], rtol=1e-6)
+
+    def test_large_top_k(self):
+        picked, _ = utils.rank_candidates(self.scored, self.weighted_rating, 4000, np.random.default_rng(0))
+        self.assertEqual(len(set(picked)), 4000)
+
+    def test_no_picks_for_zero_top_k(self):
+        picked, scores = utils.rank_candidates(self.scored, self.weighted_rating, 0, np.random.default_rng(0))
+        self.assertEqual((len(picked), len(scores)), (0, 0))
+
+    def test_pool_sampling_matches_rank_candidates(self):
+        normalized = (self.scored.scores - self.scored.scores.min()) / (np.ptp(self.scored.scores) + 1e-10)
+        pool = CandidatePool(self.scored.rows, self.scored.scores, normalized, self.weighted_rating)
+        expected = utils.rank_candidates(self.scored, self.weighted_rating, 10, np.random.default_rng(7))
+        actual = utils.sample_pool(pool, 10, np.random.default_rng(7))
+        np.testing.assert_array_equal(actual[0], expected[0])
+        np.testing.assert_allclose(actual[1], expected[1])
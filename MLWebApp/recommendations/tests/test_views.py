@@ -1,6 +1,7 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
-from recommendations.models import Recommendation, Movie, Preference, Feedback
+from recommendations.models import Recommendation, Movie, Preference, Feedback, RecommendedMovie
+from recommendations.registry import model_registry
 from user.models import MyUser
 
 
@@ -14,6 +15,9 @@ class RecommendationEngineViewTest(TestCase):
         Movie.objects.create(movie_id=1, title='Inception', genres='Action,Sci-Fi', mean=8.8, count=1000)
         Movie.objects.create(movie_id=2, title='Interstellar', genres='Adventure,Drama', mean=8.6, count=900)
 
+        # The registry keeps the catalog for the whole process, reload it for this test's movies
+        model_registry.reset()
+
     def test_get_recommendation_engine(self):
         response = self.client.get(reverse('recommendations:engine'))
         self.assertEqual(response.status_code, 200)
@@ -46,6 +50,26 @@ class RecommendationDetailViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'recommendations/recommendation_detail.html')
 
+    def test_detail_query_count(self):
+        RecommendedMovie.objects.bulk_create(
+            RecommendedMovie.ranked(self.recommendation, [1, 2], [0.9, 0.75])
+        )
+        # Session, user, the recommendation with its user and preference, the catalog version,
+        # its ranked movies until the movie list is cached
+        with self.assertNumQueries(5):
+            self.client.get(reverse('recommendations:recommendation_detail', args=[self.recommendation.id]))
+        with self.assertNumQueries(4):
+            self.client.get(reverse('recommendations:recommendation_detail', args=[self.recommendation.id]))
+
+    def test_movies_in_rank_order(self):
+        RecommendedMovie.objects.bulk_create(
+            RecommendedMovie.ranked(self.recommendation, [2, 1], [0.9, 0.75])
+        )
+        response = self.client.get(reverse('recommendations:recommendation_detail', args=[self.recommendation.id]))
+        content = response.content.decode()
+        self.assertLess(content.index('Interstellar'), content.index('Inception'))
+        self.assertContains(response, '0.75 match')
+
     def test_post_feedback_valid(self):
         feedback_data = {'feedback': True}
         response = self.client.post(reverse('recommendations:recommendation_detail', args=[self.recommendation.id]), data=feedback_data)
@@ -68,6 +92,39 @@ class RecommendationsListViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'recommendations/recommendation_list.html')
 
+    def add_recommendations(self, count):
+        for _ in range(count):
+            recommendation = Recommendation.objects.create(user=self.user, preference=Preference.objects.create(genre1='Action'))
+            RecommendedMovie.objects.bulk_create(RecommendedMovie.ranked(recommendation, [1, 2], [0.9, 0.8]))
+
+    def test_list_query_count(self):
+        # Count the table, the recommendations with users and preferences, the catalog version,
+        # the ranked movies of those without a cached movie list and the session and user of
+        # the logged in client, however many rows the page has
+        self.add_recommendations(2)
+        with self.assertNumQueries(6):
+            self.client.get(reverse('recommendations:recommendations_list'))
+        with self.assertNumQueries(5):
+            self.client.get(reverse('recommendations:recommendations_list'))
+
+        self.add_recommendations(13)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('recommendations:recommendations_list'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+        # Later pages aren't counted
+        cursor = response.context['page_obj'].next_cursor
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('recommendations:recommendations_list'), {'cursor': cursor})
+        self.assertEqual(len(response.context['page_obj']), 5)
+        with self.assertNumQueries(4):
+            self.client.get(reverse('recommendations:recommendations_list'), {'cursor': cursor})
+
+    def test_list_newest_first(self):
+        self.add_recommendations(3)
+        response = self.client.get(reverse('recommendations:recommendations_list'))
+        ids = [recommendation.id for recommendation in response.context['page_obj']]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
 
 class DeleteRecommendationViewTest(TestCase):
 
@@ -84,3 +141,61 @@ class DeleteRecommendationViewTest(TestCase):
     def test_delete_recommendation(self):
         response = self.client.post(reverse('recommendations:delete_recommendation', args=[self.recommendation.id]))
         self.assertRedirects(response, reverse('user:profile', args=[self.user.username]))
+
+
+@override_settings(RECOMMENDER_CATALOG_REFRESH_SECONDS=None)
+class AsyncRecommendationEngineViewTest(TestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='testuser', email="test@test.com", password='12345')
+        for movie_id, genres in enumerate(['Action|Sci-Fi', 'Action|Sci-Fi|Thriller', 'Action|Adventure|Sci-Fi'], 1):
+            Movie.objects.create(movie_id=movie_id, title=f'Movie {movie_id}', genres=genres, mean=4.0, count=100, year=2000 + movie_id)
+
+        # Load here, the scoring threads can't see this test's uncommitted movies
+        model_registry.reset()
+        model_registry.get()
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse('recommendations:engine_async'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/user/login/', response['Location'])
+
+    async def test_get(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('recommendations:engine_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'recommendations/recommendation_engine.html')
+
+    async def test_post_saves_recommendation(self):
+        await self.async_client.aforce_login(self.user)
+        preference_data = {
+            'genre1': 'Action',
+            'genre2': 'Sci-Fi',
+            'include_other_genres': True
+        }
+        response = await self.async_client.post(reverse('recommendations:engine_async'), data=preference_data)
+        self.assertEqual(response.status_code, 302)
+
+        recommendation = await Recommendation.objects.aget(user=self.user)
+        self.assertEqual(await recommendation.movies.acount(), 3)
+
+    async def test_post_saves_ranks_and_scores(self):
+        await self.async_client.aforce_login(self.user)
+        preference_data = {'genre1': 'Action', 'include_other_genres': True}
+        response = await self.async_client.post(reverse('recommendations:engine_async'), data=preference_data)
+        self.assertEqual(response.status_code, 302)
+
+        rows = [row async for row in RecommendedMovie.objects.filter(recommendation__user=self.user)]
+        self.assertEqual([row.rank for row in rows], [1, 2, 3])
+        self.assertTrue(all(row.match_score is not None for row in rows))
+
+    async def test_post_skips_movies_deleted_since_load(self):
+        await self.async_client.aforce_login(self.user)
+        # Still in the loaded catalog
+        await Movie.objects.filter(movie_id=3).adelete()
+        response = await self.async_client.post(
+            reverse('recommendations:engine_async'), data={'genre1': 'Action', 'include_other_genres': True}
+        )
+        self.assertEqual(response.status_code, 302)
+        recommendation = await Recommendation.objects.aget(user=self.user)
+        self.assertEqual([movie.movie_id async for movie in recommendation.movies.order_by('movie_id')], [1, 2])
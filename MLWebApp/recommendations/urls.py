@@ -1,10 +1,15 @@
 from django.urls import path, reverse_lazy
-from .views import RecommendationDetailView, RecommendationEngineView, RecommendationsListView, delete_recommendation
+from .views import AsyncRecommendationEngineView, RecommendationDetailView, RecommendationEngineView, RecommendationsListView, delete_recommendation, engine_stats, recommend_api, recommendation_status, recommendations_list_api
 
 app_name = "recommendations"
 urlpatterns = [
     path("engine", RecommendationEngineView.as_view(), name='engine'),
+    path("engine/async", AsyncRecommendationEngineView.as_view(), name='engine_async'),
+    path("api/recommend", recommend_api, name='recommend_api'),
+    path("api/list", recommendations_list_api, name='recommendations_list_api'),
+    path("engine/stats", engine_stats, name='engine_stats'),
     path('<int:recommendation_id>/', RecommendationDetailView.as_view(), name='recommendation_detail'),
+    path('<int:recommendation_id>/status', recommendation_status, name='recommendation_status'),
     path('', RecommendationsListView.as_view(), name='recommendations_list'),
     path('<int:recommendation_id>/delete/', delete_recommendation, name='delete_recommendation')
 ]
@@ -1,8 +1,10 @@
 import os
 import numpy as np
 import pandas as pd
-import tensorflow as tf
-from recommendations.models import EnhancedRecommender, Movie  # Ensure the class is imported here
+from django.conf import settings
+from recommendations.models import Movie
+from recommendations.cache import CandidatePool, ScoredCandidates, preference_signature
+from recommendations.genre_index import GenreIndex, preference_bitmasks
 
 GENRE_CHOICES = [
     'Action', 'Adventure', 'Animation', 'Children', 'Comedy',
@@ -11,44 +13,117 @@ GENRE_CHOICES = [
     'Thriller', 'War', 'Western'
 ]
 
-def load_model():
-    print("Starting model loading process...")
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'movie_recommender_newest.keras')
 
-    try:
-        movies_data = pd.DataFrame(
-            list(Movie.objects.values('movie_id', 'title', 'genres', 'mean', 'count', 'year'))
-        )
 
-        genres_list = movies_data['genres'].str.get_dummies(sep='|')
+# Movie fields the catalog frame is built from
+CATALOG_FIELDS = ['movie_id', 'title', 'genres', 'mean', 'count', 'year']
 
-        for genre in GENRE_CHOICES:
-            if genre not in genres_list.columns:
-                genres_list[genre] = 0
 
-        movies_data = pd.concat([
-            movies_data,
-            genres_list[GENRE_CHOICES].astype(np.float32)
-        ], axis=1)
+def genre_one_hots(genres):
+    """float32 GENRE_CHOICES columns for a Series of '|' separated genre strings"""
+    genres_list = genres.str.get_dummies(sep='|')
 
-        movies_data['year_normalized'] = (movies_data['year'] - movies_data['year'].min()) / (
-            movies_data['year'].max() - movies_data['year'].min())
+    for genre in GENRE_CHOICES:
+        if genre not in genres_list.columns:
+            genres_list[genre] = 0
 
-        max_ratings = movies_data['count'].max()
-        movies_data['popularity'] = (
-            0.3 * movies_data['count'].div(max_ratings) +
-            0.7 * movies_data['mean'].div(5.0)
-        ).astype(np.float32)
+    return genres_list[GENRE_CHOICES].astype(np.float32)
 
-        base_dir = os.path.dirname(__file__)
-        model = tf.keras.models.load_model(
-            os.path.join(base_dir, 'movie_recommender_newest.keras'), 
-            custom_objects={'EnhancedRecommender': EnhancedRecommender}, 
-            compile=False
-        )
-        print("Model loaded successfully!")
-        print("Model architecture:")
-        model.summary()
 
+def add_catalog_features(movies_data, catalog_stats=None):
+    """
+    Add the features that depend on the whole catalog (year range, highest rating count)
+    to a frame with the Movie fields, in place. Pass catalog_stats, with min_year,
+    max_year and max_count, when movies_data only holds part of the catalog.
+    """
+    if catalog_stats is None:
+        catalog_stats = {
+            'min_year': movies_data['year'].min(),
+            'max_year': movies_data['year'].max(),
+            'max_count': movies_data['count'].max(),
+        }
+    movies_data['year_normalized'] = (movies_data['year'] - catalog_stats['min_year']) / (
+        catalog_stats['max_year'] - catalog_stats['min_year'])
+
+    max_ratings = catalog_stats['max_count']
+    movies_data['popularity'] = (
+        0.3 * movies_data['count'].div(max_ratings) +
+        0.7 * movies_data['mean'].div(5.0)
+    ).astype(np.float32)
+
+    # Rating weighted by how many ratings it's based on. recommend() divides it by
+    # log1p of the highest count among the candidates of a request.
+    movies_data['weighted_rating'] = movies_data['mean'] * np.log1p(movies_data['count'])
+    return movies_data
+
+
+def load_catalog():
+    """Movie table as a DataFrame with the genre one-hots and normalized features the model uses"""
+    movies_data = pd.DataFrame(
+        list(Movie.objects.values(*CATALOG_FIELDS))
+    )
+
+    movies_data = pd.concat([
+        movies_data,
+        genre_one_hots(movies_data['genres'])
+    ], axis=1)
+
+    return add_catalog_features(movies_data)
+
+
+def load_movies():
+    """
+    Catalog frame for the recommender. Read from the memory mapped snapshot when
+    RECOMMENDER_CATALOG_SNAPSHOT_DIR is set (rebuilt first if the Movie table changed),
+    straight from the ORM otherwise.
+    """
+    directory = getattr(settings, 'RECOMMENDER_CATALOG_SNAPSHOT_DIR', None)
+    if not directory:
+        return load_catalog()
+
+    from recommendations.snapshot import load_catalog_snapshot
+    return load_catalog_snapshot(directory, load_catalog)
+
+
+def load_recommender(backend=None):
+    """
+    Load the trained recommender with the configured backend.
+
+    'numpy' reads the weights into NumpyRecommender and never imports TensorFlow,
+    'keras' loads the full EnhancedRecommender.
+    """
+    backend = backend or getattr(settings, 'RECOMMENDER_BACKEND', 'numpy')
+
+    if backend == 'numpy':
+        from recommendations.numpy_engine import NumpyRecommender
+        model = NumpyRecommender.from_keras_file(MODEL_PATH)
+        print("Model weights loaded into the NumPy engine")
+        return model
+
+    if backend != 'keras':
+        raise ValueError(f"Unknown RECOMMENDER_BACKEND {backend!r}, use 'numpy' or 'keras'")
+
+    import tensorflow as tf
+    from recommendations.inference import EnhancedRecommender
+
+    model = tf.keras.models.load_model(
+        MODEL_PATH, 
+        custom_objects={'EnhancedRecommender': EnhancedRecommender}, 
+        compile=False
+    )
+    print("Model loaded successfully!")
+    print("Model architecture:")
+    model.summary()
+    return model
+
+
+def load_model():
+    print("Starting model loading process...")
+
+    try:
+        movies_data = load_movies()
+        model = load_recommender()
         return model, movies_data
 
     except Exception as e:
@@ -57,6 +132,158 @@ def load_model():
 
 
 
+class MovieTowers:
+    """Movie side activations of EnhancedRecommender for every row of the catalog"""
+
+    def __init__(self, movie_features, metadata_features):
+        self.movie_features = movie_features
+        self.metadata_features = metadata_features
+
+    def __len__(self):
+        return len(self.movie_features)
+
+
+def precompute_movie_towers(model, movies_df, batch_size=8192):
+    """Run movie_net and metadata_net once over the catalog, rows line up with movies_df"""
+    if not hasattr(model, 'movie_tower'):
+        return None
+
+    genres = movies_df[GENRE_CHOICES].to_numpy(dtype=np.float32)
+    year = movies_df[['year_normalized']].to_numpy(dtype=np.float32)
+    popularity = movies_df[['popularity']].to_numpy(dtype=np.float32)
+
+    movie_features = []
+    metadata_features = []
+    for i in range(0, len(movies_df), batch_size):
+        batch_movie, batch_metadata = model.movie_tower(
+            genres[i:i+batch_size], year[i:i+batch_size], popularity[i:i+batch_size]
+        )
+        movie_features.append(np.asarray(batch_movie, dtype=np.float32))
+        metadata_features.append(np.asarray(batch_metadata, dtype=np.float32))
+
+    return MovieTowers(np.concatenate(movie_features), np.concatenate(metadata_features))
+
+
+def patch_movie_towers(model, movies_df, towers, source_rows, dirty_rows):
+    """
+    Towers for a patched catalog. source_rows gives the old row of every row of movies_df
+    (-1 for added movies), only dirty_rows, which must include the added ones, are run
+    through the model again.
+    """
+    kept = source_rows >= 0
+    movie_features = np.empty((len(movies_df), towers.movie_features.shape[1]), dtype=np.float32)
+    metadata_features = np.empty((len(movies_df), towers.metadata_features.shape[1]), dtype=np.float32)
+    movie_features[kept] = towers.movie_features[source_rows[kept]]
+    metadata_features[kept] = towers.metadata_features[source_rows[kept]]
+
+    if len(dirty_rows):
+        dirty = precompute_movie_towers(model, movies_df.iloc[dirty_rows])
+        movie_features[dirty_rows] = dirty.movie_features
+        metadata_features[dirty_rows] = dirty.metadata_features
+    return MovieTowers(movie_features, metadata_features)
+
+
+def score_candidates(model, movies_df, rows, genre_preferences, towers=None, genre_index=None, batch_size=1000):
+    """
+    Raw model scores for the catalog rows in rows.
+
+    With towers the movie side of the network is read from the precomputed catalog
+    features and only the preference net, once, and the joint heads are evaluated.
+    Works with both backends, inputs are passed as float32 NumPy arrays.
+    """
+    if genre_index is not None:
+        genres = genre_index.genres
+    else:
+        genres = movies_df[GENRE_CHOICES].to_numpy(dtype=np.float32)
+
+    all_scores = []
+
+    if towers is not None:
+        user_preferences = np.asarray([genre_preferences], dtype=np.float32)
+        pref_features = model.preference_tower(user_preferences)
+
+        for i in range(0, len(rows), batch_size):
+            batch_rows = rows[i:i+batch_size]
+            batch_scores = model.joint_score(
+                user_preferences,
+                pref_features,
+                genres[batch_rows],
+                towers.movie_features[batch_rows],
+                towers.metadata_features[batch_rows]
+            )
+            all_scores.append(np.asarray(batch_scores).flatten())
+
+        return np.concatenate(all_scores) if all_scores else np.empty(0, dtype=np.float32)
+
+    year = movies_df['year_normalized'].to_numpy(dtype=np.float32)
+    popularity = movies_df['popularity'].to_numpy(dtype=np.float32)
+
+    for i in range(0, len(rows), batch_size):
+        batch_rows = rows[i:i+batch_size]
+        
+        # Updated input dictionary to match trained model
+        batch_inputs = {
+            'user_preferences': np.repeat(np.asarray([genre_preferences], dtype=np.float32), len(batch_rows), axis=0),
+            'movie_genres': genres[batch_rows],
+            'year': year[batch_rows, None],
+            'popularity': popularity[batch_rows, None]
+        }
+        
+        batch_scores = model(batch_inputs, training=False)
+        all_scores.append(np.asarray(batch_scores).flatten())
+    
+    return np.concatenate(all_scores) if all_scores else np.empty(0, dtype=np.float32)
+
+
+def score_candidates_batch(model, movies_df, requests, towers=None, genre_index=None, batch_size=8192):
+    """
+    Score several (genre_preferences, rows) requests with shared model calls.
+
+    Candidate rows of all requests are packed together, each row carrying the
+    preference vector of its request, and the scores are split back per request.
+    """
+    if towers is None:
+        # The full network already takes one preference row per candidate
+        rows = np.concatenate([request_rows for _, request_rows in requests])
+        preferences = np.repeat(
+            np.asarray([genre_preferences for genre_preferences, _ in requests], dtype=np.float32),
+            [len(request_rows) for _, request_rows in requests], axis=0
+        )
+        genres = genre_index.genres if genre_index is not None else movies_df[GENRE_CHOICES].to_numpy(dtype=np.float32)
+        year = movies_df['year_normalized'].to_numpy(dtype=np.float32)
+        popularity = movies_df['popularity'].to_numpy(dtype=np.float32)
+        scores = [
+            np.asarray(model({
+                'user_preferences': preferences[i:i+batch_size],
+                'movie_genres': genres[rows[i:i+batch_size]],
+                'year': year[rows[i:i+batch_size], None],
+                'popularity': popularity[rows[i:i+batch_size], None]
+            }, training=False)).flatten()
+            for i in range(0, len(rows), batch_size)
+        ]
+    else:
+        genres = genre_index.genres if genre_index is not None else movies_df[GENRE_CHOICES].to_numpy(dtype=np.float32)
+        user_preferences = np.asarray([genre_preferences for genre_preferences, _ in requests], dtype=np.float32)
+        # preference_net runs once per request, not once per candidate
+        pref_features = np.asarray(model.preference_tower(user_preferences), dtype=np.float32)
+        counts = [len(request_rows) for _, request_rows in requests]
+        rows = np.concatenate([request_rows for _, request_rows in requests])
+        owners = np.repeat(np.arange(len(requests)), counts)
+        scores = [
+            np.asarray(model.joint_score(
+                user_preferences[owners[i:i+batch_size]],
+                pref_features[owners[i:i+batch_size]],
+                genres[rows[i:i+batch_size]],
+                towers.movie_features[rows[i:i+batch_size]],
+                towers.metadata_features[rows[i:i+batch_size]]
+            )).flatten()
+            for i in range(0, len(rows), batch_size)
+        ]
+
+    scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+    return np.split(scores, np.cumsum([len(request_rows) for _, request_rows in requests])[:-1])
+
+
 def prepare_genre_preferences(preference):
     """Convert Preference model data to model input format"""
     genre_preferences = np.zeros(len(GENRE_CHOICES), dtype=np.float32)
@@ -85,10 +312,13 @@ def prepare_genre_preferences(preference):
     
     return genre_preferences
 
-def get_recommendations(model, movies_df, genre_preferences, top_k=10):
-    """Get recommendations matching the trained model implementation with added randomization"""
-    print("Starting recommendation generation...")
-    
+def filter_candidates(movies_df, genre_preferences):
+    """
+    Rows of movies_df that pass the include/exclude genre rules and minimum rating count.
+
+    DataFrame version of GenreIndex.candidates(), kept as the reference implementation
+    for tests and benchmark_genre_filter.
+    """
     # Convert 1's to selected genres list
     selected_genres = [
         genre for i, genre in enumerate(GENRE_CHOICES) 
@@ -118,64 +348,210 @@ def get_recommendations(model, movies_df, genre_preferences, top_k=10):
         print(f"Filtered to {len(filtered_df)} movies that have at least one selected genre")
     
     # Filter for minimum ratings
-    filtered_df = filtered_df[filtered_df['count'] >= 5]
-    
-    if len(filtered_df) == 0:
-        print("No movies match the criteria!")
-        return None
-    
-    batch_size = 1000
-    all_scores = []
-    
-    for i in range(0, len(filtered_df), batch_size):
-        batch_df = filtered_df.iloc[i:i+batch_size]
-        
-        # Updated input dictionary to match trained model
-        batch_inputs = {
-            'user_preferences': tf.constant(np.repeat([genre_preferences], len(batch_df), axis=0), dtype=tf.float32),
-            'movie_genres': tf.constant(batch_df[GENRE_CHOICES].values, dtype=tf.float32),
-            'year': tf.constant(batch_df[['year_normalized']].values, dtype=tf.float32),
-            'popularity': tf.constant(batch_df[['popularity']].values, dtype=tf.float32)
-        }
-        
-        batch_scores = model(batch_inputs, training=False).numpy().flatten()
-        all_scores.extend(batch_scores)
-    
-    scores = np.array(all_scores)
-    
+    return filtered_df[filtered_df['count'] >= 5]
+
+
+def score_preferences(model, movies_df, genre_preferences, towers=None, genre_index=None, batcher=None):
+    """
+    Deterministic stage of a recommendation: filter the catalog and score the candidates.
+
+    With a MicroBatcher the model call is shared with other requests arriving at the same time.
+    """
+    if genre_index is None:
+        genre_index = GenreIndex.from_movies_df(movies_df)
+
+    rows = genre_index.candidates(genre_preferences)
+    print(f"Filtered from {len(movies_df)} to {len(rows)} candidate movies")
+    if len(rows) == 0:
+        return ScoredCandidates(rows, np.empty(0, dtype=np.float32))
+
+    if batcher is not None:
+        scores = batcher.score(genre_preferences, rows)
+    else:
+        scores = score_candidates(model, movies_df, rows, genre_preferences, towers, genre_index)
+    return ScoredCandidates(rows, scores)
+
+
+def score_preferences_batch(model, movies_df, preference_list, towers=None, genre_index=None, max_rows=250_000):
+    """
+    score_preferences() for several preference vectors with shared model calls.
+
+    Requests are packed together until they hold max_rows candidates, which bounds the
+    memory of one call when many broad preferences are scored at once.
+    """
+    if genre_index is None:
+        genre_index = GenreIndex.from_movies_df(movies_df)
+
+    candidates = [genre_index.candidates(genre_preferences) for genre_preferences in preference_list]
+    scores = [np.empty(0, dtype=np.float32) for _ in candidates]
+
+    pending, pending_rows = [], 0
+    for i, rows in enumerate(candidates):
+        if len(rows):
+            pending.append(i)
+            pending_rows += len(rows)
+        if pending and (pending_rows >= max_rows or i == len(candidates) - 1):
+            batch_scores = score_candidates_batch(
+                model, movies_df, [(preference_list[j], candidates[j]) for j in pending], towers, genre_index
+            )
+            for j, request_scores in zip(pending, batch_scores):
+                scores[j] = request_scores
+            pending, pending_rows = [], 0
+
+    return [ScoredCandidates(rows, request_scores) for rows, request_scores in zip(candidates, scores)]
+
+
+class RankedMovies:
+    """Final recommendations as parallel arrays, in the order they were picked"""
+
+    def __init__(self, rows, movie_ids, match_scores, matched_masks):
+        self.rows = rows
+        self.movie_ids = movie_ids
+        self.match_scores = match_scores
+        # Bitmask of the selected genres each movie actually has
+        self.matched_masks = matched_masks
+
+    def __len__(self):
+        return len(self.rows)
+
+    def matched_genres(self, i):
+        return [genre for bit, genre in enumerate(GENRE_CHOICES) if self.matched_masks[i] >> bit & 1]
+
+    def to_frame(self):
+        return pd.DataFrame({'movie_id': self.movie_ids, 'match_score': self.match_scores})
+
+
+def candidate_pool(movies_df, genre_index, scored):
+    """
+    Deterministic part of ranking ScoredCandidates: normalized model scores and weighted
+    ratings. Pools are cached with the scores, only sample_pool() runs per request.
+    """
+    if isinstance(scored, CandidatePool):
+        return scored
+    if len(scored) == 0:
+        return CandidatePool(scored.rows, scored.scores, scored.scores, np.empty(0))
+
     # Normalize initial scores
-    scores = (scores - scores.min()) / (scores.max() - scores.min() + 1e-10)
-    
+    scores = scored.scores
+    normalized_scores = (scores - scores.min()) / (scores.max() - scores.min() + 1e-10)
+
     # Calculate weighted ratings
-    filtered_df['weighted_rating'] = filtered_df['mean'] * \
-        np.log1p(filtered_df['count']) / np.log1p(filtered_df['count'].max())
-    
+    counts = genre_index.counts[scored.rows]
+    weighted_rating = movies_df['weighted_rating'].to_numpy()[scored.rows] / np.log1p(counts.max())
+
+    return CandidatePool(scored.rows, scored.scores, normalized_scores, weighted_rating)
+
+
+def sample_pool(pool, top_k=10, rng=None, top_k_multiplier=3):
+    """
+    Random part of ranking: add noise to a CandidatePool and sample top_k candidates.
+
+    Returns positions into pool.rows and the final scores of the picked movies.
+    Only the top_k * top_k_multiplier best candidates are ordered (argpartition),
+    so large top_k values don't sort the whole candidate set. Pass a seeded
+    numpy Generator as rng to make the result reproducible. Nothing is picked
+    for top_k <= 0.
+    """
+    if top_k <= 0 or len(pool.normalized_scores) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    rng = rng if rng is not None else np.random.default_rng()
+    scores = pool.normalized_scores
+
     # Randomization 1: Add noise to model scores during combination
-    noise_mult = np.random.uniform(0.9, 1.1, size=scores.shape)
-    scores = 0.7 * scores * noise_mult + 0.3 * filtered_df['weighted_rating'].values
+    noise_mult = rng.uniform(0.9, 1.1, size=scores.shape)
+    scores = 0.7 * scores * noise_mult + 0.3 * pool.weighted_rating
     
     # Randomization 2: Add gaussian noise to final scores
-    noise_add = np.random.normal(0, 0.05, size=scores.shape)
+    noise_add = rng.normal(0, 0.05, size=scores.shape)
     scores = scores + noise_add
     
     # Randomization 3: Get more candidates than needed and sample
-    top_k_multiplier = 3
     candidate_count = min(top_k * top_k_multiplier, len(scores))
-    top_indices = np.argsort(scores)[-candidate_count:][::-1]
-    top_indices = np.random.choice(top_indices, size=min(top_k, len(top_indices)), replace=False)
-    
-    recommendations = filtered_df.iloc[top_indices].copy()
-    recommendations['match_score'] = scores[top_indices]
-    recommendations['matched_genres'] = recommendations.apply(
-        lambda x: [g for g in selected_genres if x[g] == 1],
-        axis=1
+    top_indices = np.argpartition(scores, len(scores) - candidate_count)[len(scores) - candidate_count:]
+    top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
+    top_indices = rng.choice(top_indices, size=min(top_k, len(top_indices)), replace=False)
+
+    return top_indices, scores[top_indices]
+
+
+def rank_candidates(scored, weighted_rating, top_k=10, rng=None, top_k_multiplier=3):
+    """
+    Combine model scores with weighted ratings, add noise and sample top_k candidates.
+
+    sample_pool() for callers that have the weighted ratings but no CandidatePool.
+    """
+    scores = scored.scores
+    normalized_scores = (scores - scores.min()) / (scores.max() - scores.min() + 1e-10)
+    pool = CandidatePool(scored.rows, scores, normalized_scores, weighted_rating)
+    return sample_pool(pool, top_k, rng, top_k_multiplier)
+
+
+def rank_scored(movies_df, genre_index, scored, genre_preferences, top_k=10, seed=None):
+    """
+    Random stage of a recommendation: sample top_k movies from non-empty ScoredCandidates.
+
+    seed can be anything numpy.random.default_rng() takes, including a Generator.
+    """
+    pool = candidate_pool(movies_df, genre_index, scored)
+    picked, match_scores = sample_pool(pool, top_k, np.random.default_rng(seed))
+    rows = pool.rows[picked]
+    required, _ = preference_bitmasks(genre_preferences)
+    return RankedMovies(
+        rows=rows,
+        movie_ids=movies_df['movie_id'].to_numpy()[rows],
+        match_scores=match_scores,
+        matched_masks=genre_index.masks[rows] & np.uint32(required)
     )
+
+
+def recommend(model, movies_df, genre_preferences, top_k=10, towers=None, cache=None,
+              genre_index=None, seed=None, batcher=None):
+    """
+    Pick top_k movies for a preference vector, returns RankedMovies or None when nothing matches.
+
+    Pass seed to make the noise and sampling reproducible.
+    """
+    print("Starting recommendation generation...")
+
+    if genre_index is None:
+        genre_index = GenreIndex.from_movies_df(movies_df)
+
+    # Filtering and model scores only depend on the preference vector, reuse them when we can
+    signature = preference_signature(genre_preferences)
+    scored = cache.get(signature) if cache is not None else None
+    if scored is None:
+        scored = score_preferences(model, movies_df, genre_preferences, towers, genre_index, batcher)
+    else:
+        print(f"Using cached scores for preference {signature}")
+
+    # Cache the whole deterministic stage, a repeat request only samples
+    pool = candidate_pool(movies_df, genre_index, scored)
+    if cache is not None and pool is not scored:
+        cache.put(signature, pool)
+
+    if len(pool) == 0:
+        print("No movies match the criteria!")
+        return None
+
+    recommendations = rank_scored(movies_df, genre_index, pool, genre_preferences, top_k, seed)
+    rows, match_scores = recommendations.rows, recommendations.match_scores
     
     print("\nExample top recommendations:")
-    for _, movie in recommendations.head(3).iterrows():
+    for i, row in enumerate(rows[:3]):
+        movie = movies_df.iloc[row]
         print(f"{movie['title']}")
         print(f"Rating: {movie['mean']:.1f} ({movie['count']} ratings)")
         print(f"Genres: {movie['genres']}")
-        print(f"Match score: {movie['match_score']:.3f}\n")
+        print(f"Match score: {match_scores[i]:.3f}\n")
     
-    return recommendations[['movie_id', 'match_score']]
+    return recommendations
+
+
+def get_recommendations(model, movies_df, genre_preferences, top_k=10, towers=None, cache=None,
+                        genre_index=None, seed=None):
+    """Get recommendations matching the trained model implementation with added randomization"""
+    recommendations = recommend(model, movies_df, genre_preferences, top_k, towers, cache, genre_index, seed)
+    if recommendations is None:
+        return None
+    return recommendations.to_frame()
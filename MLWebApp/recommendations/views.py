@@ -1,20 +1,34 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import  LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.middleware.csrf import CsrfViewMiddleware
+from django.contrib.auth import authenticate
+from django.db import transaction
+import base64
+import json
+from django.conf import settings
 from .forms import FeedbackForm, PreferenceForm
-# from keras.models import load_model
-import tensorflow as tf
 import numpy as np
 import os
-from .models import EnhancedRecommender, Feedback, Movie, Recommendation
+from .models import Feedback, Movie, Preference, Recommendation, RecommendedMovie
 import pandas as pd
 from django.views.generic import ListView
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator 
+from django.contrib.admin.views.decorators import staff_member_required
 import time
-from django.db.models import Avg, Count
-from recommendations.utils import load_model, get_recommendations, prepare_genre_preferences 
+from django.db.models import Avg, Count, Prefetch
+from recommendations.utils import prepare_genre_preferences
+from recommendations.registry import model_registry
+from recommendations.inference_server import engine_from_settings
+from recommendations.executor import run_scoring
+from recommendations.jobs import queue_recommendation
+from recommendations.fragments import movie_list_fragments
+from recommendations.pagination import InvalidCursor, estimated_count, keyset_page
 
 
 GENRE_CHOICES = [
@@ -28,18 +42,29 @@ GENRE_CHOICES = [
 # views.py
 
 
+def save_recommendation(user, preference, ranked):
+    """
+    Save the preference, its recommendation and the RankedMovies in rank order in one
+    transaction. Movies deleted since the engine loaded its catalog are left out.
+    """
+    with transaction.atomic():
+        preference.save()
+        recommendation = Recommendation.objects.create(user=user, preference=preference)
+        RecommendedMovie.save_ranked([recommendation], [ranked])
+    return recommendation
+
+
 class RecommendationEngineView(LoginRequiredMixin, View):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.model, self.movies_df = load_model()
-        if self.model is None or self.movies_df is None:
-            raise Exception("Model or movies data could not be loaded.")
+    # as_view() builds a new instance per request, so the model lives in the
+    # process wide registry (or the inference server) instead of on the view
+    registry = engine_from_settings(model_registry)
 
     def prepare_genre_preferences(self, preference):
         return prepare_genre_preferences(preference)
 
     def get_recommendations(self, genre_preferences, top_k=10):
-        return get_recommendations(self.model, self.movies_df, genre_preferences, top_k)
+        """RankedMovies, best match first, or None"""
+        return self.registry.get().recommend(genre_preferences, top_k)
 
     def get(self, request):
         form = PreferenceForm()
@@ -50,25 +75,20 @@ class RecommendationEngineView(LoginRequiredMixin, View):
         if form.is_valid():
             preference = form.save(commit=False)
             genre_preferences = self.prepare_genre_preferences(preference)
+
+            if getattr(settings, 'RECOMMENDER_BACKGROUND_JOBS', False):
+                # run_recommendation_worker fills it in, the detail page polls its status
+                recommendation = queue_recommendation(request.user, preference)
+                return redirect('recommendations:recommendation_detail', recommendation_id=recommendation.id)
             
             try:
-                recommended_movies_df = self.get_recommendations(genre_preferences)
+                ranked = self.get_recommendations(genre_preferences)
                 
-                if recommended_movies_df is None or len(recommended_movies_df) == 0:
+                if ranked is None or len(ranked) == 0:
                     form.add_error(None, "No movies found matching your criteria. Try different preferences.")
                     return render(request, 'recommendations/recommendation_engine.html', {'form': form})
                 
-                preference.save()
-                
-                recommendation = Recommendation.objects.create(
-                    user=request.user,
-                    preference=preference
-                )
-                
-                recommended_movies = Movie.objects.filter(
-                    movie_id__in=recommended_movies_df['movie_id'].tolist()
-                )
-                recommendation.movies.add(*recommended_movies)
+                recommendation = save_recommendation(request.user, preference, ranked)
                 
                 return redirect('recommendations:recommendation_detail', recommendation_id=recommendation.id)
                 
@@ -81,58 +101,342 @@ class RecommendationEngineView(LoginRequiredMixin, View):
         return render(request, 'recommendations/recommendation_engine.html', {'form': form})
 
 
+
+class AsyncRecommendationEngineView(View):
+    """
+    RecommendationEngineView for ASGI workers. Scoring runs on the bounded scoring
+    executor and the database writes run in one transaction through sync_to_async, so
+    the event loop keeps serving other users while a recommendation is computed.
+    """
+    registry = RecommendationEngineView.registry
+    template_name = 'recommendations/recommendation_engine.html'
+
+    async def dispatch(self, request, *args, **kwargs):
+        # LoginRequiredMixin reads request.user synchronously, which the event loop can't do
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+    async def render_form(self, request, form):
+        return await sync_to_async(render)(request, self.template_name, {'form': form})
+
+    def get_recommendations(self, genre_preferences, top_k=10):
+        """RankedMovies, best match first, or None"""
+        return self.registry.get().recommend(genre_preferences, top_k)
+
+    async def get(self, request):
+        return await self.render_form(request, PreferenceForm())
+
+    async def post(self, request):
+        form = PreferenceForm(request.POST)
+        if form.is_valid():
+            preference = form.save(commit=False)
+            genre_preferences = prepare_genre_preferences(preference)
+
+            if getattr(settings, 'RECOMMENDER_BACKGROUND_JOBS', False):
+                recommendation = await sync_to_async(queue_recommendation)(request.user, preference)
+                return redirect('recommendations:recommendation_detail', recommendation_id=recommendation.id)
+
+            try:
+                ranked = await run_scoring(self.get_recommendations, genre_preferences)
+
+                if ranked is None or len(ranked) == 0:
+                    form.add_error(None, "No movies found matching your criteria. Try different preferences.")
+                    return await self.render_form(request, form)
+
+                # The async ORM has no atomic blocks, the whole transaction runs in one thread
+                recommendation = await sync_to_async(save_recommendation)(request.user, preference, ranked)
+
+                return redirect('recommendations:recommendation_detail', recommendation_id=recommendation.id)
+
+            except Exception as e:
+                print(f"Error getting recommendations: {e}")
+                import traceback
+                traceback.print_exc()
+                form.add_error(None, f"Error generating recommendations: {str(e)}")
+
+        return await self.render_form(request, form)
+
     
 # Shows single recommendation
 class RecommendationDetailView(View):
-    def get(self, request, recommendation_id):
-        # Queries database for the specific recommendation based on it's id
-        recommendation = get_object_or_404(Recommendation, id=recommendation_id)
-        form = FeedbackForm()
-        return render(request, 'recommendations/recommendation_detail.html', {
+    template_name = 'recommendations/recommendation_detail.html'
+
+    def get_recommendation(self, recommendation_id):
+        # The template shows the user and preference, load them with the recommendation
+        return get_object_or_404(
+            Recommendation.objects.select_related('user', 'preference'), id=recommendation_id
+        )
+
+    def render_detail(self, request, recommendation, form, submitted):
+        return render(request, self.template_name, {
             'recommendation': recommendation,
+            # Saved in rank order with their match scores, nothing is scored again
+            'movie_list': movie_list_fragments([recommendation])[recommendation.id],
             'form': form,
-            'submitted': False
+            'submitted': submitted
         })
 
+    def get(self, request, recommendation_id):
+        # Queries database for the specific recommendation based on it's id
+        recommendation = self.get_recommendation(recommendation_id)
+        return self.render_detail(request, recommendation, FeedbackForm(), False)
+
     def post(self, request, recommendation_id):
-        recommendation = get_object_or_404(Recommendation, id=recommendation_id)
+        recommendation = self.get_recommendation(recommendation_id)
         form = FeedbackForm(request.POST)
         if form.is_valid():
             feedback_value = form.cleaned_data['feedback']
             feedback = Feedback(feedback=feedback_value, recommendation=recommendation)
             feedback.save()
-            return render(request, 'recommendations/recommendation_detail.html', {
-                'recommendation': recommendation,
-                'form': FeedbackForm(),  # Reset the form
-                'submitted': True
-            })
-        return render(request, 'recommendations/recommendation_detail.html', {
-            'recommendation': recommendation,
-            'form': form,
-            'submitted': False
-        })
+            return self.render_detail(request, recommendation, FeedbackForm(), True)  # Reset the form
+        return self.render_detail(request, recommendation, form, False)
 
 # Shows all recommendations
 class RecommendationsListView(ListView):
-    # Django's ListView automatically queries all entities for the selected model
-    model = Recommendation
     template_name = 'recommendations/recommendation_list.html'
     context_object_name = 'recommendations'
     paginate_by = 10  # Number of recommendations per page
 
+    def get_queryset(self):
+        return recommendation_list_queryset()
+
+    def paginate_queryset(self, queryset, page_size):
+        # Keyset pages from ?cursor= instead of Paginator's COUNT(*) and OFFSET
+        try:
+            page = keyset_page(queryset, self.request.GET.get('cursor'), page_size)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return None, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        paginator = Paginator(self.get_queryset(), self.paginate_by)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        context['page_obj'] = page_obj
+        # Only counted on the first page, approximately on PostgreSQL
+        if 'cursor' not in self.request.GET:
+            context['recommendation_count'] = estimated_count(Recommendation)
+        # Cached movie lists, the ranked movies of the rest are loaded with one query
+        fragments = movie_list_fragments(context['page_obj'].object_list)
+        for recommendation in context['page_obj']:
+            recommendation.movie_list = fragments[recommendation.id]
         return context
 
 
+def recommendation_list_queryset():
+    """
+    Recommendations newest first, id breaks ties so rows never move between pages. Users
+    and preferences are joined in.
+    """
+    return Recommendation.objects.select_related('user', 'preference').order_by('-date_created', '-id')
+
+
+# JSON version of the recommendations list, paged with the same cursors. Pass count=1
+# for the (approximate) total.
+def recommendations_list_api(request):
+    try:
+        page = keyset_page(
+            recommendation_list_queryset().prefetch_related(
+                Prefetch('ranked_movies', queryset=RecommendedMovie.objects.select_related('movie'))
+            ),
+            request.GET.get('cursor'), RecommendationsListView.paginate_by
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    data = {
+        'results': [
+            {
+                'id': recommendation.id,
+                'user': recommendation.user.username,
+                'preference': str(recommendation.preference),
+                'date_created': recommendation.date_created.isoformat(),
+                'status': recommendation.status,
+                'movies': [
+                    {
+                        'movie_id': entry.movie_id,
+                        'title': entry.movie.title,
+                        'rank': entry.rank,
+                        'match_score': entry.match_score,
+                    }
+                    for entry in recommendation.ranked_movies.all()
+                ],
+            }
+            for recommendation in page
+        ],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+    if request.GET.get('count') == '1':
+        data['count'] = estimated_count(Recommendation)
+    return JsonResponse(data)
+
+
+# Polled by the detail page while a background recommendation is generated
+def recommendation_status(request, recommendation_id):
+    recommendation = get_object_or_404(
+        Recommendation.objects.only('id', 'status', 'error'), id=recommendation_id
+    )
+    return JsonResponse({
+        'id': recommendation.id,
+        'status': recommendation.status,
+        'finished': recommendation.is_finished(),
+        'error': recommendation.error,
+    })
+
+
+# Limits of one call to recommend_api
+API_MAX_PREFERENCES = 100
+API_MAX_TOP_K = 100
+
+
+class ApiError(Exception):
+    pass
+
+
+def parse_api_preference(data):
+    """Unsaved Preference from {"genres": [...], "include_other_genres": bool}, validated by PreferenceForm"""
+    if not isinstance(data, dict) or not isinstance(data.get('genres'), list):
+        raise ApiError("Each preference needs a list of genres")
+    genres = data['genres']
+    if len(genres) > 5:
+        raise ApiError("At most 5 genres per preference")
+
+    form = PreferenceForm({
+        **{f'genre{i}': genre for i, genre in enumerate(genres, 1)},
+        'include_other_genres': bool(data.get('include_other_genres', True)),
+    })
+    if not form.is_valid():
+        raise ApiError("; ".join(error for errors in form.errors.values() for error in errors))
+    return form.save(commit=False)
+
+
+def persist_api_results(user, preferences, results):
+    """
+    Save every preference with movies and its recommendation with a handful of bulk inserts.
+    results has the RankedMovies of each preference, None when nothing matched.
+    """
+    saved = [(preference, ranked) for preference, ranked in zip(preferences, results) if ranked is not None]
+    with transaction.atomic():
+        Preference.objects.bulk_create([preference for preference, _ in saved])
+        recommendations = Recommendation.objects.bulk_create([
+            Recommendation(user=user, preference=preference) for preference, _ in saved
+        ])
+        RecommendedMovie.save_ranked(recommendations, [ranked for _, ranked in saved])
+    ids = iter(recommendation.id for recommendation in recommendations)
+    return [None if ranked is None else next(ids) for ranked in results]
+
+
+def api_user(request):
+    """
+    User making an API call. Services send HTTP Basic credentials (email and password),
+    which need no CSRF token. Browser sessions still have to send theirs, as the view
+    itself is exempt. None when neither authenticates.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Basic '):
+        try:
+            email, password = base64.b64decode(header[len('Basic '):]).decode().split(':', 1)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return authenticate(request, username=email, password=password)
+
+    if not request.user.is_authenticated:
+        return None
+    # Returns a 403 response when the token is missing or wrong
+    if CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {}) is not None:
+        return None
+    return request.user
+
+
+@csrf_exempt
+@require_POST
+def recommend_api(request):
+    """
+    JSON recommendations for one or many preferences.
+
+    Body: {"preferences": [{"genres": ["Action", "Sci-Fi"], "include_other_genres": true}, ...],
+           "top_k": 10, "seed": null, "persist": false}
+    A single {"genres": ..., "include_other_genres": ...} object is accepted too. All
+    preferences go to the configured engine together, the in process one scores them with
+    one batched model call. With persist the preferences and recommendations are saved for
+    the caller and their ids returned.
+    Authenticate with HTTP Basic (email and password), or with the session login and the
+    CSRF token in the X-CSRFToken header.
+    """
+    user = api_user(request)
+    if user is None:
+        return JsonResponse({'error': "Authentication required"}, status=401)
+
+    try:
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            raise ApiError("Body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError("Body must be a JSON object")
+
+        items = body['preferences'] if 'preferences' in body else [body]
+        if not isinstance(items, list) or not 0 < len(items) <= API_MAX_PREFERENCES:
+            raise ApiError(f"Send between 1 and {API_MAX_PREFERENCES} preferences")
+        top_k = body.get('top_k', 10)
+        if not isinstance(top_k, int) or not 0 < top_k <= API_MAX_TOP_K:
+            raise ApiError(f"top_k must be between 1 and {API_MAX_TOP_K}")
+        seed = body.get('seed')
+        if seed is not None and (not isinstance(seed, int) or seed < 0):
+            raise ApiError("seed must be a non-negative integer")
+
+        preferences = [parse_api_preference(item) for item in items]
+    except ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    preference_list = [prepare_genre_preferences(preference) for preference in preferences]
+    # The same engine as the views, so the inference server or SQL catalog settings apply here too
+    ranked_results = [
+        ranked if ranked is not None and len(ranked) else None
+        for ranked in RecommendationEngineView.registry.get().recommend_batch(preference_list, top_k, seed)
+    ]
+    # Titles from the database, the engine's catalog may live in another process
+    titles = dict(Movie.objects.filter(
+        movie_id__in={int(movie_id) for ranked in ranked_results if ranked is not None for movie_id in ranked.movie_ids}
+    ).values_list('movie_id', 'title'))
+
+    results = []
+    for ranked in ranked_results:
+        if ranked is None:
+            results.append({'movies': []})
+            continue
+        results.append({'movies': [
+            {
+                'movie_id': int(movie_id),
+                'title': titles[int(movie_id)],
+                'match_score': float(ranked.match_scores[j]),
+                'matched_genres': ranked.matched_genres(j),
+            }
+            # Movies deleted since the catalog was loaded are left out, like when saving
+            for j, movie_id in enumerate(ranked.movie_ids) if int(movie_id) in titles
+        ]})
+
+    if body.get('persist'):
+        for result, recommendation_id in zip(results, persist_api_results(user, preferences, ranked_results)):
+            result['recommendation_id'] = recommendation_id
+
+    return JsonResponse({'results': results})
+
+
 # recommendation deletion view
 @login_required
 def delete_recommendation(request, recommendation_id):
     # Ensures recommendation exists for current user, prevents users from deleting other users recommendations
     recommendation = get_object_or_404(Recommendation, id=recommendation_id, user=request.user) 
     recommendation.delete()
-    return redirect('user:profile', username = request.user.username)  
+    return redirect('user:profile', username = request.user.username)
+
+
+# Model, cache and batching stats of this worker process, for staff
+@staff_member_required
+def engine_stats(request):
+    engine = RecommendationEngineView.registry
+    if not engine.is_loaded():
+        return JsonResponse({'loaded': False})
+    return JsonResponse({'loaded': True, **engine.get().stats()})